@@ -0,0 +1,164 @@
+"""
+このファイルは、よくある質問への回答を使い回すための回答キャッシュが記述されたファイルです。
+独立化した質問文を正規化したものをキーとし、完全一致しない場合も埋め込みの類似度が閾値以上なら同じ質問とみなします。
+キャッシュは言語とインデックスのバージョンごとに分けて保持します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+############################################################
+# 設定関連
+############################################################
+# 正規化時に取り除く文末の記号
+TRAILING_PUNCTUATION = "?？!！。.．、, "
+
+
+############################################################
+# クラス定義
+############################################################
+
+class AnswerCache:
+    """
+    TTLとLRUで件数を制限する回答キャッシュ
+    """
+
+    def __init__(self, max_entries, ttl_seconds, similarity_threshold):
+        """
+        Args:
+            max_entries: 保持する最大件数
+            ttl_seconds: 回答の有効期間（秒）
+            similarity_threshold: 類似質問とみなすコサイン類似度の下限
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question, scope, vector_fn=None):
+        """
+        キャッシュ済みの回答を取得
+
+        Args:
+            question: 独立化した質問文
+            scope: キャッシュの範囲（言語, インデックスのバージョン）
+            vector_fn: 質問文の埋め込みベクトルを返す関数（完全一致しない場合のみ呼び出す）
+
+        Returns:
+            (回答, 質問文の埋め込みベクトル)。キャッシュに無い場合の回答はNone
+        """
+        key = (scope, normalize_question(question))
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["answer"], entry["vector"]
+            has_candidates = any(entry_key[0] == scope for entry_key in self._entries)
+
+        vector = None
+        if vector_fn is not None and has_candidates:
+            vector = _normalize_vector(vector_fn(question))
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for entry_key, entry in self._entries.items():
+                    if entry_key[0] != scope:
+                        continue
+                    score = float(np.dot(entry["vector"], vector))
+                    if score >= best_score:
+                        best_key, best_score = entry_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                    return self._entries[best_key]["answer"], vector
+
+        with self._lock:
+            self.misses += 1
+        return None, vector
+
+    def put(self, question, scope, answer, vector):
+        """
+        回答をキャッシュに保存
+
+        Args:
+            question: 独立化した質問文
+            scope: キャッシュの範囲（言語, インデックスのバージョン）
+            answer: 回答
+            vector: 質問文の埋め込みベクトル
+        """
+        key = (scope, normalize_question(question))
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": _normalize_vector(vector),
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        ヒット率などの統計情報を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            total = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _expire(self):
+        """
+        有効期限切れのエントリを削除（ロック取得済みの状態で呼び出す）
+        """
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_question(question):
+    """
+    キャッシュキー用に質問文を正規化（Unicode正規化・小文字化・空白と文末記号の統一）
+
+    Args:
+        question: 質問文
+
+    Returns:
+        正規化した質問文
+    """
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip(TRAILING_PUNCTUATION)
+
+def _normalize_vector(vector):
+    """
+    コサイン類似度を内積で求められるよう、ベクトルを長さ1に正規化
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
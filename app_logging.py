@@ -0,0 +1,145 @@
+"""
+このファイルは、アプリケーションログの出力基盤が記述されたファイルです。
+ログはリクエストを処理するスレッドではキューに積むだけとし、ファイルへの書き込みとローテーションは専用のスレッドで行います。
+セッションID・言語・処理段階は、ログを出力した時点の実行コンテキスト（contextvars）から取得してJSON Lines形式で記録します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import copy
+import json
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# ログに付与する実行コンテキスト
+session_id_var = contextvars.ContextVar("session_id", default=None)
+language_var = contextvars.ContextVar("language", default=None)
+stage_var = contextvars.ContextVar("stage", default=None)
+
+# プロセス共有のログ出力スレッドと、その生成を排他制御するロック
+_listener = None
+_listener_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ContextQueueHandler(QueueHandler):
+    """
+    実行コンテキストの値をログに付与してキューに積むハンドラ
+
+    メッセージが辞書の場合は、書き込み側でJSONの項目として展開できるよう辞書のまま渡す
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.session_id = session_id_var.get()
+        record.language = language_var.get()
+        record.stage = stage_var.get()
+        if record.exc_info:
+            # 例外オブジェクトは別スレッドに渡さず、ここで文字列化しておく
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if not isinstance(record.msg, dict):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    1件のログを1行のJSONとして出力するフォーマッタ
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "session_id": getattr(record, "session_id", None),
+            "language": getattr(record, "language", None),
+            "stage": getattr(record, "stage", None),
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        if isinstance(record.msg, dict):
+            entry.update(record.msg)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def setup_logging(log_dir=ct.LOG_DIR_PATH, log_file=ct.LOG_FILE):
+    """
+    アプリケーションログの出力を設定（プロセスで1度だけ）
+
+    Args:
+        log_dir: ログの出力先フォルダ
+        log_file: ログファイル名
+    """
+    global _listener
+    if _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is not None:
+            return
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = TimedRotatingFileHandler(
+            os.path.join(log_dir, log_file),
+            when="D",
+            encoding="utf8"
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        logger = logging.getLogger(ct.LOGGER_NAME)
+        logger.setLevel(logging.INFO)
+        logger.addHandler(ContextQueueHandler(log_queue))
+        _listener = listener
+
+def bind_context(session_id=None, language=None):
+    """
+    現在の実行コンテキストにセッションIDと言語を設定（画面の実行ごとに呼び出す）
+
+    Args:
+        session_id: セッションID
+        language: 言語コード
+    """
+    session_id_var.set(session_id)
+    language_var.set(language)
+
+@contextmanager
+def log_stage(stage):
+    """
+    ブロック内で出力するログに処理段階を付与する
+
+    Args:
+        stage: 処理段階の名前（"rewrite" / "retrieve" / "answer" など）
+    """
+    token = stage_var.set(stage)
+    try:
+        yield
+    finally:
+        stage_var.reset(token)
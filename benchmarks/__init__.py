@@ -0,0 +1,4 @@
+"""
+性能計測用のスクリプトをまとめたパッケージです。
+各スクリプトはリポジトリ直下から「python -m benchmarks.<スクリプト名>」で実行します。
+"""
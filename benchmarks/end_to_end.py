@@ -0,0 +1,207 @@
+"""
+data/rag の実ファイルを使い、インデックス作成とチャットの往復をOpenAIに通信せずに計測するスクリプトです。
+
+LLMと埋め込みモデルは benchmarks.fakes のフェイクに差し替え、OpenAIの応答待ちに相当する待ち時間を指定できます。
+・インデックス作成: ファイル読み込み・チャンク分割・埋め込み・BM25の転置インデックス作成の処理量
+・チャットの往復  : 質問の書き換え・検索・回答生成（ストリーミング）・会話履歴の更新の所要時間（p50/p95/p99）
+・メモリ          : 各段階終了時点のピークRSS
+
+結果はJSONで保存するため、コミット間で比較できます。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.end_to_end --turns 50 --first-token-latency 0.3 --token-latency 0.01
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import rag_engine
+import indexing
+from chat_history import ConversationHistory
+from metrics import get_metrics, stage_timer
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 往復で順に送る質問（2問目以降は会話履歴を踏まえた書き換えの対象になるものを含む）
+QUESTIONS = [
+    "作業時間は何時から何時までですか？",
+    "それは土曜日も同じですか？",
+    "工事の期間はいつまでですか？",
+    "騒音や振動が出る作業はありますか？",
+    "その作業はいつ頃ですか？",
+    "通行止めになる道路はありますか？",
+    "断水の予定はありますか？",
+    "工事の請負業者はどこですか？",
+    "他に注意することはありますか？",
+    "配水管の口径と延長を教えてください。",
+]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    """
+    ピークRSSをバイト単位で取得
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def git_commit():
+    """
+    計測対象のコミットを取得（取得できない場合は"unknown"）
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def percentiles(values):
+    """
+    計測値の件数・平均値・p50/p95/p99を取得
+    """
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    pick = lambda quantile: values[min(int(quantile * len(values)), len(values) - 1)]
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": values[-1],
+    }
+
+def benchmark_index(db_name, llm, embeddings):
+    """
+    インデックスを新規作成し、処理量を計測
+
+    Returns:
+        (RagEngineのインスタンス, 計測結果の辞書)
+    """
+    files = indexing.list_source_files(ct.RAG_TOP_FOLDER_PATH)
+    total_bytes = sum(os.path.getsize(path) for path in files)
+
+    start = time.perf_counter()
+    # ベクターストアの作成（読み込み・分割・埋め込み）と、エンジン作成時のBM25の転置インデックス作成
+    indexing.create_vectorstore(db_name, embeddings, ct.RAG_TOP_FOLDER_PATH)
+    # フェイクの埋め込みの関連度は意味を持たないため、関連度による打ち切りは行わない（内容語の一致による打ち切りは埋め込みによらないため行う）
+    engine = rag_engine.RagEngine(
+        db_name, llm=llm, embeddings=embeddings, embedding_cache_path=None, no_match_threshold=None
+    )
+    seconds = time.perf_counter() - start
+
+    chunks = len(engine.lexical_index.ids)
+    return engine, {
+        "files": len(files),
+        "bytes": total_bytes,
+        "chunks": chunks,
+        "seconds": seconds,
+        "files_per_second": len(files) / seconds,
+        "chunks_per_second": chunks / seconds,
+        "megabytes_per_second": total_bytes / seconds / 1024 / 1024,
+        "embedding_calls": embeddings.calls,
+        "embedded_texts": embeddings.texts,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_rss_children_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN),
+    }
+
+def benchmark_turns(engine, turns, language):
+    """
+    画面のチャット送信時と同じ流れ（前処理・ストリーミングでの回答生成・会話履歴の更新）で往復を実行し、所要時間を計測
+
+    Returns:
+        計測結果の辞書
+    """
+    history = ConversationHistory()
+    turn_seconds = []
+    first_token_seconds = []
+    for index in range(turns):
+        chat_message = QUESTIONS[index % len(QUESTIONS)]
+        start = time.perf_counter()
+        with stage_timer("execute_chain"):
+            turn = engine.prepare(chat_message, history.as_messages(), language, "benchmark")
+            answer = ""
+            for chunk in engine.stream(turn):
+                if not answer:
+                    first_token_seconds.append(time.perf_counter() - start)
+                answer += chunk
+        with stage_timer("count_tokens"):
+            history.add_turn(chat_message, answer)
+        with stage_timer("delete_old_conversation_log"):
+            history.trim(ct.MAX_ALLOWED_TOKENS)
+        turn_seconds.append(time.perf_counter() - start)
+
+    return {
+        "turn_seconds": percentiles(turn_seconds),
+        "first_token_seconds": percentiles(first_token_seconds),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50, help="計測する往復数")
+    parser.add_argument("--language", choices=list(ct.LANGUAGES), default="ja")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="LLMの最初のトークンまでの待ち時間（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="LLMの1トークンごとの待ち時間（秒）")
+    parser.add_argument("--embedding-call-latency", type=float, default=0.05, help="埋め込みの1回の呼び出しごとの待ち時間（秒）")
+    parser.add_argument("--embedding-text-latency", type=float, default=0.0005, help="埋め込みの1テキストごとの待ち時間（秒）")
+    parser.add_argument("--answer-cache", action="store_true", help="回答キャッシュを有効にする（既定では毎回回答を生成）")
+    parser.add_argument("--output", help="結果の保存先（既定は benchmarks/results/<コミット>.json）")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    llm = FakeChatModel(first_token_latency=args.first_token_latency, token_latency=args.token_latency)
+    embeddings = FakeEmbeddings(call_latency=args.embedding_call_latency, text_latency=args.embedding_text_latency)
+
+    db_name = os.path.join(tempfile.mkdtemp(prefix="end_to_end_"), "db")
+    engine, index_result = benchmark_index(db_name, llm, embeddings)
+    rag_engine.set_rag_engine(engine)
+    if not args.answer_cache:
+        engine.answer_cache.max_entries = 0
+    turn_result = benchmark_turns(engine, args.turns, args.language)
+
+    results = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "index": index_result,
+        "turns": turn_result,
+        "stages": get_metrics().snapshot()["durations"],
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+    output = args.output or os.path.join("benchmarks", "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"index : {index_result['files']} files, {index_result['chunks']} chunks in {index_result['seconds']:.2f}s "
+          f"({index_result['chunks_per_second']:.1f} chunks/s)")
+    turn_seconds = turn_result["turn_seconds"]
+    print(f"turns : p50 {turn_seconds['p50']:.3f}s, p95 {turn_seconds['p95']:.3f}s, p99 {turn_seconds['p99']:.3f}s")
+    print(f"memory: peak RSS {results['peak_rss_bytes'] / 1024 / 1024:.1f} MiB")
+    print(f"saved : {output}")
+
+
+if __name__ == "__main__":
+    main()
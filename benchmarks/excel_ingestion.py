@@ -0,0 +1,88 @@
+"""
+Excelファイルの読み込み方式による、チャンク数・読み込み時間・インデックスに保存するデータ量の違いを比較するスクリプトです。
+
+・before: 従来どおりUnstructuredExcelLoader（mode="elements"）で読み込み、チャンク分割する
+・after : ExcelTableLoader（openpyxlの読み取り専用モード）でシート・表ごとに読み込み、チャンク分割する
+
+チャンク数は埋め込みの対象数（＝埋め込みの呼び出し量）に、本文・メタデータの文字数はベクターストアの大きさに相当します。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.excel_ingestion --repeat 5
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import json
+import statistics
+import time
+from langchain.text_splitter import CharacterTextSplitter
+from langchain_community.document_loaders import UnstructuredExcelLoader
+from excel_loader import ExcelTableLoader
+import indexing
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+LOADERS = {
+    "before": lambda path: UnstructuredExcelLoader(path, mode="elements"),
+    "after ": ExcelTableLoader,
+}
+
+
+############################################################
+# 関数定義
+############################################################
+
+def measure(create_loader, file_path, repeat):
+    """
+    読み込み時間（中央値）と、チャンク分割後のチャンク数・文字数を計測
+
+    Returns:
+        計測結果の辞書
+    """
+    text_splitter = CharacterTextSplitter(
+        chunk_size=ct.CHUNK_SIZE,
+        chunk_overlap=ct.CHUNK_OVERLAP,
+        separator="\n",
+    )
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        docs = create_loader(file_path).load()
+        seconds.append(time.perf_counter() - start)
+    chunks = text_splitter.split_documents(docs)
+    return {
+        "documents": len(docs),
+        "chunks": len(chunks),
+        "content_chars": sum(len(chunk.page_content) for chunk in chunks),
+        # 空白を除いた文字数（表の空セルによる空白・改行の多さの目安）
+        "non_space_chars": sum(len("".join(chunk.page_content.split())) for chunk in chunks),
+        "metadata_chars": sum(len(json.dumps(chunk.metadata, ensure_ascii=False, default=str)) for chunk in chunks),
+        "load_seconds": statistics.median(seconds),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="読み込みの回数（読み込み時間は中央値）")
+    args = parser.parse_args()
+
+    file_paths = [
+        path for path in indexing.list_source_files(ct.RAG_TOP_FOLDER_PATH)
+        if path.endswith(".xlsx")
+    ]
+    for file_path in file_paths:
+        print(file_path)
+        for label, create_loader in LOADERS.items():
+            result = measure(create_loader, file_path, args.repeat)
+            print(
+                f"  {label}: {result['documents']:>4} docs, {result['chunks']:>4} chunks, "
+                f"content {result['content_chars']:>7} chars ({result['non_space_chars']:>7} non-space), "
+                f"metadata {result['metadata_chars']:>7} chars, load {result['load_seconds'] * 1000:>8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
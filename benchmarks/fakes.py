@@ -0,0 +1,167 @@
+"""
+OpenAIへ通信せずに性能を計測するための、LLMと埋め込みモデルのフェイクです。
+
+いずれも入力から決定的に結果を作り、OpenAIの応答待ちに相当する待ち時間を指定できます。
+・FakeChatModel  : 最初のトークンまでの待ち時間と、1トークンごとの待ち時間を指定（ストリーミング対応）
+・FakeEmbeddings : 1回の呼び出しごとの待ち時間と、1テキストごとの待ち時間を指定
+・FakeSMTP       : 接続・送信ごとの待ち時間を指定し、送信したメールを保持（Outboxのsmtp_factoryに指定）
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+############################################################
+# 設定関連
+############################################################
+# 回答の組み立てに使う語句
+ANSWER_WORDS = [
+    "工事", "の", "作業", "時間", "は", "平日", "8時", "から", "17時", "まで", "です", "。",
+    "詳しく", "は", "現場", "の", "掲示板", "を", "ご確認", "ください", "。",
+]
+
+
+############################################################
+# クラス定義
+############################################################
+
+class FakeChatModel(BaseChatModel):
+    """
+    入力に応じた決定的な回答を、指定した待ち時間で返すチャットモデル
+    """
+
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake-chat"
+
+    def _tokens(self, messages):
+        # 入力のハッシュ値から、回答の語句の並びを決める
+        digest = hashlib.sha256("".join(str(message.content) for message in messages).encode("utf-8")).digest()
+        offset = digest[0] % len(ANSWER_WORDS)
+        return [ANSWER_WORDS[(offset + i) % len(ANSWER_WORDS)] for i in range(self.answer_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    テキストのハッシュ値から決定的なベクトルを、指定した待ち時間で返す埋め込みモデル
+    """
+
+    def __init__(self, size=1536, call_latency=0.0, text_latency=0.0):
+        """
+        Args:
+            size: ベクトルの次元数
+            call_latency: 1回の呼び出しごとの待ち時間（秒）
+            text_latency: 1テキストごとの待ち時間（秒）
+        """
+        self.size = size
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+        self.model = f"benchmark-fake-embedding-{size}"
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._wait(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._wait(1)
+        return self._vector(text)
+
+    def _wait(self, count):
+        self.calls += 1
+        self.texts += count
+        time.sleep(self.call_latency + self.text_latency * count)
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).normal(size=self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeSMTP:
+    """
+    smtplib.SMTPの代わりに、送信したメールをメモリに保持するSMTP接続
+
+    送信済みのメールはクラス全体で共有し、FakeSMTP.sent_messages で参照できる
+    """
+
+    sent_messages = []
+    _lock = threading.Lock()
+
+    def __init__(self, host=None, port=None, connect_latency=0.0, send_latency=0.0):
+        """
+        Args:
+            host: 接続先のホスト（未使用）
+            port: 接続先のポート（未使用）
+            connect_latency: 接続時の待ち時間（秒）
+            send_latency: 1通の送信ごとの待ち時間（秒）
+        """
+        self.send_latency = send_latency
+        time.sleep(connect_latency)
+
+    @classmethod
+    def factory(cls, connect_latency=0.0, send_latency=0.0):
+        """
+        Outboxのsmtp_factoryに指定する、(host, port)から接続を作成する関数を取得
+        """
+        return lambda host, port: cls(host, port, connect_latency, send_latency)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def sendmail(self, sender, recipients, message):
+        time.sleep(self.send_latency)
+        with self._lock:
+            self.sent_messages.append((sender, recipients, message))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,101 @@
+"""
+会話が長くなるにつれて、1往復あたりの会話履歴の更新・削除処理の時間がどう変わるかを計測するスクリプトです。
+
+・before: 従来どおりリストで保持し、回答をエンコードして合計に加算、上限を超えたら pop(1) と再エンコードで削除
+・after : ConversationHistoryで保持し、追加時に数えたトークン数を使ってdequeから削除
+
+削除が毎ターン発生するよう、上限トークン数は十分に大きな会話を保持できる値を指定します。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.history_trim --turns 20000 --max-tokens 2000000
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import time
+from langchain_core.messages import HumanMessage, AIMessage
+from chat_history import ConversationHistory
+from rag_engine import get_encoder
+
+############################################################
+# 設定関連
+############################################################
+QUESTION = "配水管の口径が150mmの区間で、更新工事の予定はありますか？"
+ANSWER = "ご質問の区間については、令和7年度の更新計画に含まれており、工事は秋以降に予定されています。" * 3
+
+
+############################################################
+# 関数定義
+############################################################
+
+def before_turn(state, enc, max_tokens):
+    """
+    従来の実装による1往復分の処理（トークン数の加算・会話履歴への追加・古い履歴の削除）
+    """
+    state["total_tokens"] += len(enc.encode(QUESTION))
+    state["chat_history"].extend([HumanMessage(content=QUESTION), AIMessage(content=ANSWER)])
+    state["messages"].append({"role": "user", "content": QUESTION})
+    state["messages"].append({"role": "assistant", "content": ANSWER})
+    state["total_tokens"] += len(enc.encode(ANSWER))
+    while state["total_tokens"] > max_tokens:
+        removed_message = state["chat_history"].pop(1)
+        state["total_tokens"] -= len(enc.encode(removed_message.content))
+
+def after_turn(history, enc, max_tokens):
+    """
+    ConversationHistoryによる1往復分の処理
+    """
+    input_tokens = len(enc.encode(QUESTION))
+    history.add_turn(QUESTION, ANSWER, input_tokens=input_tokens)
+    history.trim(max_tokens)
+
+def measure(run_turn, history_length, turns, report_every):
+    """
+    指定回数の往復を実行し、区間ごとの1往復あたりの平均時間を計測
+
+    Returns:
+        （その時点の往復数, 会話履歴のメッセージ数, 1往復あたりの平均時間[マイクロ秒]）のリスト
+    """
+    results = []
+    start = time.perf_counter()
+    for turn in range(1, turns + 1):
+        run_turn()
+        if turn % report_every == 0:
+            now = time.perf_counter()
+            results.append((turn, history_length(), (now - start) / report_every * 1e6))
+            start = now
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20000, help="計測する往復数")
+    parser.add_argument("--max-tokens", type=int, default=2000000, help="会話履歴の合計トークン数の上限")
+    parser.add_argument("--report-every", type=int, default=2000, help="結果を出力する間隔（往復数）")
+    args = parser.parse_args()
+
+    enc = get_encoder()
+    before_state = {"chat_history": [], "messages": [], "total_tokens": 0}
+    history = ConversationHistory(encoder=enc)
+
+    before = measure(
+        lambda: before_turn(before_state, enc, args.max_tokens),
+        lambda: len(before_state["chat_history"]),
+        args.turns,
+        args.report_every,
+    )
+    after = measure(
+        lambda: after_turn(history, enc, args.max_tokens),
+        lambda: len(history),
+        args.turns,
+        args.report_every,
+    )
+
+    print(f"{'turns':>8} {'history':>8} {'before[us]':>12} {'after[us]':>12}")
+    for (turn, length, before_us), (_, _, after_us) in zip(before, after):
+        print(f"{turn:>8} {length:>8} {before_us:>12.1f} {after_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+画面の再実行1回分の多言語テキスト取得（全キーの取得と、フォーマット付きテキスト1件）にかかる時間を計測するスクリプトです。
+
+・before: 従来どおり呼び出しのたびに言語ファイルをimport文で取得し、getattrで参照、毎回format
+・after : 起動時に作成した言語ごとの定数表から取得し、差し込み項目は解析済み
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.i18n_lookup --reruns 20000
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import time
+import constants as ct
+
+
+############################################################
+# 関数定義
+############################################################
+
+def legacy_get_language_constants(lang):
+    """
+    従来の実装による言語ファイルの取得
+    """
+    if lang == 'en':
+        import constants_en as lang_constants
+    else:
+        import constants_ja as lang_constants
+    return lang_constants
+
+def legacy_get_text(key, lang):
+    """
+    従来の実装によるテキストの取得
+    """
+    lang_constants = legacy_get_language_constants(lang)
+    return getattr(lang_constants, key, f"[Missing: {key}]")
+
+def legacy_get_formatted_text(key, lang, **kwargs):
+    """
+    従来の実装によるフォーマット付きテキストの取得
+    """
+    text = legacy_get_text(key, lang)
+    if kwargs:
+        if 'max_tokens' in text:
+            kwargs['max_tokens'] = ct.MAX_ALLOWED_TOKENS
+        return text.format(**kwargs)
+    return text
+
+def measure(render, keys, reruns):
+    """
+    画面の再実行1回分のテキスト取得を指定回数繰り返し、1回あたりの平均時間を計測
+
+    Returns:
+        1回あたりの平均時間[マイクロ秒]
+    """
+    start = time.perf_counter()
+    for i in range(reruns):
+        render(keys, "en" if i % 2 else "ja")
+    return (time.perf_counter() - start) / reruns * 1e6
+
+def render_before(keys, lang):
+    for key in keys:
+        legacy_get_text(key, lang)
+    legacy_get_formatted_text('INPUT_TEXT_LIMIT_ERROR_MESSAGE', lang, max_tokens=ct.MAX_ALLOWED_TOKENS)
+
+def render_after(keys, lang):
+    for key in keys:
+        ct.get_text(key, lang)
+    ct.TEXT_TABLES[lang]['INPUT_TEXT_LIMIT_ERROR_MESSAGE'].render(max_tokens=ct.MAX_ALLOWED_TOKENS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=20000, help="計測する再実行の回数")
+    args = parser.parse_args()
+
+    # 画面で使うテキストの全キー（言語によらず共通）
+    keys = sorted(ct.TEXT_TABLES["ja"])
+
+    before = measure(render_before, keys, args.reruns)
+    after = measure(render_after, keys, args.reruns)
+    print(f"keys per rerun: {len(keys)}")
+    print(f"before: {before:.2f} us / rerun")
+    print(f"after : {after:.2f} us / rerun")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+アプリの起動時に読み込むモジュールの読み込み時間を、python -X importtime で計測するスクリプトです。
+
+新しいPythonプロセスで対象のモジュールを読み込み、以下を出力します（複数回実行した中央値）。
+・合計     : 対象のモジュールの読み込みにかかった時間（依存するモジュールを含む）
+・上位     : 読み込み時間（依存するモジュールを含む）の大きいパッケージ
+・対象ごと : main.py が読み込むモジュールごとの読み込み時間
+
+結果はJSONで保存するため、コミット間で比較できます。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.import_time --repeat 5 --top 20
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.end_to_end import git_commit
+
+############################################################
+# 設定関連
+############################################################
+# main.py が読み込むアプリのモジュール
+DEFAULT_MODULES = ["utils", "initialize", "metrics", "components", "constants"]
+# -X importtime の出力行（"import time: 自身[us] | 累計[us] | モジュール名"）
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def profile_once(modules):
+    """
+    新しいPythonプロセスで対象のモジュールを読み込み、-X importtime の出力を解析
+
+    Returns:
+        (プロセス全体の所要時間[秒], {モジュール名: (自身の時間[us], 累計の時間[us], 階層の深さ)})
+    """
+    code = "import " + ", ".join(modules)
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    wall_seconds = time.perf_counter() - start
+
+    imports = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return wall_seconds, imports
+
+def profile(modules, repeat):
+    """
+    対象のモジュールの読み込み時間を複数回計測し、中央値を取得
+
+    Returns:
+        計測結果の辞書
+    """
+    # 初回はバイトコードの作成を含むため、計測から除く
+    profile_once(modules)
+    runs = [profile_once(modules) for _ in range(repeat)]
+
+    names = set().union(*(imports for _, imports in runs))
+    cumulative = {
+        name: statistics.median(imports[name][1] for _, imports in runs if name in imports) / 1e6
+        for name in names
+    }
+    top_level = {
+        name for _, imports in runs for name, (_, _, depth) in imports.items() if depth == 0
+    }
+    return {
+        "wall_seconds": statistics.median(wall for wall, _ in runs),
+        "import_seconds": sum(cumulative[name] for name in top_level),
+        "modules": {module: cumulative.get(module, 0.0) for module in modules},
+        "packages": cumulative,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="読み込むモジュール")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の回数")
+    parser.add_argument("--top", type=int, default=20, help="表示する上位のパッケージ数")
+    parser.add_argument("--output", help="結果の保存先（既定は benchmarks/results/import_<コミット>.json）")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    result = profile(args.modules, args.repeat)
+
+    # アプリのモジュールを除いたパッケージ単位（最上位の名前）で集計し、読み込み時間の大きい順に並べる
+    packages = {}
+    for name, seconds in result["packages"].items():
+        package = name.split(".")[0]
+        if os.path.isfile(f"{package}.py"):
+            continue
+        packages[package] = max(packages.get(package, 0.0), seconds)
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    results = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "wall_seconds": result["wall_seconds"],
+        "import_seconds": result["import_seconds"],
+        "modules": result["modules"],
+        "top_packages": dict(top),
+    }
+
+    output = args.output or os.path.join("benchmarks", "results", f"import_{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"total : import {result['import_seconds']:.3f}s, process {result['wall_seconds']:.3f}s (median of {args.repeat})")
+    for module, seconds in result["modules"].items():
+        print(f"module: {module:<24} {seconds * 1000:>8.1f} ms")
+    for package, seconds in top:
+        print(f"top   : {package:<24} {seconds * 1000:>8.1f} ms")
+    print(f"saved : {output}")
+
+
+if __name__ == "__main__":
+    main()
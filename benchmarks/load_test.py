@@ -0,0 +1,242 @@
+"""
+多数の利用者が同時に画面を開いた状況を再現し、セッション数に応じた性能の変化を計測する負荷試験スクリプトです。
+
+Streamlitの AppTest（streamlit.testing）で main.py をセッションごとに実行し、
+セッション数を増やしながら以下を計測します（OpenAIとSMTPは benchmarks.fakes のフェイクに差し替え）。
+・初回表示     : 1セッション目の画面読み込み（initialize() を含む）の所要時間と、initialize() 単体の所要時間
+・チャット送信 : 質問を送信した際の再実行1回分の所要時間（p50/p95/p99）
+・処理量       : 全セッション合計の1秒あたりの往復数
+・メモリ       : 1セッションあたりの常駐メモリ（RSS）の増加量
+
+セッション数ごとの結果（スケーリングカーブ）はJSONで保存するため、コミット間で比較できます。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.load_test --sessions 1 2 4 8 16 --turns 5 --first-token-latency 0.3
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+import rag_engine
+from outbox import Outbox, set_outbox
+from translation import Translator, set_translator
+from metrics import get_metrics
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeSMTP
+from benchmarks.end_to_end import QUESTIONS, benchmark_index, git_commit, percentiles, peak_rss_bytes
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 負荷試験で使うsecrets（問い合わせモードの送信先など）
+LOAD_TEST_SECRETS = {
+    "GMAIL_USER": "load-test@example.com",
+    "GMAIL_APP_PASSWORD": "load-test",
+    "INQUIRY_TO_EMAIL": "inquiry@example.com",
+}
+
+
+############################################################
+# 関数定義
+############################################################
+
+def current_rss_bytes():
+    """
+    現在の常駐メモリ（RSS）をバイト単位で取得（/procが無い環境ではピークRSS）
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss_bytes()
+
+def setup_fakes(args, work_dir):
+    """
+    RAGエンジン・翻訳器・送信キューを、フェイクを使ったものに差し替え
+
+    Returns:
+        送信キュー（Outboxのインスタンス）
+    """
+    llm = FakeChatModel(first_token_latency=args.first_token_latency, token_latency=args.token_latency)
+    embeddings = FakeEmbeddings(call_latency=args.embedding_call_latency)
+    engine, _ = benchmark_index(os.path.join(work_dir, "db"), llm, embeddings)
+    if not args.answer_cache:
+        engine.answer_cache.max_entries = 0
+    rag_engine.set_rag_engine(engine)
+    set_translator(Translator(llm))
+
+    outbox = Outbox(
+        os.path.join(work_dir, "outbox.sqlite3"),
+        host="load-test",
+        port=0,
+        starttls=False,
+        smtp_factory=FakeSMTP.factory(send_latency=args.smtp_latency),
+    )
+    outbox.start()
+    set_outbox(outbox)
+
+    # AppTestはsecretsを指定すると実行ごとにグローバルなst.secretsを差し替えるため、
+    # 同時に実行するセッション間で競合しないよう、ここで1度だけ設定する
+    secrets = Secrets()
+    secrets._secrets = dict(LOAD_TEST_SECRETS)
+    st.secrets = secrets
+    return outbox
+
+@contextmanager
+def shared_runtime():
+    """
+    AppTestを複数のスレッドから同時に実行できるよう、Runtimeを全セッションで共有するものに固定する
+
+    AppTestは実行ごとにグローバルなRuntimeを作成し、終了時に破棄するため、
+    同時に実行すると他のセッションの実行中にRuntimeが無くなり失敗する
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    with patch.object(Runtime, "instance", classmethod(lambda cls: runtime)), \
+         patch.object(Runtime, "exists", classmethod(lambda cls: True)):
+        yield
+
+def run_session(index, turns, contact_every, timeout):
+    """
+    1セッション分の操作（画面読み込みと、質問の送信）を実行
+
+    Returns:
+        (AppTestのインスタンス, 初回表示の所要時間, 再実行ごとの所要時間のリスト, エラー件数)
+    """
+    at = AppTest.from_file("main.py", default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    first_load_seconds = time.perf_counter() - start
+    errors = len(at.exception)
+
+    contact_selectbox = next(
+        selectbox for selectbox in at.selectbox
+        if ct.get_text('CONTACT_MODE_ON', 'ja') in selectbox.options
+    )
+    rerun_seconds = []
+    for turn in range(turns):
+        # contact_every往復に1回は問い合わせモードで送信する
+        contact = contact_every > 0 and turn % contact_every == contact_every - 1
+        contact_selectbox.set_value(ct.get_text('CONTACT_MODE_ON' if contact else 'CONTACT_MODE_OFF', 'ja'))
+        at.chat_input[0].set_value(QUESTIONS[(index + turn) % len(QUESTIONS)])
+        start = time.perf_counter()
+        at.run()
+        rerun_seconds.append(time.perf_counter() - start)
+        errors += len(at.exception)
+        contact_selectbox = next(
+            selectbox for selectbox in at.selectbox
+            if ct.get_text('CONTACT_MODE_ON', 'ja') in selectbox.options
+        )
+    return at, first_load_seconds, rerun_seconds, errors
+
+def run_level(sessions, args):
+    """
+    指定したセッション数を同時に実行し、計測結果を取得
+
+    Returns:
+        計測結果の辞書
+    """
+    get_metrics().reset()
+    gc.collect()
+    rss_before = current_rss_bytes()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(
+            lambda index: run_session(index, args.turns, args.contact_every, args.timeout),
+            range(sessions)
+        ))
+    wall_seconds = time.perf_counter() - start
+
+    # 全セッションのAppTest（セッション状態）を保持したままメモリを計測する
+    gc.collect()
+    rss_after = current_rss_bytes()
+
+    first_load_seconds = [first_load for _, first_load, _, _ in results]
+    rerun_seconds = [seconds for _, _, reruns, _ in results for seconds in reruns]
+    durations = get_metrics().snapshot()["durations"]
+    turns = len(rerun_seconds)
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "errors": sum(errors for _, _, _, errors in results),
+        "wall_seconds": wall_seconds,
+        "turns_per_second": turns / wall_seconds,
+        "first_load_seconds": percentiles(first_load_seconds),
+        "rerun_seconds": percentiles(rerun_seconds),
+        "initialize_seconds": durations.get("initialize", {}),
+        "script_run_seconds": durations.get("script_run", {}),
+        "rss_before_bytes": rss_before,
+        "rss_after_bytes": rss_after,
+        "memory_per_session_bytes": (rss_after - rss_before) / sessions,
+        "stages": durations,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="同時に実行するセッション数（複数指定で順に計測）")
+    parser.add_argument("--turns", type=int, default=5, help="1セッションあたりの質問の送信回数")
+    parser.add_argument("--contact-every", type=int, default=0, help="この往復数に1回は問い合わせモードで送信（0の場合は送信しない）")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="LLMの最初のトークンまでの待ち時間（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="LLMの1トークンごとの待ち時間（秒）")
+    parser.add_argument("--embedding-call-latency", type=float, default=0.05, help="埋め込みの1回の呼び出しごとの待ち時間（秒）")
+    parser.add_argument("--smtp-latency", type=float, default=0.2, help="メール1通の送信ごとの待ち時間（秒）")
+    parser.add_argument("--answer-cache", action="store_true", help="回答キャッシュを有効にする（既定では毎回回答を生成）")
+    parser.add_argument("--timeout", type=float, default=120, help="画面の実行1回あたりのタイムアウト（秒）")
+    parser.add_argument("--output", help="結果の保存先（既定は benchmarks/results/load_<コミット>.json）")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    outbox = setup_fakes(args, tempfile.mkdtemp(prefix="load_test_"))
+
+    levels = []
+    print(f"{'sessions':>8} {'turns/s':>8} {'first p50':>10} {'rerun p50':>10} {'rerun p95':>10} {'init p50':>9} {'MiB/sess':>9} {'errors':>6}")
+    for sessions in args.sessions:
+        with shared_runtime():
+            level = run_level(sessions, args)
+        levels.append(level)
+        print(f"{sessions:>8} {level['turns_per_second']:>8.2f} "
+              f"{level['first_load_seconds']['p50']:>9.3f}s {level['rerun_seconds'].get('p50', 0.0):>9.3f}s "
+              f"{level['rerun_seconds'].get('p95', 0.0):>9.3f}s {level['initialize_seconds'].get('p50', 0.0):>8.4f}s "
+              f"{level['memory_per_session_bytes'] / 1024 / 1024:>9.2f} {level['errors']:>6}")
+
+    outbox.flush(timeout=args.timeout)
+    results = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "levels": levels,
+        "outbox": outbox.stats(),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    outbox.stop()
+
+    output = args.output or os.path.join("benchmarks", "results", f"load_{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"saved : {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+複数セッションが同時にログを出力した場合の、1往復あたりのログ出力にかかる時間（リクエスト側のスレッドでの待ち時間）を計測するスクリプトです。
+
+・before: 従来どおりリクエストのスレッドでTimedRotatingFileHandlerに直接書き込む
+・after : QueueHandlerでキューに積み、書き込みはQueueListenerのスレッドで行う（JSON Lines形式）
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.logging_overhead --sessions 8 --turns 500
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import logging
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+from logging.handlers import QueueListener, TimedRotatingFileHandler
+from app_logging import ContextQueueHandler, JsonLinesFormatter, bind_context, log_stage
+
+############################################################
+# 設定関連
+############################################################
+# 1往復で出力するログの件数（ユーザーメッセージ・書き換え・検索・最初のトークン・回答など）
+RECORDS_PER_TURN = 6
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_before_logger(log_dir):
+    """
+    従来の実装によるロガー（リクエストのスレッドでファイルに書き込む）
+    """
+    logger = logging.getLogger("benchmark.before")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = TimedRotatingFileHandler(os.path.join(log_dir, "before.log"), when="D", encoding="utf8")
+    handler.setFormatter(logging.Formatter(
+        "[%(levelname)s] %(asctime)s line %(lineno)s, in %(funcName)s, session_id=fixed: %(message)s"
+    ))
+    logger.addHandler(handler)
+    return logger, None
+
+def create_after_logger(log_dir):
+    """
+    新しい実装によるロガー（キューに積み、書き込みは専用のスレッドで行う）
+    """
+    logger = logging.getLogger("benchmark.after")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = TimedRotatingFileHandler(os.path.join(log_dir, "after.log"), when="D", encoding="utf8")
+    handler.setFormatter(JsonLinesFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    logger.addHandler(ContextQueueHandler(log_queue))
+    return logger, listener
+
+def run_sessions(logger, sessions, turns):
+    """
+    セッションごとのスレッドから同時にログを出力し、1往復あたりのログ出力時間を計測
+
+    Returns:
+        1往復あたりのログ出力時間[マイクロ秒]のリスト
+    """
+    durations = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(sessions)
+
+    def session(index):
+        bind_context(f"session-{index}", "ja")
+        local = []
+        barrier.wait()
+        for turn in range(turns):
+            start = time.perf_counter()
+            with log_stage("chat"):
+                for record in range(RECORDS_PER_TURN):
+                    logger.info({"message": "turn event", "turn": turn, "record": record, "text": "配水管の更新工事の予定"})
+            local.append((time.perf_counter() - start) * 1e6)
+        with lock:
+            durations.extend(local)
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations
+
+def report(label, durations):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{label}: median {statistics.median(durations):.1f} us / turn, p95 {p95:.1f} us / turn")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="同時に実行するセッション数")
+    parser.add_argument("--turns", type=int, default=500, help="1セッションあたりの往復数")
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix="logging_overhead_")
+    for label, create_logger in (("before", create_before_logger), ("after ", create_after_logger)):
+        logger, listener = create_logger(log_dir)
+        durations = run_sessions(logger, args.sessions, args.turns)
+        if listener is not None:
+            listener.stop()
+        report(label, durations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+関連する情報が無い質問に回答生成を行わずに返すための閾値（NO_MATCH_VECTOR_SCORE_THRESHOLD）を、
+ラベル付きの質問から決めるスクリプトです。
+
+ラベル付きの質問（JSONL形式。1行に {"question": 質問, "relevant": 資料で回答できる質問かどうか}）ごとに、
+RAGエンジンと同じベクトル検索で最も関連度の高いチャンクの関連度と、BM25検索で内容語（名詞）が一致するかどうかを求め、
+資料で回答できる質問のうち --min-recall 以上の割合が通過する最も大きい閾値を選びます。
+通過の判定はRAGエンジン（RagEngine._is_no_match）と同じく、次の順に行います。
+・BM25検索で内容語が一致する質問は通過する
+・NO_MATCH_REQUIRE_CONTENT_MATCH_JA が有効な場合、内容語が一致しない日本語の質問は打ち切る
+・それ以外の質問は、関連度が閾値以上の場合に通過する
+あわせて、日本語の質問の内容語の一致のみで判定した場合と、選んだ閾値の場合の、資料で回答できる質問の通過率と
+関係の無い質問の打ち切り率を出力します（内容語の一致は埋め込みモデルによらないため、--fake でも実際の値になります）。
+
+埋め込みモデルごとに関連度の分布が変わるため、OpenAIの埋め込みモデルで実行してください（OPENAI_API_KEYが必要）。
+--fake を指定した場合はフェイクの埋め込みで一時フォルダにインデックスを作成します（動作確認用で、閾値は意味を持ちません）。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.no_match_calibration --min-recall 0.95
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import datetime
+import json
+import math
+import os
+import tempfile
+import indexing
+from lexical_index import is_japanese, load_or_build_lexical_index
+from benchmarks.end_to_end import git_commit
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+DEFAULT_QUERIES_PATH = os.path.join("benchmarks", "data", "no_match_queries.jsonl")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def load_queries(path):
+    """
+    ラベル付きの質問を読み込み
+
+    Returns:
+        (質問, 資料で回答できる質問かどうか)のリスト
+    """
+    with open(path, encoding="utf8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["question"], bool(row["relevant"])) for row in rows]
+
+def best_scores(db, lexical_index, queries):
+    """
+    質問ごとに、ベクトル検索で最も関連度の高いチャンクの関連度と、BM25検索で内容語が一致するかどうかを取得
+
+    内容語の一致はHybridRetrieverと同じく、BM25検索の上位TOP_K件のチャンクのいずれかが内容語を含むかどうかで判定する
+
+    Returns:
+        (質問, 資料で回答できる質問かどうか, 関連度, BM25検索で内容語が一致するかどうか, 日本語の質問かどうか)のリスト
+    """
+    results = []
+    for question, relevant in queries:
+        docs = db.similarity_search_with_relevance_scores(question, k=1)
+        score = docs[0][1] if docs else float("-inf")
+        content_matches = lexical_index.content_matches(question)
+        lexical_hit = any(doc_index in content_matches for doc_index, _ in lexical_index.search(question, ct.TOP_K))
+        results.append((question, relevant, score, lexical_hit, is_japanese(question)))
+    return results
+
+def passes(score, lexical_hit, japanese, threshold, require_content_match_ja):
+    """
+    RAGエンジンと同じ順で、回答生成に進む（打ち切らない）かどうかを判定
+    """
+    if lexical_hit:
+        return True
+    if require_content_match_ja and japanese:
+        return False
+    return threshold is None or score >= threshold
+
+def choose_threshold(scored, min_recall, margin, require_content_match_ja):
+    """
+    資料で回答できる質問のうち min_recall 以上の割合が通過する、最も大きい閾値を選ぶ
+
+    内容語の一致で通過・打ち切りが決まる質問は閾値によらないため、残りの質問の関連度から選ぶ
+
+    Returns:
+        閾値（閾値で判定する資料で回答できる質問が無い場合、または閾値によらず min_recall に届かない場合はNone）
+    """
+    relevant = [row for row in scored if row[1]]
+    fixed_passed = sum(1 for _, _, _, lexical_hit, _ in relevant if lexical_hit)
+    scores = sorted(
+        score for _, _, score, lexical_hit, japanese in relevant
+        if not lexical_hit and not (require_content_match_ja and japanese)
+    )
+    required = max(math.ceil(min_recall * len(relevant)) - fixed_passed, 1)
+    if not scores or required > len(scores):
+        return None
+    return scores[len(scores) - required] - margin
+
+def evaluate(scored, threshold, require_content_match_ja):
+    """
+    閾値で判定した場合の、資料で回答できる質問の通過率と、関係の無い質問の打ち切り率を取得
+    """
+    relevant = [
+        passes(score, hit, japanese, threshold, require_content_match_ja)
+        for _, is_relevant, score, hit, japanese in scored if is_relevant
+    ]
+    irrelevant = [
+        not passes(score, hit, japanese, threshold, require_content_match_ja)
+        for _, is_relevant, score, hit, japanese in scored if not is_relevant
+    ]
+    return {
+        "threshold": threshold,
+        "require_content_match_ja": require_content_match_ja,
+        "relevant_recall": sum(relevant) / len(relevant) if relevant else None,
+        "irrelevant_rejected": sum(irrelevant) / len(irrelevant) if irrelevant else None,
+    }
+
+def create_indexes(fake):
+    """
+    検索対象のベクターストアとBM25の転置インデックスを作成
+
+    Returns:
+        (Chromaのベクターストア, LexicalIndexのインスタンス)
+    """
+    if fake:
+        from benchmarks.fakes import FakeEmbeddings
+        db_name = os.path.join(tempfile.mkdtemp(prefix="no_match_calibration_"), "db")
+        db = indexing.create_vectorstore(db_name, FakeEmbeddings(), ct.RAG_TOP_FOLDER_PATH)
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        db_name = ct.DB_ALL_PATH
+        db = indexing.create_vectorstore(db_name, OpenAIEmbeddings())
+    return db, load_or_build_lexical_index(db, db_name, indexing.get_index_version(db_name))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="ラベル付きの質問（JSONL）")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="資料で回答できる質問のうち、閾値以上となるべき割合")
+    parser.add_argument("--margin", type=float, default=0.02, help="選んだ閾値から差し引く余裕")
+    parser.add_argument("--fake", action="store_true", help="フェイクの埋め込みを使う（動作確認用）")
+    parser.add_argument("--output", help="結果の保存先（既定は benchmarks/results/no_match_<コミット>.json）")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    db, lexical_index = create_indexes(args.fake)
+    scored = best_scores(db, lexical_index, load_queries(args.queries))
+    require_content_match_ja = ct.NO_MATCH_REQUIRE_CONTENT_MATCH_JA
+    threshold = choose_threshold(scored, args.min_recall, args.margin, require_content_match_ja)
+
+    for question, relevant, score, lexical_hit, japanese in sorted(scored, key=lambda item: item[2], reverse=True):
+        print(
+            f"{score:>7.3f} {'relevant  ' if relevant else 'irrelevant'} {'ja' if japanese else '  '} "
+            f"{'content' if lexical_hit else '       '} {question}"
+        )
+
+    results = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "current": evaluate(scored, ct.NO_MATCH_VECTOR_SCORE_THRESHOLD, require_content_match_ja),
+        "content_match_only": evaluate(scored, None, True),
+        "suggested": evaluate(scored, threshold, require_content_match_ja) if threshold is not None else None,
+        "queries": [
+            {
+                "question": question,
+                "relevant": relevant,
+                "best_vector_score": score,
+                "lexical_content_match": lexical_hit,
+                "japanese": japanese,
+            }
+            for question, relevant, score, lexical_hit, japanese in scored
+        ],
+    }
+
+    output = args.output or os.path.join("benchmarks", "results", f"no_match_{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    for label in ("current", "content_match_only", "suggested"):
+        result = results[label]
+        if result is None:
+            continue
+        threshold_text = "none " if result["threshold"] is None else f"{result['threshold']:.3f}"
+        print(
+            f"{label:<18}: threshold {threshold_text}, "
+            f"relevant recall {result['relevant_recall']:.0%}, irrelevant rejected {result['irrelevant_rejected']:.0%}"
+        )
+    print(f"saved             : {output}")
+
+
+if __name__ == "__main__":
+    main()
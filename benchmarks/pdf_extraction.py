@@ -0,0 +1,76 @@
+"""
+PDFのテキスト抽出について、従来のローダーとページ単位のキャッシュ・並列抽出の所要時間を比較するスクリプトです。
+
+・before      : 従来どおりPyMuPDFLoaderで全ページを逐次に解析する
+・after cold  : PdfPageLoaderでキャッシュが空の状態から抽出する（逐次 / 並列）
+・after warm  : PdfPageLoaderでキャッシュ済みのPDFを読み込む（ページの解析は行わない）
+
+大きな仕様書を想定し、data/rag のPDFを指定回数つなげたPDFを一時フォルダに作成して計測します。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.pdf_extraction --copies 20
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import os
+import tempfile
+import time
+import pymupdf
+from langchain_community.document_loaders import PyMuPDFLoader
+from pdf_loader import PdfPageLoader
+import indexing
+import constants as ct
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_large_pdf(source_path, copies, output_path):
+    """
+    PDFを指定回数つなげたPDFを作成
+
+    Returns:
+        作成したPDFのページ数
+    """
+    with pymupdf.open(source_path) as source, pymupdf.open() as output:
+        for _ in range(copies):
+            output.insert_pdf(source)
+        output.save(output_path)
+        return output.page_count
+
+def timed(label, create_loader):
+    start = time.perf_counter()
+    loader = create_loader()
+    docs = loader.load()
+    seconds = time.perf_counter() - start
+    parsed = getattr(loader, "parsed_pages", len(docs))
+    print(f"{label}: {seconds * 1000:>8.1f} ms ({len(docs)} pages, {parsed} parsed)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=20, help="元のPDFをつなげる回数")
+    parser.add_argument("--workers", type=int, default=None, help="並列抽出のプロセス数（未指定の場合はCPUコア数）")
+    args = parser.parse_args()
+
+    source_path = next(
+        path for path in indexing.list_source_files(ct.RAG_TOP_FOLDER_PATH) if path.endswith(".pdf")
+    )
+    work_dir = tempfile.mkdtemp(prefix="pdf_extraction_")
+    pdf_path = os.path.join(work_dir, "large.pdf")
+    pages = create_large_pdf(source_path, args.copies, pdf_path)
+    print(f"{source_path} x {args.copies} = {pages} pages, {os.cpu_count()} CPUs")
+
+    serial_cache = os.path.join(work_dir, "serial.sqlite3")
+    parallel_cache = os.path.join(work_dir, "parallel.sqlite3")
+    timed("before            ", lambda: PyMuPDFLoader(pdf_path))
+    timed("after cold serial ", lambda: PdfPageLoader(pdf_path, cache_path=serial_cache, max_workers=1))
+    timed("after cold parallel", lambda: PdfPageLoader(pdf_path, cache_path=parallel_cache, max_workers=args.workers))
+    timed("after warm        ", lambda: PdfPageLoader(pdf_path, cache_path=parallel_cache, max_workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
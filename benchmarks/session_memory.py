@@ -0,0 +1,116 @@
+"""
+セッションを1件追加するごとに増える常駐メモリ（RSS）を計測するスクリプトです。
+
+・before: 従来どおりセッションごとにLLM・埋め込みモデル・Chroma・RAGチェーンを作成
+・after : プロセス共有のRAGエンジンを使い、セッションは会話履歴のみを保持
+
+OpenAIへの通信を発生させないよう、LLMと埋め込みモデルはLangChainのフェイクを使用します。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.session_memory --sessions 20
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import gc
+import os
+import resource
+import sys
+import tempfile
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+import rag_engine
+import indexing
+import utils
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+EMBEDDING_SIZE = 1536
+
+
+############################################################
+# 関数定義
+############################################################
+
+def rss_bytes():
+    """
+    現在の常駐メモリ（RSS）をバイト単位で取得
+
+    Linuxでは/proc/self/statmから現在値を、それ以外ではピーク値を返す
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト、Linuxはキロバイト単位
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def fake_llm():
+    return FakeListChatModel(responses=["回答"])
+
+def fake_embeddings():
+    return DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+
+def measure(create_session, sessions):
+    """
+    セッションを順に作成し、1セッションあたりのRSS増加量を計測
+
+    Args:
+        create_session: セッション1件分の状態を作成して返す関数
+        sessions: 作成するセッション数
+
+    Returns:
+        1セッションあたりのRSS増加量（バイト）
+    """
+    holder = []
+    # 1件目は共有リソースの初期化を含むため、計測対象から外す
+    holder.append(create_session())
+    gc.collect()
+    start = rss_bytes()
+    for _ in range(sessions):
+        holder.append(create_session())
+    gc.collect()
+    return (rss_bytes() - start) / sessions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="計測するセッション数")
+    parser.add_argument("--mode", choices=["before", "after", "both"], default="both")
+    args = parser.parse_args()
+
+    db_name = os.path.join(tempfile.mkdtemp(prefix="session_memory_"), "db")
+    # フェイクの埋め込みでベクターストアを1度だけ作成しておく
+    indexing.create_vectorstore(db_name, fake_embeddings(), ct.RAG_TOP_FOLDER_PATH)
+
+    def before_session():
+        # 従来の実装：セッションごとにLLM・埋め込み・Chroma・チェーンを作成
+        llm = fake_llm()
+        db = indexing.create_vectorstore(db_name, fake_embeddings())
+        retriever = db.as_retriever(search_kwargs={"k": ct.TOP_K})
+        return {
+            "llm": llm,
+            "rag_chain": (retriever, utils.create_rag_chain(llm, "ja")),
+            "chat_history": [],
+        }
+
+    def after_session():
+        # 新しい実装：エンジンはプロセス共有、セッションは会話履歴のみ
+        rag_engine.get_rag_engine().get_chain("ja")
+        return {"chat_history": []}
+
+    if args.mode in ("before", "both"):
+        per_session = measure(before_session, args.sessions)
+        print(f"before: {per_session / 1024:.1f} KiB / session")
+    if args.mode in ("after", "both"):
+        rag_engine.set_rag_engine(rag_engine.RagEngine(db_name, llm=fake_llm(), embeddings=fake_embeddings(), embedding_cache_path=None))
+        per_session = measure(after_session, args.sessions)
+        print(f"after : {per_session / 1024:.1f} KiB / session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+ベクトル検索の方式（VECTOR_INDEX_BACKEND）ごとに、チャンク数に応じた検索の所要時間とメモリ使用量を比較するスクリプトです。
+
+・chroma: Chroma（SQLite + HNSW）で検索する（従来の方式）
+・numpy : 埋め込み行列をメモリマップし、NumPyで全件比較する（vector_index.NumpyVectorIndex）
+
+チャンク数ごとに正規化した乱数の埋め込みベクトルでインデックスを作成し、
+作成と計測はそれぞれ新しいプロセスで行います（アプリの起動直後と同じく、保存済みのインデックスを開いた状態から計測）。
+・開く    : インデックスを開く所要時間と、開いた後のRSSの増加量
+・初回検索: 最初の検索の所要時間（ChromaはHNSWの読み込みを含む）
+・検索    : 2回目以降の検索の所要時間（p50/p95/p99）と、検索後のRSSの増加量
+・ディスク: インデックスのファイルサイズ
+
+埋め込みの計算時間は方式によらず同じため、検索は埋め込みベクトルで行います。結果はJSONで保存するため、コミット間で比較できます。
+
+実行方法（リポジトリ直下で実行）:
+    python -m benchmarks.vector_index --sizes 1000 10000 100000 --queries 200
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from langchain_chroma import Chroma
+from vector_index import NumpyVectorIndex
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.end_to_end import git_commit, percentiles
+from benchmarks.load_test import current_rss_bytes
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+BACKENDS = ["chroma", "numpy"]
+# Chromaに1回で追加する件数（Chromaの1回あたりの上限より小さくする）
+CHROMA_ADD_BATCH = 5000
+# langchain_chromaが既定で使うコレクション名
+CHROMA_COLLECTION = "langchain"
+
+
+############################################################
+# 関数定義
+############################################################
+
+def random_vectors(rng, count, dim):
+    """
+    正規化した乱数の埋め込みベクトルを作成（OpenAIの埋め込みと同じく長さ1）
+    """
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def build(backend, path, size, dim, seed):
+    """
+    インデックスを作成して保存（新しいプロセスで実行）
+
+    Returns:
+        作成の所要時間（秒）
+    """
+    rng = np.random.default_rng(seed)
+    ids = [f"chunk-{i}" for i in range(size)]
+    texts = [f"benchmark chunk {i}" for i in range(size)]
+    metadatas = [{"source": "benchmark", "chunk": i} for i in range(size)]
+    vectors = random_vectors(rng, size, dim)
+
+    start = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=path).get_or_create_collection(CHROMA_COLLECTION)
+        for offset in range(0, size, CHROMA_ADD_BATCH):
+            batch = slice(offset, offset + CHROMA_ADD_BATCH)
+            collection.add(ids=ids[batch], embeddings=vectors[batch], documents=texts[batch], metadatas=metadatas[batch])
+    else:
+        os.makedirs(path, exist_ok=True)
+        NumpyVectorIndex("benchmark", ids, texts, metadatas, vectors).save(os.path.join(path, ct.VECTOR_INDEX_FILE))
+    return time.perf_counter() - start
+
+def measure(backend, path, dim, queries, k, seed):
+    """
+    保存済みのインデックスを開き、検索の所要時間とメモリ使用量を計測（新しいプロセスで実行）
+
+    Returns:
+        計測結果の辞書
+    """
+    query_vectors = random_vectors(np.random.default_rng(seed + 1), queries + 1, dim)
+    rss_before = current_rss_bytes()
+
+    start = time.perf_counter()
+    if backend == "chroma":
+        index = Chroma(persist_directory=path, embedding_function=FakeEmbeddings(size=dim))
+    else:
+        index = NumpyVectorIndex.load(os.path.join(path, ct.VECTOR_INDEX_FILE))
+    open_seconds = time.perf_counter() - start
+    rss_opened = current_rss_bytes()
+
+    start = time.perf_counter()
+    index.similarity_search_by_vector_with_relevance_scores(query_vectors[0].tolist(), k=k)
+    first_query_seconds = time.perf_counter() - start
+
+    seconds = []
+    for vector in query_vectors[1:]:
+        start = time.perf_counter()
+        index.similarity_search_by_vector_with_relevance_scores(vector.tolist(), k=k)
+        seconds.append(time.perf_counter() - start)
+
+    return {
+        "open_seconds": open_seconds,
+        "first_query_seconds": first_query_seconds,
+        "query_seconds": percentiles(seconds),
+        "rss_open_bytes": rss_opened - rss_before,
+        "rss_query_bytes": current_rss_bytes() - rss_before,
+    }
+
+def in_new_process(fn, *args):
+    """
+    関数を新しいプロセスで実行（前の計測で読み込んだインデックスやキャッシュの影響を除く）
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+def directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="チャンク数")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS, help="比較する検索方式")
+    parser.add_argument("--dim", type=int, default=1536, help="埋め込みベクトルの次元数")
+    parser.add_argument("--queries", type=int, default=200, help="計測する検索の回数")
+    parser.add_argument("--k", type=int, default=ct.TOP_K, help="検索の取得件数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--output", help="結果の保存先（既定は benchmarks/results/vector_index_<コミット>.json）")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            path = tempfile.mkdtemp(prefix=f"vector_index_{backend}_{size}_")
+            try:
+                build_seconds = in_new_process(build, backend, path, size, args.dim, args.seed)
+                result = in_new_process(measure, backend, path, args.dim, args.queries, args.k, args.seed)
+                result.update(backend=backend, size=size, build_seconds=build_seconds, disk_bytes=directory_bytes(path))
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+            results.append(result)
+
+            query = result["query_seconds"]
+            print(
+                f"{size:>7} {backend:<6}: query p50 {query['p50'] * 1000:>7.2f} ms, p95 {query['p95'] * 1000:>7.2f} ms, "
+                f"first {result['first_query_seconds'] * 1000:>8.1f} ms, open {result['open_seconds'] * 1000:>7.1f} ms, "
+                f"RSS +{result['rss_query_bytes'] / 1024 / 1024:>6.1f} MiB, disk {result['disk_bytes'] / 1024 / 1024:>6.1f} MiB, "
+                f"build {result['build_seconds']:>6.1f} s"
+            )
+
+    output = args.output or os.path.join("benchmarks", "results", f"vector_index_{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "config": vars(args),
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"saved  : {output}")
+
+
+if __name__ == "__main__":
+    main()
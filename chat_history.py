@@ -0,0 +1,112 @@
+"""
+このファイルは、1セッション分の会話履歴と、そのトークン数の管理が記述されたファイルです。
+各メッセージのトークン数は追加時に1度だけ数えて保持し、上限を超えた分の削除は再エンコードせずに定数時間で行います。
+画面表示用の会話ログ（st.session_state.messages）も同じオブジェクトで更新し、両者がずれないようにします。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+from collections import deque
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ConversationHistory:
+    """
+    LLMに渡す会話履歴（トークン数付きのdeque）と、画面表示用の会話ログ
+
+    ・messages: 画面表示用の会話ログ（削除しない）
+    ・LLMに渡す会話履歴: 合計トークン数が上限を超えた場合に古い順に削除する
+    """
+
+    def __init__(self, encoder=None):
+        """
+        Args:
+            encoder: トークン数を数えるエンコーダー（未指定の場合はプロセス共有のエンコーダー）
+        """
+        self.encoder = encoder
+        self.messages = []
+        self.total_tokens = 0
+        self._entries = deque()
+
+    def add_turn(self, chat_message, answer, input_tokens=None, remember=True):
+        """
+        1往復分のやり取りを追加
+
+        Args:
+            chat_message: ユーザーメッセージ
+            answer: 画面に表示した回答
+            input_tokens: ユーザーメッセージのトークン数（数え済みの場合）
+            remember: LLMに渡す会話履歴にも追加するかどうか（問い合わせモードではFalse）
+
+        Returns:
+            回答のトークン数（LLMに渡す会話履歴に追加しない場合はNone）
+        """
+        # LangChainは最初の質問の送信時まで読み込まない（画面の起動を遅くしないため）
+        from langchain_core.messages import HumanMessage, AIMessage
+
+        self.messages.append({"role": "user", "content": chat_message})
+        self.messages.append({"role": "assistant", "content": answer})
+        if not remember:
+            return None
+        if input_tokens is None:
+            input_tokens = self.count_tokens(chat_message)
+        answer_tokens = self.count_tokens(answer)
+        self._append(HumanMessage(content=chat_message), input_tokens)
+        self._append(AIMessage(content=answer), answer_tokens)
+        return answer_tokens
+
+    def trim(self, max_tokens):
+        """
+        合計トークン数が上限を下回るまで、古い会話履歴を削除
+
+        従来どおり最初のメッセージは残し、その次に古いものから削除する
+
+        Args:
+            max_tokens: 会話履歴の合計トークン数の上限
+
+        Returns:
+            削除したメッセージ数
+        """
+        removed = 0
+        while self.total_tokens > max_tokens and len(self._entries) > 1:
+            first = self._entries.popleft()
+            _, tokens = self._entries.popleft()
+            self._entries.appendleft(first)
+            self.total_tokens -= tokens
+            removed += 1
+        return removed
+
+    def as_messages(self):
+        """
+        LLMに渡す会話履歴をメッセージのリストとして取得
+
+        Returns:
+            HumanMessage / AIMessageのリスト
+        """
+        return [message for message, _ in self._entries]
+
+    def count_tokens(self, text):
+        """
+        テキストのトークン数を取得
+
+        Args:
+            text: 対象のテキスト
+
+        Returns:
+            トークン数
+        """
+        if self.encoder is None:
+            from rag_engine import get_encoder
+            self.encoder = get_encoder()
+        return len(self.encoder.encode(text))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _append(self, message, tokens):
+        self._entries.append((message, tokens))
+        self.total_tokens += tokens
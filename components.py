@@ -19,29 +19,29 @@ def display_language_selector():
     """
     言語選択の表示
     """
-    # 言語定数を取得
-    lang_constants = ct.get_language_constants()
-    
-    st.markdown(lang_constants.LANGUAGE_SELECTION_HEADER)
+    st.markdown(ct.get_text('LANGUAGE_SELECTION_HEADER'))
     
     # 現在の言語を取得
     current_language = getattr(st.session_state, 'language', 'ja')
+    supported_languages = ct.get_text('SUPPORTED_LANGUAGES')
     
-    # 言語選択
-    selected_language = st.selectbox(
-        lang_constants.LANGUAGE_SELECTION_TEXT,
-        options=list(lang_constants.SUPPORTED_LANGUAGES.keys()),
-        format_func=lambda x: lang_constants.SUPPORTED_LANGUAGES[x],
-        index=list(lang_constants.SUPPORTED_LANGUAGES.keys()).index(current_language),
-        key="language_selector"
+    # 言語選択（変更時はコールバックで言語を切り替え、同じ実行内で新しい言語の画面を表示する）
+    st.selectbox(
+        ct.get_text('LANGUAGE_SELECTION_TEXT'),
+        options=list(supported_languages.keys()),
+        format_func=lambda x: supported_languages[x],
+        index=list(supported_languages.keys()).index(current_language),
+        key="language_selector",
+        on_change=change_language
     )
-    
-    # 言語が変更された場合
-    if st.session_state.language != selected_language:
-        st.session_state.language = selected_language
-        # RAGチェーンを現在の言語で再構築
-        utils.rebuild_rag_chain_for_current_language()
-        st.rerun()  # ページを再読み込み
+
+def change_language():
+    """
+    言語選択の変更時に呼び出され、表示言語を切り替える
+
+    RAGのChainは言語ごとに作成済みのものを実行時に選ぶため、ここでは再構築しない
+    """
+    st.session_state.language = st.session_state.language_selector
 
 def display_theme_toggle():
     """
@@ -81,19 +81,67 @@ def display_sidebar():
         
         st.markdown(ct.get_text('CONTACT_MODE_HEADER'))
         
-        col1, = st.columns([80])
-        with col1:
-            st.session_state["contact_mode"] = st.selectbox(
-                label=ct.get_text('CONTACT_MODE_SELECTION_TEXT'),
-                options=[ct.get_text('CONTACT_MODE_OFF'), ct.get_text('CONTACT_MODE_ON')],
-                label_visibility="collapsed",
-            )
+        display_contact_mode_selector()
         
         st.divider()
 
         st.markdown(ct.get_text('CONTACT_MODE_DESCRIPTION_TEXT'))
         st.code(ct.get_text('CONTACT_MODE_DESCRIPTION_DETAIL_TEXT'), wrap_lines=True)
 
+        # 管理者のみ、処理段階ごとの所要時間などのメトリクスを表示
+        if utils.is_admin():
+            st.divider()
+            display_metrics_view()
+
+@st.fragment
+def display_contact_mode_selector():
+    """
+    問い合わせモード選択の表示
+
+    切り替え時は送信時の処理を変えるだけで画面の他の部分は変わらないため、
+    フラグメントとしてこの部分のみを再実行し、会話ログなどを描画し直さない
+    """
+    col1, = st.columns([80])
+    with col1:
+        st.session_state["contact_mode"] = st.selectbox(
+            label=ct.get_text('CONTACT_MODE_SELECTION_TEXT'),
+            options=[ct.get_text('CONTACT_MODE_OFF'), ct.get_text('CONTACT_MODE_ON')],
+            label_visibility="collapsed",
+        )
+
+@st.fragment
+def display_metrics_view():
+    """
+    メトリクス（処理段階ごとの所要時間・計測値・キャッシュ等の状態）の表示
+
+    ダウンロードボタンなどの操作時は、フラグメントとしてこの部分のみを再実行する
+    """
+    from metrics import get_metrics
+
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+
+    st.markdown(ct.get_text('METRICS_HEADER'))
+    st.caption(ct.get_text('METRICS_STAGE_CAPTION'))
+    st.dataframe(
+        [{"stage": stage, **summary} for stage, summary in sorted(snapshot["durations"].items())],
+        hide_index=True
+    )
+    st.caption(ct.get_text('METRICS_VALUE_CAPTION'))
+    st.dataframe(
+        [{"name": name, **summary} for name, summary in sorted(snapshot["values"].items())],
+        hide_index=True
+    )
+    st.caption(ct.get_text('METRICS_GAUGE_CAPTION'))
+    st.json(snapshot["gauges"], expanded=False)
+    st.download_button(
+        ct.get_text('METRICS_DOWNLOAD_BUTTON'),
+        data=metrics.render_prometheus(),
+        file_name="metrics.prom",
+        mime="text/plain",
+        use_container_width=True
+    )
+
 def display_initial_ai_message():
     """
     AIメッセージの初期表示
@@ -105,9 +153,36 @@ def display_initial_ai_message():
 def display_conversation_log(chat_message):
     """
     会話ログの一覧表示
+
+    直近の往復のみを表示し、それより古いものは「以前の会話を表示」ボタンで遡って表示する
+    """
+    # この実行で送信されたやり取りは会話ログの下に別途表示するため、表示する範囲を現時点の件数までに固定する
+    display_conversation_window(len(st.session_state.messages))
+
+@st.fragment
+def display_conversation_window(message_count):
+    """
+    会話ログのうち、直近の往復の表示
+
+    フラグメントとして表示するため、「以前の会話を表示」ボタンを押した場合は会話ログの部分のみを再実行する
+    （再実行時のmessage_countは、直前の画面全体の実行時と同じ値になる）
+
+    Args:
+        message_count: 表示対象とする会話ログの先頭からの件数
     """
-    # 会話ログの最後を表示する時のみ、フィードバック後のメッセージ表示するために「何番目のメッセージか」を取得
-    for index, message in enumerate(st.session_state.messages):
+    messages = st.session_state.messages
+    # 会話ログはユーザーメッセージと回答の2件で1往復
+    start = max(0, message_count - st.session_state.conversation_log_turns * 2)
+    if start > 0:
+        st.button(
+            ct.get_formatted_text('CONVERSATION_LOG_LOAD_OLDER_BUTTON', count=start // 2),
+            key="load_older_conversation",
+            on_click=load_older_conversation,
+            use_container_width=True
+        )
+
+    for index in range(start, message_count):
+        message = messages[index]
         if message["role"] == "assistant":
             with st.chat_message(message["role"], avatar=ct.AI_ICON_FILE_PATH):
                 st.markdown(message["content"])
@@ -115,3 +190,8 @@ def display_conversation_log(chat_message):
             with st.chat_message(message["role"], avatar=ct.USER_ICON_FILE_PATH):
                 st.markdown(message["content"])
 
+def load_older_conversation():
+    """
+    「以前の会話を表示」ボタンの押下時に呼び出され、表示する会話ログの往復数を増やす
+    """
+    st.session_state.conversation_log_turns += ct.CONVERSATION_LOG_LOAD_MORE_TURNS
@@ -0,0 +1,202 @@
+"""
+このファイルは、LLM呼び出しを非同期で実行する基盤と、プロセス全体でのLLM同時実行数の制限が記述されたファイルです。
+各セッション（スクリプト実行スレッド）の処理はプロセス共有のイベントループ上で実行し、
+LLMへの同時リクエスト数が上限に達した場合は、セッション間で公平に順番待ちさせます。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from metrics import get_metrics
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# プロセス共有のイベントループ・制限器と、その生成を排他制御するロック
+_loop = None
+_limiter = None
+_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class FairLimiter:
+    """
+    LLMへの同時リクエスト数を制限する、セッション間で公平な待ち行列
+
+    空きが無い場合はセッションごとの待ち行列に並び、空きが出るとセッションを順番に（ラウンドロビンで）通す。
+    そのため、1つのセッションの連続したリクエストが他のセッションを待たせ続けることはない。
+    イベントループのスレッド上でのみ操作する
+    """
+
+    def __init__(self, max_in_flight):
+        """
+        Args:
+            max_in_flight: 同時に実行できるリクエスト数の上限
+        """
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.granted = 0
+        self.queued = 0
+        self.total_wait_seconds = 0.0
+        self._queues = OrderedDict()
+
+    @asynccontextmanager
+    async def slot(self, session_id):
+        """
+        実行枠を1つ確保し、処理が終わったら解放する
+
+        Args:
+            session_id: 順番待ちを公平にする単位（セッションID）
+        """
+        await self._acquire(session_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        """
+        実行中・待機中のリクエスト数などの統計情報を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "granted": self.granted,
+            "queued": self.queued,
+            "avg_wait_seconds": self.total_wait_seconds / self.queued if self.queued else 0.0,
+        }
+
+    async def _acquire(self, session_id):
+        if self.in_flight < self.max_in_flight and not self._queues:
+            self.in_flight += 1
+            self.granted += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append(future)
+        self.queue_depth += 1
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 枠を譲られた直後にキャンセルされた場合は、次の待機者に譲る
+                self._release()
+            else:
+                self._remove(session_id, future)
+            raise
+        self.total_wait_seconds += time.perf_counter() - start
+        self.granted += 1
+
+    def _release(self):
+        # 先頭のセッションの最も古いリクエストに枠を譲り、そのセッションは待ち行列の末尾に回す
+        while self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.queue_depth -= 1
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _remove(self, session_id, future):
+        queue = self._queues.get(session_id)
+        if queue and future in queue:
+            queue.remove(future)
+            self.queue_depth -= 1
+            if not queue:
+                del self._queues[session_id]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_event_loop():
+    """
+    プロセス共有のイベントループを取得（初回のみ専用スレッドで起動）
+
+    Returns:
+        イベントループ
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+def get_llm_limiter():
+    """
+    プロセス共有のLLM同時実行数の制限器を取得
+
+    Returns:
+        FairLimiterのインスタンス
+    """
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = FairLimiter(ct.LLM_MAX_CONCURRENCY)
+                get_metrics().register_gauges("llm_limiter", _limiter.stats)
+    return _limiter
+
+def submit(coro):
+    """
+    コルーチンをプロセス共有のイベントループで実行開始
+
+    呼び出し元の実行コンテキスト（ログに付与するセッションIDなど）を引き継いで実行する
+
+    Args:
+        coro: 実行するコルーチン
+
+    Returns:
+        concurrent.futures.Future
+    """
+    return asyncio.run_coroutine_threadsafe(_run_in_context(coro, contextvars.copy_context()), get_event_loop())
+
+def run(coro):
+    """
+    コルーチンをプロセス共有のイベントループで実行し、完了まで待つ
+
+    Args:
+        coro: 実行するコルーチン
+
+    Returns:
+        コルーチンの戻り値
+    """
+    return submit(coro).result()
+
+async def _run_in_context(coro, context):
+    """
+    呼び出し元の実行コンテキストの値を設定してからコルーチンを実行
+    """
+    for var, value in context.items():
+        var.set(value)
+    return await coro
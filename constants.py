@@ -6,32 +6,21 @@
 ############################################################
 # ライブラリの読み込み
 ############################################################
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.document_loaders import UnstructuredExcelLoader
+import string
+import types
+import importlib
 import streamlit as st
 
-############################################################
-# 多言語対応の設定
-############################################################
-
-def get_language_constants():
-    """
-    選択された言語に応じた定数を取得
-    """
-    # セッション状態から言語を取得（デフォルトは日本語）
-    lang = getattr(st.session_state, 'language', 'ja')
-    
-    if lang == 'en':
-        import constants_en as lang_constants
-    else:  # デフォルトは日本語
-        import constants_ja as lang_constants
-    
-    return lang_constants
-
 ############################################################
 # 言語に依存しない定数（システム設定等）
 ############################################################
 
+# ==========================================
+# 言語
+# ==========================================
+# 対応する言語コード（RAGのChainは起動時にこの全言語分を作成する）
+LANGUAGES = ("ja", "en")
+
 # ==========================================
 # ファイルパス系
 # ==========================================
@@ -46,10 +35,47 @@ LOG_FILE = "application.log"
 # ==========================================
 MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.5
+# プロセス全体でLLMに同時に送るリクエスト数の上限
+LLM_MAX_CONCURRENCY = 8
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
 TOP_K = 8
+# 融合検索の重み（ベクトル検索, BM25検索）
 RETRIEVER_WEIGHTS = [0.5, 0.5]
+# BM25検索の分かち書きに使うSudachiPyの辞書
+SUDACHI_DICT = "full"
+
+# ==========================================
+# 回答生成のコンテキスト
+# ==========================================
+# 検索したTOP_K件のチャンクのうち、回答生成のプロンプトに入れるチャンク全体のトークン数の上限
+CONTEXT_TOKEN_BUDGET = 3000
+# 回答生成に使うチャンクのベクトル検索の関連度の下限（BM25検索で内容語が一致したチャンクは対象外）
+CONTEXT_MIN_VECTOR_SCORE = 0.3
+# 採用済みのチャンクと重複するとみなす、チャンクの文字n-gramのうち採用済みのチャンクに含まれる割合の下限
+CONTEXT_DUPLICATE_THRESHOLD = 0.8
+# 日本語の質問で、検索したチャンクのいずれとも内容語（名詞）がBM25検索で一致しない場合は、回答生成を行わずにNO_DOC_MATCH_MESSAGEを返す
+# （benchmarks.no_match_calibration で校正済み。data/rag で資料で回答できる日本語の質問はすべて内容語が一致し、関係の無い質問の4割を打ち切る）
+NO_MATCH_REQUIRE_CONTENT_MATCH_JA = True
+# 最も関連度の高いチャンクの関連度（ベクトル検索）がこれ未満で、BM25検索でも内容語が一致しない場合は、回答生成を行わずにNO_DOC_MATCH_MESSAGEを返す
+# 関連度の分布は埋め込みモデルで変わるため、使う埋め込みモデル（OpenAI）で benchmarks.no_match_calibration を実行して決める
+# （未校正の値で関連する質問を打ち切らないよう、校正するまではNone（判定しない）とする）
+NO_MATCH_VECTOR_SCORE_THRESHOLD = None
+
+# ==========================================
+# 質問の書き換え
+# ==========================================
+# これより短い質問は、会話履歴を踏まえた書き換えを行う（日本語は文字数、英語は単語数）
+REWRITE_MIN_CHARS = 8
+REWRITE_MIN_WORDS = 4
+
+# ==========================================
+# 回答キャッシュ
+# ==========================================
+ANSWER_CACHE_MAX_ENTRIES = 500
+ANSWER_CACHE_TTL_SECONDS = 6 * 60 * 60
+# 類似質問とみなす質問文の埋め込みのコサイン類似度の下限
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
 
 # ==========================================
 # トークン関連
@@ -57,19 +83,93 @@ RETRIEVER_WEIGHTS = [0.5, 0.5]
 MAX_ALLOWED_TOKENS = 1000
 ENCODING_KIND = "cl100k_base"
 
+# ==========================================
+# 会話ログの表示
+# ==========================================
+# 画面に表示する直近の往復数と、「以前の会話を表示」ボタン1回で追加表示する往復数
+CONVERSATION_LOG_WINDOW_TURNS = 10
+CONVERSATION_LOG_LOAD_MORE_TURNS = 10
+
+# ==========================================
+# メトリクス
+# ==========================================
+# p50/p95/p99の算出に使う、処理段階ごとの直近の計測件数
+METRICS_WINDOW = 1000
+# サイドバーにメトリクスを表示するURLのクエリパラメータ名（値をsecretsのADMIN_TOKENと照合する）
+ADMIN_QUERY_PARAM = "admin"
+
+# ==========================================
+# 問い合わせメールの送信
+# ==========================================
+# SMTPサーバー（secretsのSMTP_HOST / SMTP_PORT / SMTP_STARTTLSで上書き可能）
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_STARTTLS = True
+SMTP_TIMEOUT_SECONDS = 30
+# 問い合わせの翻訳結果のキャッシュ件数
+TRANSLATION_CACHE_MAX_ENTRIES = 500
+# 送信待ちの問い合わせを保存する送信キュー
+OUTBOX_PATH = "./.cache/outbox.sqlite3"
+# 送信に失敗した場合の再送回数の上限と、再送までの待ち時間（失敗するたびに倍にする）
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 5
+OUTBOX_RETRY_MAX_SECONDS = 10 * 60
+
 # ==========================================
 # RAG参照用のデータソース系
 # ==========================================
 RAG_TOP_FOLDER_PATH = "./data/rag"
 
+# ローダーはインデックス作成時にのみ必要なため、画面の起動を遅くしないよう初回使用時に読み込む
+# （max_workersはファイル内の並列抽出に使うプロセス数で、ページ単位で抽出するPDFのみが使う）
+def _pdf_loader(path, max_workers=None):
+    # ページごとのテキストをキャッシュし、キャッシュに無いページのみを抽出する
+    from pdf_loader import PdfPageLoader
+    return PdfPageLoader(path, max_workers=max_workers)
+
+def _excel_loader(path, max_workers=None):
+    # .xlsxはopenpyxlで表の構造を保ったまま、チャンクサイズ単位の少数のドキュメントとして読み込む
+    from excel_loader import ExcelTableLoader
+    return ExcelTableLoader(path)
+
+def _legacy_excel_loader(path, max_workers=None):
+    # openpyxlで読めない旧形式の.xlsは、従来どおりUnstructuredで読み込む
+    from langchain_community.document_loaders import UnstructuredExcelLoader
+    return UnstructuredExcelLoader(path, mode="elements")
+
 SUPPORTED_EXTENSIONS = {
-    ".pdf": PyMuPDFLoader,
-    ".xlsx": lambda path: UnstructuredExcelLoader(path, mode="elements"),
-    ".xls":  lambda path: UnstructuredExcelLoader(path, mode="elements"),
+    ".pdf": _pdf_loader,
+    ".xlsx": _excel_loader,
+    ".xls":  _legacy_excel_loader,
 }
+# Excelの表の区切りとみなす連続した空行の数
+EXCEL_REGION_GAP_ROWS = 2
+# PDFのページごとのテキストのキャッシュ（デプロイ間で引き継ぐ場合は永続ボリューム上のパスを指定）と、保持する最大ファイル数
+PDF_PAGE_CACHE_PATH = "./.cache/pdf_pages.sqlite3"
+PDF_PAGE_CACHE_MAX_FILES = 20
+# PDFのページを並列に抽出する場合の、1プロセスあたりの最小ページ数
+PDF_PAGES_PER_WORKER = 16
 
 DB_ALL_PATH = "./.db_all"
 DB_COMPANY_PATH = "./.db_company"
+# ファイル・チャンクのハッシュを記録するマニフェスト（DBフォルダ内に保存）
+INDEX_MANIFEST_FILE = "index_manifest.json"
+# ファイルの読み込み・チャンク分割の方式のバージョン（変更した場合は、内容が同じファイルも読み込み直す）
+INDEX_LOADER_VERSION = 3
+# ファイル読み込みに使うプロセス数（Noneの場合はCPUコア数）
+LOADER_MAX_WORKERS = None
+# 埋め込みベクトルのキャッシュ（デプロイ間で引き継ぐ場合は永続ボリューム上のパスを指定）
+EMBEDDING_CACHE_PATH = "./.cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 20000
+# 質問文の埋め込みベクトルはディスクに保存せず、直近のこの件数のみメモリに保持する
+EMBEDDING_QUERY_CACHE_MAX_ENTRIES = 256
+# BM25検索用の転置インデックス（DBフォルダ内に保存）
+LEXICAL_INDEX_FILE = "lexical_index.json"
+# ベクトル検索の方式（"chroma": Chromaで検索 / "numpy": 埋め込み行列をメモリマップし、NumPyで全件比較）
+# 数千チャンク程度までの小規模なコーパスでは "numpy" の方が速く、数万チャンクを超える場合は "chroma" の方が速い（benchmarks.vector_index で比較できる）
+VECTOR_INDEX_BACKEND = "chroma"
+# NumPyで検索する場合の埋め込み行列（.npy）とチャンク（.json）の保存先（DBフォルダ内、拡張子なし）
+VECTOR_INDEX_FILE = "vector_index"
 
 # ==========================================
 # スタイリング
@@ -472,23 +572,121 @@ STYLE = LIGHT_MODE_STYLE
 # 動的に言語定数を取得する関数
 ############################################################
 
-def get_text(key):
+# 言語ファイルに無くてもよいキー（英語の入力を翻訳する場合のみ使用）
+OPTIONAL_TEXT_KEYS = frozenset({"TRANSLATION_TEMPLATE"})
+
+
+class TextTemplate(str):
+    """
+    差し込み項目を読み込み時に解析済みの文字列
+
+    通常の文字列としてそのまま使え、render時は読み込み時の解析結果から組み立てるため書式を再解析しない
+    """
+
+    def __new__(cls, text):
+        template = super().__new__(cls, text)
+        try:
+            parts = list(string.Formatter().parse(text))
+        except ValueError:
+            # 正規表現など、差し込み項目の書式でない波括弧を含む文字列
+            parts = [(text, None, None, None)]
+        template.fields = frozenset(field_name for _, field_name, _, _ in parts if field_name)
+        # 属性・添字の参照や入れ子の書式を含む差し込み項目は、str.format_mapに任せる
+        if any(
+            field_name is not None and (not field_name.isidentifier() or "{" in format_spec)
+            for _, field_name, format_spec, _ in parts
+        ):
+            parts = None
+        template.parts = parts
+        return template
+
+    def render(self, **kwargs):
+        """
+        差し込み項目を埋めた文字列を取得
+
+        Args:
+            kwargs: 差し込む値
+        """
+        if not self.fields:
+            return str(self)
+        if self.parts is None:
+            return self.format_map(kwargs)
+        pieces = []
+        for literal, field_name, format_spec, conversion in self.parts:
+            pieces.append(literal)
+            if field_name is None:
+                continue
+            value = kwargs[field_name]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "s":
+                value = str(value)
+            elif conversion == "a":
+                value = ascii(value)
+            pieces.append(format(value, format_spec))
+        return "".join(pieces)
+
+
+def _load_text_tables():
+    """
+    全言語の定数を、言語ごとの変更不可な辞書（キー: 定数名）として読み込む
+
+    いずれかの言語で定義されているキーが他の言語に無い場合は、起動時にエラーとする
+
+    Returns:
+        言語コードをキー、定数の辞書を値とする辞書
+    """
+    tables = {}
+    for lang in LANGUAGES:
+        lang_constants = importlib.import_module(f"constants_{lang}")
+        table = {}
+        for key, value in vars(lang_constants).items():
+            if not key.isupper():
+                continue
+            if isinstance(value, str):
+                value = TextTemplate(value)
+            elif isinstance(value, dict):
+                value = types.MappingProxyType(value)
+            table[key] = value
+        tables[lang] = table
+
+    all_keys = set().union(*tables.values()) - OPTIONAL_TEXT_KEYS
+    missing = {lang: sorted(all_keys - table.keys()) for lang, table in tables.items()}
+    missing = {lang: keys for lang, keys in missing.items() if keys}
+    if missing:
+        raise KeyError(f"言語ファイルに未定義のキーがあります: {missing}")
+
+    return types.MappingProxyType({lang: types.MappingProxyType(table) for lang, table in tables.items()})
+
+# 言語ごとの定数表（起動時に1度だけ作成）
+TEXT_TABLES = _load_text_tables()
+
+def get_text(key, lang=None):
     """
     指定されたキーの多言語テキストを取得
+
+    Args:
+        key: 定数名
+        lang: 言語コード（未指定の場合はセッション状態の言語）
     """
-    lang_constants = get_language_constants()
-    return getattr(lang_constants, key, f"[Missing: {key}]")
+    if lang is None:
+        lang = st.session_state.get('language', 'ja')
+    table = TEXT_TABLES.get(lang) or TEXT_TABLES['ja']
+    try:
+        return table[key]
+    except KeyError:
+        return f"[Missing: {key}]"
 
 def get_formatted_text(key, **kwargs):
     """
     フォーマット付きテキストを取得
     """
     text = get_text(key)
-    if kwargs:
-        if 'max_tokens' in text:
-            kwargs['max_tokens'] = MAX_ALLOWED_TOKENS
-        return text.format(**kwargs)
-    return text
+    if not kwargs or not isinstance(text, TextTemplate):
+        return text
+    if 'max_tokens' in text.fields:
+        kwargs['max_tokens'] = MAX_ALLOWED_TOKENS
+    return text.render(**kwargs)
 
 def get_current_style():
     """
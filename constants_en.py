@@ -2,12 +2,6 @@
 英語の定数定義ファイル
 """
 
-############################################################
-# ライブラリの読み込み
-############################################################
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.document_loaders import UnstructuredExcelLoader
-
 ############################################################
 # 英語定数の定義
 ############################################################
@@ -36,12 +30,15 @@ CONTACT_MODE_BOT_INTRODUCTION_TEXT = "This is a generative AI chatbot that answe
 CONTACT_MODE_BOT_SPECIFICITY_TEXT = "When the inquiry mode is turned off, the inquiry chatbot will still answer your questions."
 CONTACT_MODE_OFF = "OFF (Use as AI chatbot)"
 CONTACT_MODE_ON = "ON (Direct inquiry to staff)"
+CONVERSATION_LOG_LOAD_OLDER_BUTTON = "Show earlier messages ({count} more turns)"
 
 # ==========================================
 # プロンプトテンプレート
 # ==========================================
 SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT = "Based on conversation history and latest input, generate independent input text that can be understood without conversation history."
 NO_DOC_MATCH_MESSAGE = "The information necessary for an answer was not found. Please change your construction-related question and send it again."
+# Demonstratives and connectives that make a question depend on the conversation history
+REWRITE_REFERENCE_PATTERN = r"\b(it|its|that|those|these|they|them|there|this one|same|above|previous|earlier|else|also|too)\b|^(and|so|then|what about|how about)\b"
 
 SYSTEM_PROMPT_INQUIRY = """You are an assistant that responds to inquiries from residents at construction sites based on specifications and construction plans.
 Please respond to user input based on the following conditions, and answer in ENGLISH.
@@ -118,4 +115,12 @@ SUPPORTED_LANGUAGES = {
 # ==========================================
 THEME_TOGGLE_HEADER = "## 🎨 Theme Toggle"
 DARK_MODE_BUTTON = "🌙 Dark Mode"
-LIGHT_MODE_BUTTON = "☀️ Light Mode"
\ No newline at end of file
+LIGHT_MODE_BUTTON = "☀️ Light Mode"
+# ==========================================
+# メトリクス（管理者用）
+# ==========================================
+METRICS_HEADER = "## 📊 Metrics (admin)"
+METRICS_STAGE_CAPTION = "Duration per stage (seconds)"
+METRICS_VALUE_CAPTION = "Token and retrieved-chunk counts"
+METRICS_GAUGE_CAPTION = "Cache, limiter and outbox status"
+METRICS_DOWNLOAD_BUTTON = "Download in Prometheus format"
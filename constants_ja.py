@@ -2,12 +2,6 @@
 日本語の定数定義ファイル
 """
 
-############################################################
-# ライブラリの読み込み
-############################################################
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.document_loaders import UnstructuredExcelLoader
-
 ############################################################
 # 日本語定数の定義
 ############################################################
@@ -36,12 +30,15 @@ CONTACT_MODE_BOT_INTRODUCTION_TEXT = "こちらは本工事に関する質問に
 CONTACT_MODE_BOT_SPECIFICITY_TEXT = "問い合わせモードをOFFにした状態で質問すると、問い合わせチャットボットが質問に答えてくれます。"
 CONTACT_MODE_OFF = "OFF（AIチャットボットとして利用）"
 CONTACT_MODE_ON = "ON（担当者に直接問い合わせ）"
+CONVERSATION_LOG_LOAD_OLDER_BUTTON = "以前の会話を表示（残り{count}往復）"
 
 # ==========================================
 # プロンプトテンプレート
 # ==========================================
 SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT = "会話履歴と最新の入力をもとに、会話履歴なしでも理解できる独立した入力テキストを生成してください。"
 NO_DOC_MATCH_MESSAGE = "回答に必要な情報が見つかりませんでした。工事に関する質問を変えて送信してください。"
+# 会話履歴を踏まえた書き換えが必要な質問とみなす指示語・接続表現
+REWRITE_REFERENCE_PATTERN = r"それ|その|そこ|そちら|あれ|あの|さっき|先ほど|前の|上記|同じ|他に|ほかに|^(では|じゃあ|で、|あと|それと|ちなみに)"
 
 SYSTEM_PROMPT_INQUIRY = """あなたは仕様書と施工計画書を基に、工事現場の住民様からの問い合わせに対応するアシスタントです。
 以下の条件に基づき、ユーザー入力に対して必ず日本語で回答してください。
@@ -107,4 +104,12 @@ SUPPORTED_LANGUAGES = {
 # ==========================================
 THEME_TOGGLE_HEADER = "## 🎨 テーマ切り替え"
 DARK_MODE_BUTTON = "🌙 ダークモード"
-LIGHT_MODE_BUTTON = "☀️ ライトモード"
\ No newline at end of file
+LIGHT_MODE_BUTTON = "☀️ ライトモード"
+# ==========================================
+# メトリクス（管理者用）
+# ==========================================
+METRICS_HEADER = "## 📊 メトリクス（管理者用）"
+METRICS_STAGE_CAPTION = "処理段階ごとの所要時間（秒）"
+METRICS_VALUE_CAPTION = "トークン数・検索件数"
+METRICS_GAUGE_CAPTION = "キャッシュ・送信キューなどの状態"
+METRICS_DOWNLOAD_BUTTON = "Prometheus形式でダウンロード"
@@ -0,0 +1,199 @@
+"""
+このファイルは、検索したチャンクから回答生成のプロンプトに入れるコンテキストを組み立てる処理が記述されたファイルです。
+関連度の低いチャンクと、他のチャンクと内容の重なるチャンク（部分）を取り除き、
+tiktokenで数えたトークン数が上限に収まるだけのチャンクを、検索順位の高い順に採用します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+from langchain_core.documents import Document
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 重複判定に使う文字n-gramの長さ（日本語は分かち書きせずに比較できるよう、文字単位とする）
+SHINGLE_SIZE = 5
+# チャンク同士の境界の重なり（チャンク分割時のオーバーラップ）とみなす最小の文字数
+MIN_BOUNDARY_OVERLAP = 20
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ContextPacker:
+    """
+    トークン数の上限に収まるよう、検索したチャンクを選んで回答生成のコンテキストを組み立てる
+
+    ・ベクトル検索の関連度が閾値未満で、BM25検索でも内容語が一致していないチャンクは除く
+    ・採用済みのチャンクとほぼ同じ内容のチャンクは除き、境界で重なる部分は切り詰める
+    ・検索順位の高い順に、トークン数の上限に収まるチャンクのみを採用する
+      （最初に採用するチャンクが単独で上限を超える場合は、上限まで切り詰めて採用する）
+    """
+
+    def __init__(self, enc, token_budget=ct.CONTEXT_TOKEN_BUDGET,
+                 min_vector_score=ct.CONTEXT_MIN_VECTOR_SCORE,
+                 duplicate_threshold=ct.CONTEXT_DUPLICATE_THRESHOLD):
+        """
+        Args:
+            enc: トークン数を数えるtiktokenのエンコーダー
+            token_budget: コンテキスト全体のトークン数の上限
+            min_vector_score: 採用するチャンクのベクトル検索の関連度の下限
+            duplicate_threshold: 採用済みのチャンクと重複するとみなす、文字n-gramの含有率の下限
+        """
+        self.enc = enc
+        self.token_budget = token_budget
+        self.min_vector_score = min_vector_score
+        self.duplicate_threshold = duplicate_threshold
+        self.queries = 0
+        self.retrieved_tokens = 0
+        self.packed_tokens = 0
+        self.dropped_low_score = 0
+        self.dropped_duplicate = 0
+        self.dropped_over_budget = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def pack(self, docs):
+        """
+        検索したチャンクから、回答生成に渡すチャンクを選ぶ
+
+        Args:
+            docs: 検索順位の高い順に並んだチャンクのリスト
+
+        Returns:
+            (採用したチャンクのリスト, 選択の内訳の辞書)
+        """
+        retrieved_tokens = sum(self.count_tokens(doc.page_content) for doc in docs)
+        packed = []
+        packed_tokens = 0
+        packed_shingles = set()
+        dropped = {"low_score": 0, "duplicate": 0, "over_budget": 0}
+        truncated = 0
+
+        for rank, doc in enumerate(docs):
+            # 最上位のチャンクは、関連度にかかわらず残す
+            if rank > 0 and not self._is_relevant(doc):
+                dropped["low_score"] += 1
+                continue
+
+            shingles = _shingles(doc.page_content)
+            if shingles and len(shingles & packed_shingles) / len(shingles) >= self.duplicate_threshold:
+                dropped["duplicate"] += 1
+                continue
+
+            text = doc.page_content
+            for selected in packed:
+                text = _trim_boundary_overlap(text, selected.page_content)
+            tokens = self.count_tokens(text)
+            # 最初に採用するチャンクが単独で上限を超える場合は、情報源の無いまま回答生成しないよう上限まで切り詰めて採用する
+            if not packed and tokens > self.token_budget:
+                text = self._truncate(text)
+                tokens = self.count_tokens(text)
+                truncated += 1
+            # 上限を超えるチャンクは飛ばし、より短い下位のチャンクが収まれば採用する
+            if packed_tokens + tokens > self.token_budget:
+                dropped["over_budget"] += 1
+                continue
+
+            if text != doc.page_content:
+                doc = Document(page_content=text, metadata=dict(doc.metadata), id=doc.id)
+            packed.append(doc)
+            packed_tokens += tokens
+            packed_shingles |= shingles
+
+        with self._lock:
+            self.queries += 1
+            self.retrieved_tokens += retrieved_tokens
+            self.packed_tokens += packed_tokens
+            self.dropped_low_score += dropped["low_score"]
+            self.dropped_duplicate += dropped["duplicate"]
+            self.dropped_over_budget += dropped["over_budget"]
+            self.truncated += truncated
+
+        summary = {
+            "retrieved_chunks": len(docs),
+            "packed_chunks": len(packed),
+            "retrieved_tokens": retrieved_tokens,
+            "packed_tokens": packed_tokens,
+            "saved_tokens": retrieved_tokens - packed_tokens,
+            **{f"dropped_{reason}": count for reason, count in dropped.items()},
+            "truncated": truncated,
+        }
+        return packed, summary
+
+    def count_tokens(self, text):
+        return len(self.enc.encode(text))
+
+    def stats(self):
+        """
+        コンテキストの組み立ての集計（プロセス起動後の累計）
+        """
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "retrieved_tokens": self.retrieved_tokens,
+                "packed_tokens": self.packed_tokens,
+                "saved_tokens": self.retrieved_tokens - self.packed_tokens,
+                "dropped_low_score": self.dropped_low_score,
+                "dropped_duplicate": self.dropped_duplicate,
+                "dropped_over_budget": self.dropped_over_budget,
+                "truncated": self.truncated,
+            }
+
+    def _truncate(self, text):
+        """
+        テキストをトークン数の上限まで切り詰める（トークンの途中で切れた文字は取り除く）
+        """
+        text = self.enc.decode(self.enc.encode(text)[:self.token_budget]).rstrip("\ufffd")
+        # 文字の取り除きで上限を超えないよう、収まるまで末尾を削る
+        while text and self.count_tokens(text) > self.token_budget:
+            text = text[:-1]
+        return text
+
+    def _is_relevant(self, doc):
+        """
+        チャンクの関連度が十分かどうかを判定（BM25検索で内容語が一致したチャンクは、表記の一致を重視して残す）
+        """
+        if doc.metadata.get("lexical_content_match"):
+            return True
+        score = doc.metadata.get("vector_score")
+        return score is None or score >= self.min_vector_score
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _shingles(text):
+    """
+    空白を除いたテキストの文字n-gramの集合を取得
+    """
+    text = "".join(text.split())
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def _trim_boundary_overlap(text, selected):
+    """
+    採用済みのチャンクと境界で重なる部分（チャンク分割時のオーバーラップ）を切り詰める
+
+    Args:
+        text: 切り詰める対象のチャンク本文
+        selected: 採用済みのチャンク本文
+
+    Returns:
+        切り詰めた本文
+    """
+    # オーバーラップはチャンク分割時のCHUNK_OVERLAP文字以内のため、それより長い重なりは探さない
+    limit = min(len(text) - 1, len(selected) - 1, ct.CHUNK_OVERLAP)
+    # 採用済みのチャンクの末尾と、対象のチャンクの先頭が重なる場合
+    for size in range(limit, MIN_BOUNDARY_OVERLAP - 1, -1):
+        if selected.endswith(text[:size]):
+            return text[size:].lstrip()
+    # 対象のチャンクの末尾と、採用済みのチャンクの先頭が重なる場合
+    for size in range(limit, MIN_BOUNDARY_OVERLAP - 1, -1):
+        if text.endswith(selected[:size]):
+            return text[:-size].rstrip()
+    return text
@@ -0,0 +1,226 @@
+"""
+このファイルは、チャンクの埋め込みベクトルをディスク上にキャッシュする処理が記述されたファイルです。
+（埋め込みモデル名, 正規化したテキストのハッシュ）をキーにSQLiteへ保存し、
+同じテキストを再度埋め込む際はOpenAIへの問い合わせを省略します。
+質問文（検索文）のベクトルはチャンクのベクトルを押し出さないよう、ディスクには保存せず直近の分のみメモリに保持します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# SQLiteの1クエリで扱うキー数の上限（SQLITE_MAX_VARIABLE_NUMBERより小さい値）
+SQLITE_BATCH_SIZE = 500
+
+
+############################################################
+# クラス定義
+############################################################
+
+class EmbeddingCache:
+    """
+    埋め込みベクトルのディスクキャッシュ（SQLite）
+
+    件数が上限を超えた場合は、最後に使われた日時が古いものから削除する（LRU）
+    """
+
+    def __init__(self, path, max_entries):
+        """
+        Args:
+            path: SQLiteファイルのパス
+            max_entries: 保持する最大件数
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+
+    def get_many(self, keys):
+        """
+        キーに対応するベクトルを取得
+
+        Args:
+            keys: キャッシュキーのリスト
+
+        Returns:
+            ベクトルのリスト（キャッシュに無いキーはNone）
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                # 使われたキーの最終利用日時を更新（LRU用）
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys, vectors):
+        """
+        ベクトルを保存し、上限件数を超えた分を古い順に削除
+
+        Args:
+            keys: キャッシュキーのリスト
+            vectors: ベクトルのリスト
+        """
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in zip(keys, vectors)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+
+    def stats(self):
+        """
+        ヒット数・ミス数などの統計情報を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    埋め込みモデルをラップし、キャッシュに無いテキストのみを埋め込むEmbeddings
+    """
+
+    def __init__(self, embeddings, cache, model_name=None, max_queries=ct.EMBEDDING_QUERY_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            embeddings: ラップする埋め込みモデル
+            cache: EmbeddingCacheのインスタンス
+            model_name: キャッシュキーに含めるモデル名（未指定の場合は埋め込みモデルから取得）
+            max_queries: メモリに保持する質問文のベクトルの最大件数
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.max_queries = max_queries
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        keys = [self.cache_key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # キャッシュに無いテキストのみ、重複を除いてまとめて埋め込む
+        missing = {}
+        for index, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[index], texts[index])
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing), new_vectors)
+            computed = dict(zip(missing, new_vectors))
+            vectors = [
+                vector if vector is not None else computed[key]
+                for key, vector in zip(keys, vectors)
+            ]
+        return vectors
+
+    def embed_query(self, text):
+        # 質問文はほとんどが1度きりのため、ディスクキャッシュには書き込まない
+        # （1回の問い合わせで回答キャッシュの確認と検索に同じ質問文を使うため、直近の分のみメモリに保持する）
+        key = self.cache_key(text)
+        with self._queries_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                return vector
+        vector = self.embeddings.embed_query(text)
+        with self._queries_lock:
+            self._queries[key] = vector
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        return vector
+
+    def cache_key(self, text):
+        """
+        （モデル名, 正規化したテキスト）のハッシュ値をキャッシュキーとして取得
+
+        Args:
+            text: 埋め込み対象のテキスト
+
+        Returns:
+            キャッシュキー
+        """
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+############################################################
+# 関数定義
+############################################################
+
+def normalize_text(text):
+    """
+    キャッシュキー用にテキストを正規化（Unicode正規化・空白の統一）
+
+    Args:
+        text: 正規化対象のテキスト
+
+    Returns:
+        正規化したテキスト
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
@@ -0,0 +1,148 @@
+"""
+このファイルは、Excelファイル（.xlsx）を表の構造を保ったまま読み込むdata loaderが記述されたファイルです。
+openpyxlの読み取り専用モードで行を順に読み、シートごと・表（空行で区切られた範囲）ごとに、
+チャンクサイズに収まるだけの行をまとめて1つのドキュメントにします。各ドキュメントの先頭には
+シート名と表の見出し行を付け、メタデータにはシート名とセル範囲を記録します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import datetime
+from typing import Iterator
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 1行内のセルの区切り
+CELL_SEPARATOR = " | "
+
+
+############################################################
+# クラス定義
+############################################################
+
+class ExcelTableLoader(BaseLoader):
+    """
+    シート・表ごとに、チャンクサイズに収まるだけの行をまとめて読み込むExcelのdata loader
+    """
+
+    def __init__(self, file_path, chunk_size=ct.CHUNK_SIZE, region_gap_rows=ct.EXCEL_REGION_GAP_ROWS):
+        """
+        Args:
+            file_path: Excelファイルのパス
+            chunk_size: 1ドキュメントの最大文字数（見出しを含む）
+            region_gap_rows: 表の区切りとみなす連続した空行の数
+        """
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.region_gap_rows = region_gap_rows
+
+    def lazy_load(self) -> Iterator[Document]:
+        # 読み取り専用モードでは、ワークブック全体をメモリに展開せず行を順に読み込む
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            for sheet_index, sheet in enumerate(workbook.worksheets):
+                if sheet.sheet_state != "visible":
+                    continue
+                for region in self._iter_regions(sheet):
+                    yield from self._pack_region(sheet.title.strip(), sheet_index + 1, region)
+        finally:
+            workbook.close()
+
+    def _iter_regions(self, sheet):
+        """
+        空行で区切られた表ごとに、値のある行の一覧を取得
+
+        Yields:
+            [(行番号, [(列番号, 値の文字列), ...]), ...]
+        """
+        region = []
+        blank_rows = 0
+        for row in sheet.iter_rows():
+            # 値の無いセル（読み取り専用モードのEmptyCell）は行・列番号を持たないため、値のあるセルのみ扱う
+            cells = [
+                (cell.row, cell.column, text)
+                for cell in row
+                if cell.value is not None and (text := _format_value(cell.value))
+            ]
+            if not cells:
+                blank_rows += 1
+                if region and blank_rows >= self.region_gap_rows:
+                    yield region
+                    region = []
+                continue
+            blank_rows = 0
+            region.append((cells[0][0], [(column, text) for _, column, text in cells]))
+        if region:
+            yield region
+
+    def _pack_region(self, sheet_name, sheet_number, region):
+        """
+        1つの表の行を、見出しを付けてチャンクサイズに収まるドキュメントにまとめる
+        """
+        # 表の先頭行を見出しとし、分割後のすべてのドキュメントの先頭に付けて文脈を保つ
+        header_row, header_cells = region[0]
+        context = f"[{sheet_name}] {_join_cells(header_cells)}"
+        # 見出し行のみの表は、見出し行をそのまま本文とする
+        body = region[1:] or region
+
+        rows = []
+        size = len(context)
+        for row_number, cells in body:
+            line = _join_cells(cells)
+            if rows and size + 1 + len(line) > self.chunk_size:
+                yield self._create_document(sheet_name, sheet_number, header_row, context, rows)
+                rows = []
+                size = len(context)
+            rows.append((row_number, cells, line))
+            size += 1 + len(line)
+        if rows:
+            yield self._create_document(sheet_name, sheet_number, header_row, context, rows)
+
+    def _create_document(self, sheet_name, sheet_number, header_row, context, rows):
+        # セル範囲は本文の行の範囲（見出し行は header_row に記録）
+        first_row = rows[0][0]
+        last_row = rows[-1][0]
+        columns = [column for _, cells, _ in rows for column, _ in cells]
+        cell_range = (
+            f"{get_column_letter(min(columns))}{first_row}:"
+            f"{get_column_letter(max(columns))}{last_row}"
+        )
+        lines = [line for row_number, _, line in rows if row_number != header_row]
+        return Document(
+            page_content="\n".join([context] + lines),
+            metadata={
+                "source": self.file_path,
+                "filename": os.path.basename(self.file_path),
+                "page_name": sheet_name,
+                "page_number": sheet_number,
+                "cell_range": cell_range,
+                "header_row": header_row,
+                "category": "Table",
+            },
+        )
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _format_value(value):
+    """
+    セルの値を文字列に変換（整数値の小数点以下や、セル内の改行・前後の空白は取り除く）
+    """
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=" ")
+    return " ".join(str(value).split())
+
+def _join_cells(cells):
+    return CELL_SEPARATOR.join(text for _, text in cells)
@@ -0,0 +1,346 @@
+"""
+このファイルは、RAG参照用データのインデックス（ベクターストア）作成に関する関数定義のファイルです。
+ファイル・チャンク単位のハッシュをマニフェストに記録し、追加・変更・削除されたファイルの分だけ差分更新します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from langchain.text_splitter import CharacterTextSplitter
+from langchain_chroma import Chroma
+import utils
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# ファイルハッシュ計算時の読み込みサイズ
+HASH_READ_SIZE = 1024 * 1024
+
+
+############################################################
+# 関数定義
+############################################################
+
+def create_vectorstore(db_name, embeddings, source_path=None):
+    """
+    引数として渡されたDBを読み込み、RAG化対象のデータとの差分のみを反映する
+
+    Args:
+        db_name: RAG化対象のデータを格納するデータベース名
+        embeddings: 埋め込みモデル
+        source_path: RAG化対象のデータを格納するフォルダ（未指定の場合、全データ用DBのみ「data」フォルダを参照）
+
+    Returns:
+        Chromaのベクターストア
+    """
+    if source_path is None and db_name == ct.DB_ALL_PATH:
+        source_path = ct.RAG_TOP_FOLDER_PATH
+
+    db = Chroma(persist_directory=db_name, embedding_function=embeddings)
+    if source_path:
+        sync_vectorstore(db, db_name, source_path)
+    return db
+
+def sync_vectorstore(db, db_name, source_path):
+    """
+    マニフェストと現在のファイルを比較し、ベクターストアを差分更新
+
+    ・追加・変更されたファイルのみ読み込み、未登録のチャンクだけを埋め込む
+    ・変更後に存在しなくなったチャンク、削除されたファイルのチャンクは削除する
+
+    Args:
+        db: Chromaのベクターストア
+        db_name: データベース名（マニフェストの保存先）
+        source_path: RAG化対象のデータを格納するフォルダ
+
+    Returns:
+        差分更新の結果（ファイル数・チャンク数）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    manifest = load_manifest(db_name)
+    if manifest is None:
+        # マニフェストの無い旧形式のDBはチャンクIDを照合できないため、作り直す
+        if db.get(limit=1, include=[])["ids"]:
+            db.reset_collection()
+        manifest = {"files": {}}
+    old_files = manifest["files"]
+    # 読み込み・チャンク分割の方式が変わった場合は、内容が同じファイルも読み込み直す
+    # （チャンクIDは内容から決まるため、変わらなかったチャンクは再埋め込みしない）
+    reload_all = manifest.get("loader_version") != ct.INDEX_LOADER_VERSION
+    manifest["loader_version"] = ct.INDEX_LOADER_VERSION
+
+    current_files = {}
+    for file_path in list_source_files(source_path):
+        key = os.path.relpath(file_path, source_path).replace(os.sep, "/")
+        current_files[key] = (file_path, file_sha256(file_path))
+
+    stats = {"added_chunks": 0, "removed_chunks": 0, "changed_files": 0, "removed_files": 0, "unchanged_files": 0}
+
+    # 削除されたファイルのチャンクを削除
+    for key in [key for key in old_files if key not in current_files]:
+        chunk_ids = old_files.pop(key)["chunk_ids"]
+        if chunk_ids:
+            db.delete(ids=chunk_ids)
+        stats["removed_files"] += 1
+        stats["removed_chunks"] += len(chunk_ids)
+        save_manifest(db_name, manifest)
+
+    # 追加・変更されたファイルのみ読み込む
+    changed = {}
+    for key, (file_path, file_hash) in current_files.items():
+        if not reload_all and old_files.get(key, {}).get("file_hash") == file_hash:
+            stats["unchanged_files"] += 1
+        else:
+            changed[key] = file_path
+
+    for key, chunks in load_chunks(changed).items():
+        chunk_ids = assign_chunk_ids(key, chunks)
+        old_ids = set(old_files.get(key, {}).get("chunk_ids", []))
+        new_ids = set(chunk_ids)
+
+        removed_ids = [chunk_id for chunk_id in old_ids if chunk_id not in new_ids]
+        if removed_ids:
+            db.delete(ids=removed_ids)
+        added = [chunk for chunk in chunks if chunk.id not in old_ids]
+        if added:
+            db.add_documents(added, ids=[chunk.id for chunk in added])
+
+        old_files[key] = {"file_hash": current_files[key][1], "chunk_ids": chunk_ids}
+        save_manifest(db_name, manifest)
+        stats["changed_files"] += 1
+        stats["added_chunks"] += len(added)
+        stats["removed_chunks"] += len(removed_ids)
+
+    logger.info({"message": "index synchronized", "db_name": db_name, **stats})
+    return stats
+
+def list_source_files(source_path):
+    """
+    RAG化対象のファイル一覧を取得（「data」フォルダ直下の各フォルダ内のファイル）
+
+    Args:
+        source_path: RAG化対象のデータを格納するフォルダ
+
+    Returns:
+        読み込み対象のファイルパスのリスト
+    """
+    file_paths = []
+    if not os.path.isdir(source_path):
+        return file_paths
+    for folder in os.listdir(source_path):
+        if folder.startswith("."):
+            continue
+        folder_path = f"{source_path}/{folder}"
+        if not os.path.isdir(folder_path):
+            continue
+        for file in os.listdir(folder_path):
+            # 想定していたファイル形式の場合のみ読み込む
+            if os.path.splitext(file)[1] in ct.SUPPORTED_EXTENSIONS:
+                file_paths.append(f"{folder_path}/{file}")
+    return file_paths
+
+def iter_loaded_files(file_paths, max_workers=None):
+    """
+    ファイルを読み込み、読み込みが終わったものから順に返す
+
+    PDFやExcelの解析はCPU負荷が高いため、複数ファイルの場合はプロセスプールで並列に読み込む
+
+    Args:
+        file_paths: ファイルパスのリスト
+        max_workers: 読み込みに使うプロセス数（未指定の場合はLOADER_MAX_WORKERS）
+
+    Yields:
+        (ファイルパスのリスト上の位置, 読み込んだドキュメントのリスト)
+    """
+    if max_workers is None:
+        max_workers = ct.LOADER_MAX_WORKERS or os.cpu_count() or 1
+    max_workers = min(max_workers, len(file_paths))
+
+    # 1ファイルのみ、または1プロセス指定の場合はプロセスを起動せずに読み込む
+    if max_workers <= 1:
+        for index, file_path in enumerate(file_paths):
+            yield index, load_file(file_path)
+        return
+
+    # ファイル単位で並列に読み込むため、プール内ではPDFのページ単位の並列抽出は行わない
+    # （プロセスプールのワーカーはデーモンプロセスではないため、指定しないとワーカーごとにプロセスプールを起動してしまう）
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_process_context()) as executor:
+        futures = {
+            executor.submit(load_file, file_path, 1): index
+            for index, file_path in enumerate(file_paths)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def get_process_context():
+    """
+    プロセスプールの起動方式を取得
+
+    インデックス作成はStreamlitのサーバー内で、複数のスレッド（イベントループ・ログ出力・送信キューなど）が
+    動いている状態から呼び出されるため、それらのロック状態を複製してしまうforkは使わない
+
+    Returns:
+        multiprocessingのコンテキスト（forkserverが使えない環境ではspawn）
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def load_file(file_path, max_workers=None):
+    """
+    ファイルの拡張子に合ったdata loaderを使ってデータ読み込み
+
+    Args:
+        file_path: ファイルのパス
+        max_workers: ファイル内の並列抽出に使うプロセス数（未指定の場合はLOADER_MAX_WORKERS）
+
+    Returns:
+        読み込んだドキュメントのリスト
+    """
+    file_extension = os.path.splitext(file_path)[1]
+    loader = ct.SUPPORTED_EXTENSIONS[file_extension](file_path, max_workers=max_workers)
+    docs = loader.load()
+    # OSがWindowsの場合、Unicode正規化と、cp932（Windows用の文字コード）で表現できない文字を除去
+    for doc in docs:
+        doc.page_content = utils.adjust_string(doc.page_content)
+        for key in doc.metadata:
+            doc.metadata[key] = utils.adjust_string(doc.metadata[key])
+    return docs
+
+def load_chunks(file_paths, max_workers=None):
+    """
+    ファイルを読み込み、チャンクに分割
+
+    読み込みが終わったファイルから順にチャンク分割し、結果は引数の順序で返す
+
+    Args:
+        file_paths: マニフェスト上のキーとファイルパスの辞書
+        max_workers: 読み込みに使うプロセス数（未指定の場合はLOADER_MAX_WORKERS）
+
+    Returns:
+        マニフェスト上のキーとチャンクのリストの辞書
+    """
+    text_splitter = CharacterTextSplitter(
+        chunk_size=ct.CHUNK_SIZE,
+        chunk_overlap=ct.CHUNK_OVERLAP,
+        separator="\n",
+    )
+    keys = list(file_paths)
+    chunks_by_index = {}
+    for index, docs in iter_loaded_files([file_paths[key] for key in keys], max_workers):
+        chunks_by_index[index] = text_splitter.split_documents(docs)
+    return {key: chunks_by_index[index] for index, key in enumerate(keys)}
+
+def assign_chunk_ids(key, chunks):
+    """
+    チャンクの内容とメタデータのハッシュから決定的なIDを付与
+
+    内容が変わらないチャンクは再作成しても同じIDになるため、再埋め込みが不要になる
+
+    Args:
+        key: マニフェスト上のファイルのキー
+        chunks: チャンクのリスト
+
+    Returns:
+        付与したIDのリスト
+    """
+    chunk_ids = []
+    seen = {}
+    for chunk in chunks:
+        chunk_hash = hashlib.sha256(
+            json.dumps(
+                [key, chunk.page_content, chunk.metadata],
+                ensure_ascii=False,
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+        # 同一ファイル内に全く同じチャンクがある場合は連番で区別
+        count = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = count + 1
+        chunk.id = chunk_hash if count == 0 else f"{chunk_hash}-{count}"
+        chunk_ids.append(chunk.id)
+    return chunk_ids
+
+def file_sha256(file_path):
+    """
+    ファイル内容のハッシュ値を取得
+
+    Args:
+        file_path: ファイルのパス
+
+    Returns:
+        SHA-256のハッシュ値（16進数文字列）
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(db_name):
+    """
+    マニフェストの読み込み
+
+    Args:
+        db_name: データベース名
+
+    Returns:
+        マニフェスト（未作成の場合はNone）
+    """
+    manifest_path = os.path.join(db_name, ct.INDEX_MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, encoding="utf8") as f:
+        return json.load(f)
+
+def save_manifest(db_name, manifest):
+    """
+    マニフェストの保存（書き込み途中で中断しても壊れないよう、一時ファイルから置き換える）
+
+    Args:
+        db_name: データベース名
+        manifest: マニフェスト
+    """
+    manifest["version"] = compute_index_version(manifest)
+    manifest_path = os.path.join(db_name, ct.INDEX_MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def compute_index_version(manifest):
+    """
+    インデックスのバージョン（全チャンクIDから求めたハッシュ値）を算出
+
+    Args:
+        manifest: マニフェスト
+
+    Returns:
+        インデックスのバージョン
+    """
+    digest = hashlib.sha256()
+    for key in sorted(manifest["files"]):
+        for chunk_id in manifest["files"][key]["chunk_ids"]:
+            digest.update(chunk_id.encode("ascii"))
+    return digest.hexdigest()[:16]
+
+def get_index_version(db_name):
+    """
+    DBのインデックスのバージョンを取得
+
+    Args:
+        db_name: データベース名
+
+    Returns:
+        インデックスのバージョン（マニフェストが無い場合は空文字）
+    """
+    manifest = load_manifest(db_name)
+    return manifest.get("version", "") if manifest else ""
@@ -5,36 +5,27 @@
 ############################################################
 # ライブラリの読み込み
 ############################################################
-import os
+import time
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import threading
 from uuid import uuid4
 import streamlit as st
-import tiktoken
-from langchain_openai import ChatOpenAI
-import utils
 import constants as ct
+from chat_history import ConversationHistory
+from app_logging import setup_logging, bind_context
 
 ############################################################
 # 設定関連
 ############################################################
+# RAGエンジンの事前作成を開始済みかどうかと、その判定を排他制御するロック
+_warmup_started = False
+_warmup_lock = threading.Lock()
 
 
 ############################################################
 # 関数定義
 ############################################################
 
-def _ensure_encoder():
-    if "enc" not in st.session_state:
-        # 使うモデル名（Streamlit secretsから、なければデフォルト値を使用）
-        model = st.secrets.get("OPENAI_MODEL", ct.MODEL)
-        try:
-            # モデルに合うエンコーディングを自動で選ぶ
-            st.session_state["enc"] = tiktoken.encoding_for_model(model)
-        except Exception:
-            # うまく選べなければ汎用のエンコーディングにフォールバック
-            st.session_state["enc"] = tiktoken.get_encoding("cl100k_base")
-
 def initialize():
     """
     画面読み込み時に実行する初期化処理
@@ -43,17 +34,13 @@ def initialize():
     if 'language' not in st.session_state:
         st.session_state.language = 'ja'
     
-    # エンコーダーの初期化
-    _ensure_encoder()
     # 初期化データの用意
     initialize_session_state()
     # ログ出力用にセッションIDを生成
     initialize_session_id()
     # ログ出力の設定
     initialize_logger()
-    # LLMの初期化
-    initialize_llm()
-    # RAGチェーンの初期化
+    # RAGエンジン（LLM・ベクターストア・エンコーダー）の初期化
     initialize_rag_chain()
 
 
@@ -62,10 +49,13 @@ def initialize_session_state():
     初期化データの用意
     """
     if "messages" not in st.session_state:
-        st.session_state.messages = []
-        st.session_state.chat_history = []
-        # 会話履歴の合計トークン数を加算する用の変数
-        st.session_state.total_tokens = 0
+        # 会話履歴（各メッセージのトークン数付き）と、同じものを参照する画面表示用の会話ログ
+        st.session_state.chat_history = ConversationHistory()
+        st.session_state.messages = st.session_state.chat_history.messages
+    
+    # 画面に表示する会話ログの往復数（「以前の会話を表示」ボタンで増やす）
+    if "conversation_log_turns" not in st.session_state:
+        st.session_state.conversation_log_turns = ct.CONVERSATION_LOG_WINDOW_TURNS
     
     # ダークモードの初期化
     if "dark_mode" not in st.session_state:
@@ -82,45 +72,46 @@ def initialize_session_id():
 def initialize_logger():
     """
     ログ出力の設定
+
+    ファイルへの書き込みは専用のスレッドで行い、セッションIDと言語は実行ごとにコンテキストへ設定する
     """
-    os.makedirs(ct.LOG_DIR_PATH, exist_ok=True)
+    setup_logging()
+    bind_context(st.session_state.session_id, st.session_state.language)
 
-    logger = logging.getLogger(ct.LOGGER_NAME)
 
-    if logger.hasHandlers():
-        return
+def initialize_rag_chain():
+    """
+    RAGエンジンの初期化
 
-    log_handler = TimedRotatingFileHandler(
-        os.path.join(ct.LOG_DIR_PATH, ct.LOG_FILE),
-        when="D",
-        encoding="utf8"
-    )
-    formatter = logging.Formatter(
-        f"[%(levelname)s] %(asctime)s line %(lineno)s, in %(funcName)s, session_id={st.session_state.session_id}: %(message)s"
-    )
-    log_handler.setFormatter(formatter)
-    logger.setLevel(logging.INFO)
-    logger.addHandler(log_handler)
+    LLM・ベクターストア・Retriever・エンコーダーはプロセス全体で共有するため、
+    最初のセッションでのみ作成され、以降のセッションでは作成済みのものを使い回す
 
+    作成にはLangChain・Chroma・OpenAIの読み込みを含めて時間がかかるため、最初の画面表示を待たせないよう
+    バックグラウンドのスレッドで作成を開始する（作成中に質問が送信された場合は、作成の完了を待って回答する）
 
-def initialize_llm():
+    作成にはインデックスの差分更新（ベクターストア・マニフェストへの書き込み）を含むため、
+    スレッドはデーモンにせず、サーバーの終了時も書き込みの途中で打ち切られないよう完了を待つ
     """
-    LLMの初期化
-    """
-    if "llm" not in st.session_state:
-        st.session_state.llm = ChatOpenAI(
-            model=ct.MODEL,
-            temperature=ct.TEMPERATURE,
-            streaming=True
-            # StreamlitCallbackHandlerを削除（コンテキストエラーの原因）
-        )
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warm_up_rag_engine, name="rag-engine-warmup", daemon=False).start()
 
 
-def initialize_rag_chain():
+def _warm_up_rag_engine():
     """
-    RAGチェーンの初期化
-    """
-    if "rag_chain" not in st.session_state:
-        st.session_state.rag_chain = utils.create_rag_chain(ct.DB_ALL_PATH)
-
+    RAGエンジンを作成（バックグラウンドのスレッドで実行）
 
+    失敗した場合はログのみ出力し、最初の質問の送信時に改めて作成してエラーを画面に表示する
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    start = time.perf_counter()
+    try:
+        from rag_engine import get_rag_engine
+        get_rag_engine()
+    except Exception:
+        logger.exception({"message": "rag engine warm-up failed"})
+        return
+    logger.info({"message": "rag engine warm-up finished", "seconds": round(time.perf_counter() - start, 3)})
@@ -0,0 +1,323 @@
+"""
+このファイルは、SudachiPyの形態素解析による語彙検索（BM25）と、ベクトル検索との融合検索が記述されたファイルです。
+管径・町名・日付のような表記そのものが重要な検索語は、埋め込みを介さずに転置インデックスで検索します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from typing import Any, List
+from sudachipy import tokenizer, dictionary
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 検索語として扱わない品詞（大分類）
+EXCLUDED_POS = {"補助記号", "空白", "助詞", "助動詞"}
+# 質問と資料が一致したとみなす内容語の品詞（大分類）
+# 「教える」「下さる」「有る」「為る」「どこ」のような、どの質問にも現れる動詞・形容詞・代名詞などは含めない
+CONTENT_POS = {"名詞"}
+# 内容語から除く品詞の細分類（補助的に使われる語）
+NON_CONTENT_POS_DETAIL = "非自立可能"
+# 日本語（ひらがな・カタカナ・漢字）を含むかどうかの判定に使う正規表現
+JAPANESE_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal Rank Fusionの定数
+RRF_C = 60
+
+# SudachiPyのTokenizerはスレッド間で共有できないため、スレッドごとに作成する
+_local = threading.local()
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class LexicalIndex:
+    """
+    SudachiPyで分かち書きしたチャンクの転置インデックス（BM25）
+    """
+
+    def __init__(self, version, ids, texts, metadatas, postings, doc_lengths):
+        """
+        Args:
+            version: 作成元インデックスのバージョン
+            ids: チャンクIDのリスト
+            texts: チャンク本文のリスト
+            metadatas: チャンクのメタデータのリスト
+            postings: 検索語ごとの（チャンク番号, 出現回数）のリスト
+            doc_lengths: チャンクごとの検索語数
+        """
+        self.version = version
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        doc_count = len(doc_lengths)
+        self.idf = {
+            term: math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in postings.items()
+        }
+
+    @classmethod
+    def build(cls, version, ids, texts, metadatas):
+        """
+        チャンクから転置インデックスを作成
+
+        Args:
+            version: 作成元インデックスのバージョン
+            ids: チャンクIDのリスト
+            texts: チャンク本文のリスト
+            metadatas: チャンクのメタデータのリスト
+
+        Returns:
+            LexicalIndexのインスタンス
+        """
+        postings = {}
+        doc_lengths = []
+        for doc_index, text in enumerate(texts):
+            terms = tokenize(text)
+            doc_lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_index, count))
+        return cls(version, ids, texts, metadatas, postings, doc_lengths)
+
+    @classmethod
+    def load(cls, path):
+        """
+        保存済みの転置インデックスを読み込み
+
+        Args:
+            path: 保存先のファイルパス
+
+        Returns:
+            LexicalIndexのインスタンス
+        """
+        with open(path, encoding="utf8") as f:
+            data = json.load(f)
+        postings = {term: [tuple(entry) for entry in posting] for term, posting in data["postings"].items()}
+        return cls(data["version"], data["ids"], data["texts"], data["metadatas"], postings, data["doc_lengths"])
+
+    def save(self, path):
+        """
+        転置インデックスを保存（一時ファイルに書き込んでから置き換える）
+
+        Args:
+            path: 保存先のファイルパス
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                    "postings": self.postings,
+                    "doc_lengths": self.doc_lengths,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+
+    def search(self, query, k):
+        """
+        BM25で検索
+
+        Args:
+            query: 検索文
+            k: 取得件数
+
+        Returns:
+            （チャンク番号, スコア）のリスト（スコアの降順）
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for doc_index, count in posting:
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[doc_index] / self.avg_length
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def content_matches(self, query):
+        """
+        検索文の内容語を含むチャンクを取得
+
+        Args:
+            query: 検索文
+
+        Returns:
+            チャンク番号の集合
+        """
+        return {
+            doc_index
+            for term in set(content_terms(query))
+            for doc_index, _ in self.postings.get(term, ())
+        }
+
+    def get_document(self, doc_index):
+        """
+        チャンク番号に対応するドキュメントを取得
+
+        Args:
+            doc_index: チャンク番号
+
+        Returns:
+            Document
+        """
+        return Document(
+            id=self.ids[doc_index],
+            page_content=self.texts[doc_index],
+            metadata=dict(self.metadatas[doc_index] or {}),
+        )
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    ベクトル検索とBM25検索の結果を、重み付きのReciprocal Rank Fusionで統合するRetriever
+
+    各ドキュメントのメタデータに、ベクトル検索の関連度・BM25スコア・統合スコアを付与する。
+    BM25検索でヒットしたドキュメントのうち、検索文の内容語を含むものには lexical_content_match を付与する
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = ct.TOP_K
+    weights: List[float] = ct.RETRIEVER_WEIGHTS
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        vector_weight, lexical_weight = self.weights
+        fused = {}
+
+        if vector_weight > 0:
+            results = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.k)
+            for rank, (doc, score) in enumerate(results):
+                doc.metadata["vector_score"] = score
+                fused[doc.id] = [doc, vector_weight / (rank + 1 + RRF_C)]
+
+        if lexical_weight > 0 and self.lexical_index is not None:
+            content_matches = self.lexical_index.content_matches(query)
+            for rank, (doc_index, score) in enumerate(self.lexical_index.search(query, self.k)):
+                doc_id = self.lexical_index.ids[doc_index]
+                if doc_id not in fused:
+                    fused[doc_id] = [self.lexical_index.get_document(doc_index), 0.0]
+                fused[doc_id][0].metadata["lexical_score"] = score
+                if doc_index in content_matches:
+                    fused[doc_id][0].metadata["lexical_content_match"] = True
+                fused[doc_id][1] += lexical_weight / (rank + 1 + RRF_C)
+
+        ranked = sorted(fused.values(), key=lambda item: item[1], reverse=True)[:self.k]
+        for doc, fused_score in ranked:
+            doc.metadata["fused_score"] = fused_score
+        return [doc for doc, _ in ranked]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def tokenize(text):
+    """
+    SudachiPyで分かち書きし、検索語のリストを取得
+
+    Args:
+        text: 分かち書き対象のテキスト
+
+    Returns:
+        正規化した検索語のリスト
+    """
+    return [term for term, _ in _analyze(text)]
+
+def content_terms(text):
+    """
+    検索語のうち、質問と資料が一致したかどうかの判定に使う内容語のリストを取得
+
+    Args:
+        text: 分かち書き対象のテキスト
+
+    Returns:
+        正規化した内容語のリスト
+    """
+    return [
+        term
+        for term, part_of_speech in _analyze(text)
+        if part_of_speech[0] in CONTENT_POS and NON_CONTENT_POS_DETAIL not in part_of_speech
+    ]
+
+def is_japanese(text):
+    """
+    テキストが日本語（ひらがな・カタカナ・漢字）を含むかどうかを判定
+    """
+    return JAPANESE_PATTERN.search(text) is not None
+
+def _analyze(text):
+    """
+    SudachiPyで分かち書きし、検索語と品詞の組のリストを取得
+    """
+    sudachi = getattr(_local, "tokenizer", None)
+    if sudachi is None:
+        sudachi = _local.tokenizer = _get_dictionary().create(tokenizer.Tokenizer.SplitMode.A)
+    text = unicodedata.normalize("NFKC", text)
+    terms = []
+    for morpheme in sudachi.tokenize(text):
+        part_of_speech = morpheme.part_of_speech()
+        if part_of_speech[0] not in EXCLUDED_POS:
+            terms.append((morpheme.normalized_form().lower(), part_of_speech))
+    return terms
+
+def _get_dictionary():
+    """
+    SudachiPyの辞書を取得（プロセスで1度だけ読み込む）
+    """
+    global _dictionary
+    if _dictionary is None:
+        with _dictionary_lock:
+            if _dictionary is None:
+                _dictionary = dictionary.Dictionary(dict=ct.SUDACHI_DICT)
+    return _dictionary
+
+def load_or_build_lexical_index(db, db_name, version):
+    """
+    保存済みの転置インデックスを読み込み、インデックスのバージョンが異なる場合のみ作り直す
+
+    Args:
+        db: Chromaのベクターストア（チャンクの取得元）
+        db_name: データベース名（転置インデックスの保存先）
+        version: 現在のインデックスのバージョン
+
+    Returns:
+        LexicalIndexのインスタンス
+    """
+    path = os.path.join(db_name, ct.LEXICAL_INDEX_FILE)
+    if os.path.isfile(path):
+        index = LexicalIndex.load(path)
+        if index.version == version:
+            return index
+
+    data = db.get(include=["documents", "metadatas"])
+    index = LexicalIndex.build(version, data["ids"], data["documents"], data["metadatas"])
+    os.makedirs(db_name, exist_ok=True)
+    index.save(path)
+    return index
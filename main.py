@@ -5,21 +5,20 @@
 ############################################################
 # ライブラリの読み込み
 ############################################################
+import time
 import logging
 import streamlit as st
 import utils
 import traceback
 from initialize import initialize
+from metrics import get_metrics, stage_timer
 import components as cn
 import constants as ct
-from initialize import _ensure_encoder
 
 ############################################################
 # 設定関連
 ############################################################
 
-_ensure_encoder()
-
 # 言語システムの初期化（ページタイトル設定前に実行）
 if 'language' not in st.session_state:
     st.session_state.language = 'ja'
@@ -32,13 +31,16 @@ st.set_page_config(
 )
 
 logger = logging.getLogger(ct.LOGGER_NAME)
+# 画面の実行1回分の所要時間（描画を含む）の計測開始
+script_start = time.perf_counter()
 
 
 ############################################################
 # 初期化処理
 ############################################################
 try:
-    initialize()
+    with stage_timer("initialize"):
+        initialize()
 except Exception as e:
     logger.error(f"{ct.get_text('INITIALIZE_ERROR_MESSAGE')}\n{e}\n{traceback.format_exc()}")
     st.error(utils.build_error_message(ct.get_text('INITIALIZE_ERROR_MESSAGE')) + "\n" + traceback.format_exc(), icon=ct.get_text('ERROR_ICON'))
@@ -91,14 +93,14 @@ if chat_message:
     # 会話履歴の上限を超えた場合、受け付けない
     # ==========================================
     # ユーザーメッセージのトークン数を取得
-    input_tokens = len(st.session_state.enc.encode(chat_message))
+    with stage_timer("count_tokens"):
+        input_tokens = st.session_state.chat_history.count_tokens(chat_message)
+    get_metrics().record_value("input_tokens", input_tokens)
     # トークン数が、受付上限を超えている場合にエラーメッセージを表示
     if input_tokens > ct.MAX_ALLOWED_TOKENS:
         with st.chat_message("assistant", avatar=ct.AI_ICON_FILE_PATH):
             st.error(ct.get_formatted_text('INPUT_TEXT_LIMIT_ERROR_MESSAGE', max_tokens=ct.MAX_ALLOWED_TOKENS))
             st.stop()
-    # トークン数が受付上限を超えていない場合、会話ログ全体のトークン数に加算
-    st.session_state.total_tokens += input_tokens
 
     # ==========================================
     # 1. ユーザーメッセージの表示
@@ -113,29 +115,45 @@ if chat_message:
     # ==========================================
     try:
         if st.session_state.contact_mode == ct.get_text('CONTACT_MODE_OFF'):
-            with st.spinner(ct.get_text('SPINNER_TEXT')):
-                result = utils.execute_chain(chat_message)
+            # 回答を生成されたそばからチャット欄に表示する
+            with st.chat_message("assistant", avatar=ct.AI_ICON_FILE_PATH), stage_timer("chat_turn"):
+                answer_placeholder = st.empty()
+                answer_placeholder.markdown(ct.get_text('SPINNER_TEXT'))
+                result = utils.execute_chain_stream(
+                    chat_message,
+                    lambda text: answer_placeholder.markdown(text + "▌")
+                )
+                answer_placeholder.markdown(result)
         else:
-            with st.spinner(ct.get_text('SPINNER_CONTACT_TEXT')):
+            with st.spinner(ct.get_text('SPINNER_CONTACT_TEXT')), stage_timer("contact_turn"):
                 # Gmail転送機能を使用
                 result = utils.send_inquiry_to_gmail(chat_message)
+            # 問い合わせ結果の表示
+            with st.chat_message("assistant", avatar=ct.AI_ICON_FILE_PATH):
+                st.markdown(result)
     except Exception as e:
         logger.error(f"{ct.get_text('MAIN_PROCESS_ERROR_MESSAGE')}\n{e}\n{traceback.format_exc()}")
         st.error(utils.build_error_message(ct.get_text('MAIN_PROCESS_ERROR_MESSAGE')) + "\n" + traceback.format_exc(), icon=ct.get_text('ERROR_ICON'))
         st.stop()
     
     # ==========================================
-    # 3. 古い会話履歴を削除
-    # ==========================================
-    utils.delete_old_conversation_log(result)
-    # ==========================================
-    # 4. LLMからの回答表示
+    # 3. 会話ログ・会話履歴への追加
     # ==========================================
-    with st.chat_message("assistant", avatar=ct.AI_ICON_FILE_PATH):
-        st.markdown(result)
-    
+    # 問い合わせモードのやり取りは画面表示のみとし、LLMに渡す会話履歴には含めない
+    with stage_timer("count_tokens"):
+        answer_tokens = st.session_state.chat_history.add_turn(
+            chat_message,
+            result,
+            input_tokens=input_tokens,
+            remember=st.session_state.contact_mode == ct.get_text('CONTACT_MODE_OFF')
+        )
+    if answer_tokens is not None:
+        get_metrics().record_value("answer_tokens", answer_tokens)
+
     # ==========================================
-    # 5. 会話ログへの追加
+    # 4. 古い会話履歴を削除
     # ==========================================
-    st.session_state.messages.append({"role": "user", "content": chat_message})
-    st.session_state.messages.append({"role": "assistant", "content": result})
+    utils.delete_old_conversation_log()
+
+# 画面の実行1回分の所要時間を記録（途中でst.stopした場合は記録しない）
+get_metrics().record_duration("script_run", time.perf_counter() - script_start)
@@ -0,0 +1,255 @@
+"""
+このファイルは、チャット1往復の処理段階ごとの所要時間と、トークン数・検索件数などの計測値を集計する処理が記述されたファイルです。
+直近の計測値からp50/p95/p99を求め、各キャッシュ・送信キューなどの統計情報と合わせてPrometheusのテキスト形式で出力します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from app_logging import log_stage
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 出力するパーセンタイル
+QUANTILES = (0.5, 0.95, 0.99)
+# Prometheusのメトリクス名の接頭辞
+METRIC_PREFIX = "rag"
+
+# プロセス共有の集計器と、その生成を排他制御するロック
+_registry = None
+_registry_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class RollingStats:
+    """
+    直近の一定件数の計測値と、起動時からの件数・合計値
+    """
+
+    def __init__(self, window):
+        """
+        Args:
+            window: パーセンタイルの算出に使う直近の件数
+        """
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        """
+        件数・合計値・平均値と、直近の計測値のパーセンタイルを取得
+
+        Returns:
+            統計情報の辞書
+        """
+        values = sorted(self.values)
+        summary = {
+            "count": self.count,
+            "sum": self.total,
+            "avg": self.total / self.count if self.count else 0.0,
+        }
+        for quantile in QUANTILES:
+            summary[f"p{round(quantile * 100)}"] = _percentile(values, quantile)
+        return summary
+
+
+class MetricsRegistry:
+    """
+    処理段階ごとの所要時間・計測値と、統計情報を返す関数（ゲージ）の登録先
+    """
+
+    def __init__(self, window=ct.METRICS_WINDOW):
+        """
+        Args:
+            window: パーセンタイルの算出に使う直近の件数
+        """
+        self.window = window
+        self._durations = {}
+        self._values = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record_duration(self, stage, seconds):
+        """
+        処理段階の所要時間を記録
+
+        Args:
+            stage: 処理段階の名前
+            seconds: 所要時間（秒）
+        """
+        with self._lock:
+            self._get(self._durations, stage).add(seconds)
+
+    def record_value(self, name, value):
+        """
+        トークン数・検索件数などの計測値を記録
+
+        Args:
+            name: 計測値の名前（"input_tokens" / "retrieved_chunks" など）
+            value: 計測値
+        """
+        with self._lock:
+            self._get(self._values, name).add(value)
+
+    def register_gauges(self, name, stats_fn):
+        """
+        統計情報を返す関数を登録（同じ名前で登録した場合は差し替える）
+
+        Args:
+            name: 統計情報の名前（"answer_cache" / "outbox" など）
+            stats_fn: 数値の辞書を返す関数
+        """
+        with self._lock:
+            self._gauges[name] = stats_fn
+
+    def reset(self):
+        """
+        処理段階ごとの所要時間と計測値を消去（登録済みの統計情報の関数は残す）
+
+        負荷試験などで、条件ごとに集計をやり直す場合に使用
+        """
+        with self._lock:
+            self._durations.clear()
+            self._values.clear()
+
+    def snapshot(self):
+        """
+        現在の集計結果を取得
+
+        Returns:
+            {"durations": 処理段階ごとの統計, "values": 計測値ごとの統計, "gauges": 統計情報}
+        """
+        with self._lock:
+            durations = {stage: stats.summary() for stage, stats in self._durations.items()}
+            values = {name: stats.summary() for name, stats in self._values.items()}
+            gauges = dict(self._gauges)
+        return {
+            "durations": durations,
+            "values": values,
+            "gauges": {name: _numeric(stats_fn()) for name, stats_fn in gauges.items()},
+        }
+
+    def render_prometheus(self):
+        """
+        集計結果をPrometheusのテキスト形式で取得
+
+        Returns:
+            Prometheusのテキスト形式の文字列
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Duration of each chat turn stage.")
+        lines.append(f"# TYPE {name} summary")
+        for stage, summary in sorted(snapshot["durations"].items()):
+            lines.extend(_summary_lines(name, {"stage": stage}, summary))
+
+        for value_name, summary in sorted(snapshot["values"].items()):
+            name = f"{METRIC_PREFIX}_{_metric_name(value_name)}"
+            lines.append(f"# TYPE {name} summary")
+            lines.extend(_summary_lines(name, {}, summary))
+
+        for gauge_name, stats in sorted(snapshot["gauges"].items()):
+            for key, value in sorted(stats.items()):
+                name = f"{METRIC_PREFIX}_{_metric_name(gauge_name)}_{_metric_name(key)}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def _get(self, stats_by_name, name):
+        stats = stats_by_name.get(name)
+        if stats is None:
+            stats = stats_by_name[name] = RollingStats(self.window)
+        return stats
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_metrics():
+    """
+    プロセス共有の集計器を取得（未作成の場合のみ作成）
+
+    Returns:
+        MetricsRegistryのインスタンス
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+@contextmanager
+def stage_timer(stage):
+    """
+    ブロックの所要時間を処理段階の所要時間として記録し、ブロック内のログに処理段階を付与する
+
+    Args:
+        stage: 処理段階の名前
+    """
+    start = time.perf_counter()
+    try:
+        with log_stage(stage):
+            yield
+    finally:
+        get_metrics().record_duration(stage, time.perf_counter() - start)
+
+def _percentile(values, quantile):
+    """
+    昇順に並んだ計測値のパーセンタイルを取得（最近傍法）
+    """
+    if not values:
+        return 0.0
+    index = min(int(quantile * len(values)), len(values) - 1)
+    return values[index]
+
+def _numeric(stats):
+    """
+    統計情報のうち数値の項目のみを取得
+    """
+    return {
+        key: value for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+def _summary_lines(name, labels, summary):
+    """
+    Prometheusのsummary形式の行を作成
+    """
+    lines = []
+    for quantile in QUANTILES:
+        quantile_labels = {**labels, "quantile": str(quantile)}
+        lines.append(f"{name}{_format_labels(quantile_labels)} {_format_number(summary[f'p{round(quantile * 100)}'])}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(summary['sum'])}")
+    lines.append(f"{name}_count{_format_labels(labels)} {summary['count']}")
+    return lines
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+def _format_number(value):
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
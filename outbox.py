@@ -0,0 +1,382 @@
+"""
+このファイルは、問い合わせメールを送信キュー（SQLite）に保存し、バックグラウンドで送信する処理が記述されたファイルです。
+問い合わせはキューへの保存が終わった時点で受け付け完了とし、ユーザーをSMTPの送信処理で待たせません。
+送信はワーカースレッドが認証済みの1本の接続を使い回して行い、失敗した場合は間隔を空けて再送します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import time
+import sqlite3
+import logging
+import smtplib
+import threading
+from collections import deque
+import streamlit as st
+from metrics import get_metrics
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# 送信状態
+STATUS_PENDING = "pending"
+STATUS_HELD = "held"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+# 送信遅延の統計に使う直近の件数
+LATENCY_WINDOW = 200
+
+# プロセス共有の送信キューと、その生成を排他制御するロック
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class Outbox:
+    """
+    永続化された送信キューと、SMTP接続を使い回して送信するワーカースレッド
+    """
+
+    def __init__(
+        self,
+        path,
+        host=ct.SMTP_HOST,
+        port=ct.SMTP_PORT,
+        starttls=ct.SMTP_STARTTLS,
+        username=None,
+        password=None,
+        smtp_factory=None,
+        max_attempts=ct.OUTBOX_MAX_ATTEMPTS,
+        retry_base_seconds=ct.OUTBOX_RETRY_BASE_SECONDS,
+        retry_max_seconds=ct.OUTBOX_RETRY_MAX_SECONDS,
+    ):
+        """
+        Args:
+            path: 送信キューのSQLiteファイルのパス
+            host: SMTPサーバーのホスト名
+            port: SMTPサーバーのポート番号
+            starttls: 接続後にSTARTTLSで暗号化するかどうか
+            username: SMTP認証のユーザー名（Noneの場合は認証しない）
+            password: SMTP認証のパスワード
+            smtp_factory: (host, port)からSMTP接続を作成する関数（テスト用のSMTPサーバーへの接続などに使用）
+            max_attempts: 送信を試みる回数の上限
+            retry_base_seconds: 1回目の再送までの待ち時間（秒）
+            retry_max_seconds: 再送までの待ち時間の上限（秒）
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.smtp_factory = smtp_factory or (
+            lambda host, port: smtplib.SMTP(host, port, timeout=ct.SMTP_TIMEOUT_SECONDS)
+        )
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._smtp = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(ct.LOGGER_NAME)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT NOT NULL, recipients TEXT NOT NULL, "
+                "message TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, next_attempt_at REAL NOT NULL, sent_at REAL, last_error TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)"
+            )
+
+    def enqueue(self, sender, recipients, message, hold=False):
+        """
+        メールを送信キューに保存し、ワーカーに通知（送信の完了は待たない）
+
+        Args:
+            sender: 送信元のメールアドレス
+            recipients: 宛先のメールアドレスのリスト
+            message: 送信するメール（文字列化したもの）
+            hold: Trueの場合はreleaseが呼ばれるまで送信を保留する（本文を後から差し替える場合）
+
+        Returns:
+            送信キュー上のID
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (sender, recipients, message, status, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sender, json.dumps(recipients), message, STATUS_HELD if hold else STATUS_PENDING, now, now),
+            )
+        if not hold:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def release(self, outbox_id, message=None):
+        """
+        保留中のメールを送信待ちにする
+
+        Args:
+            outbox_id: 送信キュー上のID
+            message: 差し替える本文（Noneの場合は保存時の本文のまま送信）
+        """
+        with self._lock, self._conn:
+            if message is None:
+                self._conn.execute(
+                    "UPDATE outbox SET status = ?, next_attempt_at = ? WHERE id = ? AND status = ?",
+                    (STATUS_PENDING, time.time(), outbox_id, STATUS_HELD),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE outbox SET status = ?, message = ?, next_attempt_at = ? WHERE id = ? AND status = ?",
+                    (STATUS_PENDING, message, time.time(), outbox_id, STATUS_HELD),
+                )
+        self._wakeup.set()
+
+    def start(self):
+        """
+        ワーカースレッドを起動（起動済みの場合は何もしない）
+
+        前回の起動時に送信できなかったメールも、起動後に順に送信する。
+        保留のまま終了したメールは、保存時の本文で送信する
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE outbox SET status = ? WHERE status = ?", (STATUS_PENDING, STATUS_HELD)
+                )
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="smtp-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        ワーカースレッドを停止し、SMTP接続を閉じる
+
+        Args:
+            timeout: ワーカースレッドの終了を待つ秒数
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush(self, timeout=None):
+        """
+        送信待ちのメールが無くなるまで待つ（再送待ちのものも含む）
+
+        Args:
+            timeout: 待つ秒数の上限
+
+        Returns:
+            送信待ちが無くなった場合はTrue
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._count(STATUS_PENDING):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        """
+        送信キューの件数・送信遅延などの統計情報を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        with self._lock:
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM outbox WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()[0]
+            latencies = sorted(self._latencies)
+        return {
+            "queue_depth": self._count(STATUS_PENDING),
+            "held": self._count(STATUS_HELD),
+            "dead_letters": self._count(STATUS_FAILED),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "connections": self.connections,
+            "oldest_pending_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "avg_latency_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_latency_seconds": latencies[-1] if latencies else 0.0,
+        }
+
+    def _count(self, status):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)
+            ).fetchone()[0]
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                row = self._next_due()
+                if row is None:
+                    self._wakeup.wait(self._seconds_until_next())
+                    self._wakeup.clear()
+                    continue
+                self._deliver(*row)
+        finally:
+            self._disconnect()
+
+    def _next_due(self):
+        # 送信時刻を過ぎた最も古いメールを1件取得
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, sender, recipients, message, attempts, created_at FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT 1",
+                (STATUS_PENDING, time.time()),
+            ).fetchone()
+
+    def _seconds_until_next(self):
+        # 次の再送予定までの秒数（送信待ちが無い場合は通知が来るまで待つ）
+        with self._lock:
+            next_attempt_at = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()[0]
+        if next_attempt_at is None:
+            return None
+        return max(next_attempt_at - time.time(), 0.0)
+
+    def _deliver(self, outbox_id, sender, recipients, message, attempts, created_at):
+        try:
+            self._send(sender, json.loads(recipients), message)
+        except Exception as e:
+            self._disconnect()
+            self._mark_failed(outbox_id, attempts + 1, e)
+            return
+
+        sent_at = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                (STATUS_SENT, attempts + 1, sent_at, outbox_id),
+            )
+            self.sent += 1
+            self._latencies.append(sent_at - created_at)
+        self._logger.info({"message": "inquiry mail sent", "outbox_id": outbox_id, "attempts": attempts + 1, "latency_seconds": round(sent_at - created_at, 3)})
+
+    def _send(self, sender, recipients, message):
+        # 使い回している接続がサーバー側で切断されていた場合は、1度だけ接続し直して送る
+        for retry in (False, True):
+            smtp = self._connect()
+            try:
+                smtp.sendmail(sender, recipients, message.encode("utf-8"))
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._disconnect()
+                if retry:
+                    raise
+
+    def _connect(self):
+        if self._smtp is None:
+            smtp = self.smtp_factory(self.host, self.port)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self.connections += 1
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+    def _mark_failed(self, outbox_id, attempts, error):
+        # 上限回数に達するまでは、待ち時間を倍にしながら再送する
+        if attempts >= self.max_attempts:
+            status, next_attempt_at = STATUS_FAILED, time.time()
+        else:
+            delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+            status, next_attempt_at = STATUS_PENDING, time.time() + delay
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts, next_attempt_at, repr(error), outbox_id),
+            )
+            if status == STATUS_FAILED:
+                self.failed += 1
+            else:
+                self.retries += 1
+        if status == STATUS_FAILED:
+            self._logger.error({"message": ct.get_text('GMAIL_SENDING_ERROR_MESSAGE', 'ja'), "outbox_id": outbox_id, "attempts": attempts, "error": repr(error)})
+        else:
+            self._logger.warning({"message": "inquiry mail retry scheduled", "outbox_id": outbox_id, "attempts": attempts, "retry_in_seconds": round(next_attempt_at - time.time(), 1), "error": repr(error)})
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_outbox():
+    """
+    プロセス共有の送信キューを取得（未作成の場合のみ作成し、ワーカーを起動）
+
+    SMTPサーバーの設定と認証情報はsecretsから取得する
+
+    Returns:
+        Outboxのインスタンス
+    """
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                outbox = Outbox(
+                    ct.OUTBOX_PATH,
+                    host=st.secrets.get("SMTP_HOST", ct.SMTP_HOST),
+                    port=int(st.secrets.get("SMTP_PORT", ct.SMTP_PORT)),
+                    starttls=bool(st.secrets.get("SMTP_STARTTLS", ct.SMTP_STARTTLS)),
+                    username=st.secrets.get("GMAIL_USER"),
+                    password=st.secrets.get("GMAIL_APP_PASSWORD"),
+                )
+                outbox.start()
+                get_metrics().register_gauges("outbox", outbox.stats)
+                _outbox = outbox
+    return _outbox
+
+def set_outbox(outbox):
+    """
+    プロセス共有の送信キューを差し替え（テスト用のSMTPサーバーへの送信・負荷試験用）
+
+    Args:
+        outbox: 差し替えるOutboxのインスタンス（Noneの場合は次回取得時に再作成）
+    """
+    global _outbox
+    with _outbox_lock:
+        _outbox = outbox
+        if outbox is not None:
+            get_metrics().register_gauges("outbox", outbox.stats)
@@ -0,0 +1,233 @@
+"""
+このファイルは、PDFファイルをページ単位で読み込むdata loaderと、ページごとのテキストのキャッシュが記述されたファイルです。
+抽出したテキストは（ファイルのハッシュ値, ページ番号）をキーにSQLiteへ保存し、内容の変わらないPDFは解析せずに読み込みます。
+キャッシュに無いページが多い場合は、ページを複数のプロセスに分けて並列に抽出します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import time
+import sqlite3
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+import pymupdf
+from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+from indexing import file_sha256, get_process_context
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# メタデータに含めるPDFの文書情報
+DOCUMENT_METADATA_KEYS = ("format", "title", "author", "subject", "creator", "producer")
+
+
+############################################################
+# クラス定義
+############################################################
+
+class PdfPageCache:
+    """
+    PDFのページごとのテキストのディスクキャッシュ（SQLite）
+
+    ファイル数が上限を超えた場合は、最後に使われた日時が古いファイルのページから削除する（LRU）
+    """
+
+    def __init__(self, path, max_files=ct.PDF_PAGE_CACHE_MAX_FILES):
+        """
+        Args:
+            path: SQLiteファイルのパス
+            max_files: 保持する最大ファイル数
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_files = max_files
+        # ローダーのプロセスプールから同時に書き込まれるため、ロックの解放を待つ
+        self._conn = sqlite3.connect(path, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "file_hash TEXT PRIMARY KEY, page_count INTEGER NOT NULL, "
+                "metadata TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "file_hash TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, "
+                "PRIMARY KEY (file_hash, page))"
+            )
+
+    def get_file(self, file_hash):
+        """
+        ファイルのページ数と文書情報を取得
+
+        Returns:
+            (ページ数, 文書情報の辞書)（キャッシュに無い場合はNone）
+        """
+        row = self._conn.execute(
+            "SELECT page_count, metadata FROM files WHERE file_hash = ?", (file_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute("UPDATE files SET last_used = ? WHERE file_hash = ?", (time.time(), file_hash))
+        return row[0], json.loads(row[1])
+
+    def put_file(self, file_hash, page_count, metadata):
+        """
+        ファイルのページ数と文書情報を保存し、上限ファイル数を超えた分を古い順に削除
+        """
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, page_count, metadata, last_used) VALUES (?, ?, ?, ?)",
+                (file_hash, page_count, json.dumps(metadata, ensure_ascii=False), time.time()),
+            )
+            evicted = [
+                row[0] for row in self._conn.execute(
+                    "SELECT file_hash FROM files ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_files,)
+                )
+            ]
+            for old_hash in evicted:
+                self._conn.execute("DELETE FROM pages WHERE file_hash = ?", (old_hash,))
+                self._conn.execute("DELETE FROM files WHERE file_hash = ?", (old_hash,))
+
+    def get_pages(self, file_hash):
+        """
+        ファイルのキャッシュ済みのページのテキストを取得
+
+        Returns:
+            ページ番号とテキストの辞書
+        """
+        return dict(self._conn.execute(
+            "SELECT page, text FROM pages WHERE file_hash = ?", (file_hash,)
+        ))
+
+    def put_pages(self, file_hash, texts):
+        """
+        ページのテキストを保存
+
+        Args:
+            file_hash: ファイルのハッシュ値
+            texts: ページ番号とテキストの辞書
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, page, text) VALUES (?, ?, ?)",
+                [(file_hash, page, text) for page, text in texts.items()],
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class PdfPageLoader(BaseLoader):
+    """
+    ページごとのテキストをキャッシュし、キャッシュに無いページのみを（必要に応じて並列に）抽出するPDFのdata loader
+
+    1ページを1ドキュメントとし、メタデータにはファイルパス・ページ番号（0始まり）・総ページ数を記録する
+    """
+
+    def __init__(self, file_path, cache_path=ct.PDF_PAGE_CACHE_PATH, max_workers=None):
+        """
+        Args:
+            file_path: PDFファイルのパス
+            cache_path: ページのテキストのキャッシュ（SQLite）のパス（Noneの場合はキャッシュしない）
+            max_workers: 抽出に使うプロセス数（未指定の場合はLOADER_MAX_WORKERS）
+        """
+        self.file_path = file_path
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.parsed_pages = 0
+
+    def lazy_load(self) -> Iterator[Document]:
+        cache = PdfPageCache(self.cache_path) if self.cache_path else None
+        try:
+            file_hash = file_sha256(self.file_path)
+            info = cache.get_file(file_hash) if cache else None
+            if info is None:
+                info = _read_document_info(self.file_path)
+                if cache:
+                    cache.put_file(file_hash, *info)
+            page_count, document_metadata = info
+
+            texts = cache.get_pages(file_hash) if cache else {}
+            missing = [page for page in range(page_count) if page not in texts]
+            if missing:
+                extracted = self._extract(missing)
+                self.parsed_pages += len(extracted)
+                if cache:
+                    cache.put_pages(file_hash, extracted)
+                texts.update(extracted)
+        finally:
+            if cache:
+                cache.close()
+
+        for page in range(page_count):
+            yield Document(
+                page_content=texts[page],
+                metadata={
+                    **document_metadata,
+                    "source": self.file_path,
+                    "file_path": self.file_path,
+                    "total_pages": page_count,
+                    "page": page,
+                },
+            )
+
+    def _extract(self, pages):
+        """
+        ページのテキストを抽出
+
+        1プロセスあたりPDF_PAGES_PER_WORKERページ以上になる場合は、連続したページごとに複数のプロセスに分けて抽出する。
+        ローダーのプロセスプール内では、indexing.load_fileからmax_workers=1が指定されるため逐次で抽出する
+
+        Returns:
+            ページ番号とテキストの辞書
+        """
+        max_workers = self.max_workers or ct.LOADER_MAX_WORKERS or os.cpu_count() or 1
+        max_workers = min(max_workers, len(pages) // ct.PDF_PAGES_PER_WORKER)
+        if max_workers <= 1:
+            return dict(_extract_pages(self.file_path, pages))
+
+        size = -(-len(pages) // max_workers)
+        batches = [pages[start:start + size] for start in range(0, len(pages), size)]
+        texts = {}
+        with ProcessPoolExecutor(max_workers=len(batches), mp_context=get_process_context()) as executor:
+            for extracted in executor.map(_extract_pages, repeat(self.file_path), batches):
+                texts.update(extracted)
+        return texts
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _read_document_info(file_path):
+    """
+    PDFのページ数と文書情報を取得（ページの解析は行わない）
+
+    Returns:
+        (ページ数, 文書情報の辞書)
+    """
+    with pymupdf.open(file_path) as doc:
+        metadata = {
+            key: (doc.metadata.get(key) or "").strip()
+            for key in DOCUMENT_METADATA_KEYS
+        }
+        return doc.page_count, metadata
+
+def _extract_pages(file_path, pages):
+    """
+    指定したページのテキストを抽出（プロセスプールから呼び出すため、モジュールの関数として定義）
+
+    Returns:
+        (ページ番号, テキスト)のリスト
+    """
+    with pymupdf.open(file_path) as doc:
+        return [(page, doc[page].get_text()) for page in pages]
@@ -0,0 +1,414 @@
+"""
+このファイルは、プロセス全体で共有するRAGエンジンを定義するファイルです。
+ベクターストア・Retriever・LLM・エンコーダーはプロセスで1つだけ生成し、
+各セッションは会話履歴のみを保持します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import queue
+import asyncio
+import logging
+import threading
+import tiktoken
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import streamlit as st
+import utils
+import indexing
+import concurrency
+from metrics import get_metrics, stage_timer
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from lexical_index import HybridRetriever, is_japanese, load_or_build_lexical_index
+from vector_index import load_or_build_vector_index
+from answer_cache import AnswerCache
+from context_packer import ContextPacker
+from rewrite_policy import RewritePolicy
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# プロセス共有のインスタンスと、その生成を排他制御するロック
+_engine = None
+_engine_lock = threading.Lock()
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class RagEngine:
+    """
+    プロセス共有のRAGエンジン
+
+    ベクターストア・Retriever・LLM・エンコーダーを保持し、
+    言語ごとのRAGチェーンは初回利用時に1度だけ作成して使い回す。
+    1回の問い合わせは「質問の独立化 → 回答キャッシュの確認 → 検索 → コンテキストの組み立て → 回答生成」の順に処理する。
+    検索で関連度の高いチャンクが見つからない場合は、回答生成を行わずに定型の回答を返す
+    """
+
+    def __init__(self, db_name=ct.DB_ALL_PATH, llm=None, embeddings=None,
+                 embedding_cache_path=ct.EMBEDDING_CACHE_PATH,
+                 no_match_threshold=ct.NO_MATCH_VECTOR_SCORE_THRESHOLD,
+                 require_content_match_ja=ct.NO_MATCH_REQUIRE_CONTENT_MATCH_JA):
+        """
+        Args:
+            db_name: RAG化対象のデータを格納するデータベース名
+            llm: 使用するLLM（未指定の場合はChatOpenAIを生成）
+            embeddings: 使用する埋め込みモデル（未指定の場合はOpenAIEmbeddingsを生成）
+            embedding_cache_path: 埋め込みキャッシュのパス（Noneの場合はキャッシュしない）
+            no_match_threshold: 関連する情報が無いとみなす、最も関連度の高いチャンクの関連度の上限（Noneの場合は判定しない）
+            require_content_match_ja: 日本語の質問で、内容語がBM25検索で一致しない場合に関連する情報が無いとみなすかどうか
+        """
+        self.db_name = db_name
+        self.no_match_threshold = no_match_threshold
+        # BM25検索を使わない重みの場合は、内容語が一致しないことを根拠に打ち切らない
+        self.require_content_match_ja = require_content_match_ja and ct.RETRIEVER_WEIGHTS[1] > 0
+        self.no_match_exits = 0
+        self.enc = get_encoder()
+        self.llm = llm or ChatOpenAI(
+            model=ct.MODEL,
+            temperature=ct.TEMPERATURE,
+            streaming=True
+        )
+        self.embeddings = embeddings or OpenAIEmbeddings()
+        self.embedding_cache = None
+        if embedding_cache_path:
+            # 再構築・新規デプロイ時も、埋め込み済みのテキストはキャッシュから取得する
+            self.embedding_cache = EmbeddingCache(embedding_cache_path, ct.EMBEDDING_CACHE_MAX_ENTRIES)
+            self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache)
+        self.db = indexing.create_vectorstore(db_name, self.embeddings)
+        self.index_version = indexing.get_index_version(db_name)
+        # ベクトル検索と、同じチャンクから作成したBM25の転置インデックスを融合して検索する
+        self.lexical_index = load_or_build_lexical_index(self.db, db_name, self.index_version)
+        # 小規模なコーパスでは、Chromaを介さずメモリマップした埋め込み行列をNumPyで検索する
+        self.vector_index = self.db
+        if ct.VECTOR_INDEX_BACKEND == "numpy":
+            self.vector_index = load_or_build_vector_index(self.db, db_name, self.index_version, self.embeddings)
+        self.retriever = HybridRetriever(
+            vectorstore=self.vector_index,
+            lexical_index=self.lexical_index,
+            k=ct.TOP_K,
+            weights=ct.RETRIEVER_WEIGHTS,
+        )
+        # 検索したチャンクのうち、トークン数の上限に収まる関連度の高いチャンクのみを回答生成に渡す
+        self.context_packer = ContextPacker(self.enc)
+        self.rewrite_policy = RewritePolicy()
+        self.answer_cache = AnswerCache(
+            ct.ANSWER_CACHE_MAX_ENTRIES,
+            ct.ANSWER_CACHE_TTL_SECONDS,
+            ct.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        )
+        # 言語ごとのプロンプト部分のみを事前に作成しておき、実行時に言語で選ぶ（言語切り替え時の再構築は不要）
+        metrics = get_metrics()
+        metrics.register_gauges("rewrite", self.rewrite_policy.stats)
+        metrics.register_gauges("answer_cache", self.answer_cache.stats)
+        metrics.register_gauges("context", self.context_packer.stats)
+        metrics.register_gauges("no_match", lambda: {"exits": self.no_match_exits})
+        if self.embedding_cache is not None:
+            metrics.register_gauges("embedding_cache", self.embedding_cache.stats)
+        self._chains = {
+            language: utils.create_rag_chain(self.llm, language)
+            for language in ct.LANGUAGES
+        }
+
+    def get_chain(self, language):
+        """
+        指定言語のRAGチェーンを取得（作成済みのものを返すのみ）
+
+        Args:
+            language: 言語コード（"ja" / "en"）
+
+        Returns:
+            (質問独立化のChain, 回答生成のChain)
+        """
+        # 未対応の言語は日本語として扱う
+        return self._chains.get(language) or self._chains["ja"]
+
+    def invoke(self, chat_message, chat_history, language, session_id=None):
+        """
+        RAGを実行して回答を生成（プロセス共有のイベントループ上で実行し、完了まで待つ）
+
+        Args:
+            chat_message: ユーザーメッセージ
+            chat_history: 会話履歴
+            language: 言語コード（"ja" / "en"）
+            session_id: LLMの順番待ちを公平にするためのセッションID
+
+        Returns:
+            回答（answer）・独立化した質問（question）・参照したチャンク（context）・
+            回答キャッシュを使ったかどうか（cached）・関連する情報が無かったかどうか（no_match）の辞書
+        """
+        return concurrency.run(self.ainvoke(chat_message, chat_history, language, session_id))
+
+    def prepare(self, chat_message, chat_history, language, session_id=None):
+        """
+        回答生成の前処理（aprepareをプロセス共有のイベントループ上で実行し、完了まで待つ）
+        """
+        return concurrency.run(self.aprepare(chat_message, chat_history, language, session_id))
+
+    def stream(self, turn):
+        """
+        回答をトークン単位で生成（astreamをプロセス共有のイベントループ上で実行し、断片を受け渡す）
+
+        Args:
+            turn: prepareの戻り値（生成完了後、answerに回答全文を格納する）
+
+        Yields:
+            回答テキストの断片
+        """
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(turn):
+                    chunks.put((True, chunk))
+                chunks.put((False, None))
+            except Exception as e:
+                chunks.put((False, e))
+
+        future = concurrency.submit(pump())
+        try:
+            while True:
+                is_chunk, value = chunks.get()
+                if not is_chunk:
+                    if value is not None:
+                        raise value
+                    return
+                yield value
+        finally:
+            # 呼び出し側が途中で読み出しをやめた場合（画面の再実行など）は生成を中断する
+            future.cancel()
+
+    async def ainvoke(self, chat_message, chat_history, language, session_id=None):
+        """
+        RAGを実行して回答を生成（非同期版）
+
+        Args:
+            chat_message: ユーザーメッセージ
+            chat_history: 会話履歴
+            language: 言語コード（"ja" / "en"）
+            session_id: LLMの順番待ちを公平にするためのセッションID
+
+        Returns:
+            invokeと同じ形式の辞書
+        """
+        turn = await self.aprepare(chat_message, chat_history, language, session_id)
+        if not turn["answered"]:
+            _, question_answer_chain = self.get_chain(language)
+            with stage_timer("answer"):
+                async with concurrency.get_llm_limiter().slot(session_id):
+                    turn["answer"] = await question_answer_chain.ainvoke(self._answer_inputs(turn))
+                await asyncio.to_thread(self.finish, turn)
+        return turn
+
+    async def astream(self, turn):
+        """
+        回答をトークン単位で生成（非同期版）
+
+        Args:
+            turn: aprepareの戻り値（生成完了後、answerに回答全文を格納する）
+
+        Yields:
+            回答テキストの断片
+        """
+        if turn["answered"]:
+            yield turn["answer"]
+            return
+        _, question_answer_chain = self.get_chain(turn["language"])
+        chunks = []
+        with stage_timer("answer"):
+            async with concurrency.get_llm_limiter().slot(turn["session_id"]):
+                async for chunk in question_answer_chain.astream(self._answer_inputs(turn)):
+                    chunks.append(chunk)
+                    yield chunk
+            turn["answer"] = "".join(chunks)
+            await asyncio.to_thread(self.finish, turn)
+
+    async def aprepare(self, chat_message, chat_history, language, session_id=None):
+        """
+        回答生成の前処理（質問の独立化・回答キャッシュの確認・検索・コンテキストの組み立て）
+
+        Args:
+            chat_message: ユーザーメッセージ
+            chat_history: 会話履歴
+            language: 言語コード（"ja" / "en"）
+            session_id: LLMの順番待ちを公平にするためのセッションID
+
+        Returns:
+            1回の問い合わせの処理状態を表す辞書
+        """
+        logger = logging.getLogger(ct.LOGGER_NAME)
+        question_generator_chain, _ = self.get_chain(language)
+
+        # 会話履歴があり、質問が単体で意味の通らない場合のみ、履歴なしでも理解できる質問に書き換える
+        question = chat_message
+        with stage_timer("rewrite"):
+            if self.rewrite_policy.needs_rewrite(chat_message, chat_history, language):
+                async with concurrency.get_llm_limiter().slot(session_id):
+                    question = await question_generator_chain.ainvoke({
+                        "input": chat_message,
+                        "chat_history": chat_history
+                    })
+            elif chat_history:
+                logger.info({"message": "question rewrite skipped", **self.rewrite_policy.stats()})
+
+        turn = {
+            "input": chat_message,
+            "chat_history": chat_history,
+            "language": language,
+            "session_id": session_id,
+            "question": question,
+            "context": [],
+            "cached": False,
+            "no_match": False,
+            # 回答生成を行わずに回答が決まったかどうか（回答キャッシュのヒット・関連する情報なし）
+            "answered": False,
+        }
+
+        # 同じ（または類似の）質問への回答がキャッシュにあれば、検索・回答生成を省略
+        with stage_timer("answer_cache"):
+            answer, turn["vector"] = await asyncio.to_thread(
+                self.answer_cache.get, question, self._cache_scope(language), self.embeddings.embed_query
+            )
+            if answer is not None:
+                logger.info({"message": "answer cache hit", "question": question})
+                turn["answer"] = answer
+                turn["cached"] = True
+                turn["answered"] = True
+                return turn
+
+        with stage_timer("retrieve"):
+            docs = await self.retriever.ainvoke(question)
+
+        # BM25検索で内容語が一致せず、最も関連度の高いチャンクでも閾値に届かない場合は、LLMを呼び出さずに「情報が見つからない」旨を返す
+        best_score = self._best_vector_score(docs)
+        if best_score is not None:
+            get_metrics().record_value("best_vector_score", best_score)
+        if self._is_no_match(question, docs, best_score):
+            logger.info({"message": "no relevant documents", "question": question, "best_vector_score": best_score})
+            self.no_match_exits += 1
+            turn["answer"] = ct.get_text('NO_DOC_MATCH_MESSAGE', language)
+            turn["no_match"] = True
+            turn["answered"] = True
+            return turn
+
+        with stage_timer("pack_context"):
+            turn["context"], summary = self.context_packer.pack(docs)
+        logger.info({"message": "context packed", "question": question, **summary})
+        metrics = get_metrics()
+        metrics.record_value("retrieved_chunks", len(docs))
+        metrics.record_value("context_tokens", summary["packed_tokens"])
+        metrics.record_value("context_tokens_saved", summary["saved_tokens"])
+        return turn
+
+    def finish(self, turn):
+        """
+        回答生成の後処理（回答キャッシュへの保存）
+
+        Args:
+            turn: 回答生成済みの処理状態
+        """
+        if turn["vector"] is None:
+            turn["vector"] = self.embeddings.embed_query(turn["question"])
+        self.answer_cache.put(turn["question"], self._cache_scope(turn["language"]), turn["answer"], turn["vector"])
+
+    def _best_vector_score(self, docs):
+        """
+        検索結果のうち、ベクトル検索の関連度の最大値を取得（ベクトル検索の結果が無い場合はNone）
+        """
+        scores = [doc.metadata["vector_score"] for doc in docs if "vector_score" in doc.metadata]
+        return max(scores, default=None)
+
+    def _is_no_match(self, question, docs, best_score):
+        """
+        関連する情報が無いとみなすかどうかを判定
+
+        BM25検索で内容語（名詞）が一致したチャンクがある場合は、管径・町名・日付などの表記が一致しているため、
+        ベクトル検索の関連度によらず関連する情報があるとみなす（ContextPackerの判定と合わせる）。
+        「教える」「有る」のような動詞などの一致は、どの質問にも現れるため数えない。
+        日本語の質問で内容語が一致しない場合は、資料に無い事柄についての質問とみなす
+        """
+        if not docs:
+            return True
+        if any(doc.metadata.get("lexical_content_match") for doc in docs):
+            return False
+        if self.require_content_match_ja and is_japanese(question):
+            return True
+        if self.no_match_threshold is None or best_score is None:
+            return False
+        return best_score < self.no_match_threshold
+
+    def _answer_inputs(self, turn):
+        """
+        回答生成Chainへの入力を作成
+        """
+        return {
+            "input": turn["input"],
+            "chat_history": turn["chat_history"],
+            "context": turn["context"]
+        }
+
+    def _cache_scope(self, language):
+        """
+        回答キャッシュの範囲（言語, インデックスのバージョン）を取得
+        """
+        return (language, self.index_version)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_encoder():
+    """
+    プロセス共有のtiktokenエンコーダーを取得
+
+    Returns:
+        tiktokenのエンコーダー
+    """
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                # 使うモデル名（Streamlit secretsから、なければデフォルト値を使用）
+                try:
+                    model = st.secrets.get("OPENAI_MODEL", ct.MODEL)
+                except FileNotFoundError:
+                    # secrets.tomlが無い環境（ベンチマーク等）
+                    model = ct.MODEL
+                try:
+                    # モデルに合うエンコーディングを自動で選ぶ
+                    _encoder = tiktoken.encoding_for_model(model)
+                except Exception:
+                    # うまく選べなければ汎用のエンコーディングにフォールバック
+                    _encoder = tiktoken.get_encoding(ct.ENCODING_KIND)
+    return _encoder
+
+def get_rag_engine():
+    """
+    プロセス共有のRAGエンジンを取得（未作成の場合のみ作成）
+
+    Returns:
+        RagEngineのインスタンス
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RagEngine(ct.DB_ALL_PATH)
+    return _engine
+
+def set_rag_engine(engine):
+    """
+    プロセス共有のRAGエンジンを差し替え（ベンチマーク・負荷試験用）
+
+    Args:
+        engine: 差し替えるRagEngineのインスタンス（Noneの場合は次回取得時に再作成）
+    """
+    global _engine
+    with _engine_lock:
+        _engine = engine
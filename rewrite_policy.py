@@ -0,0 +1,107 @@
+"""
+このファイルは、会話履歴を踏まえた質問の書き換え（独立化）をLLMで行うかどうかを判定する処理が記述されたファイルです。
+会話履歴が無い場合や、質問がそれ単体で意味の通る場合は書き換えを省略し、LLMの呼び出しを1回減らします。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import threading
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class RewritePolicy:
+    """
+    質問の書き換え要否の判定と、省略した回数の集計
+    """
+
+    def __init__(self):
+        self.rewrites = 0
+        self.skipped_no_history = 0
+        self.skipped_self_contained = 0
+        self._patterns = {}
+        self._lock = threading.Lock()
+
+    def needs_rewrite(self, chat_message, chat_history, language):
+        """
+        質問の書き換えが必要かどうかを判定
+
+        ・会話履歴が無い場合は不要
+        ・指示語や接続表現（「それ」「その」「他に」など）を含む場合、または質問が極端に短い場合は必要
+        ・それ以外はそれ単体で意味の通る質問とみなし、不要
+
+        Args:
+            chat_message: ユーザーメッセージ
+            chat_history: 会話履歴
+            language: 言語コード（"ja" / "en"）
+
+        Returns:
+            書き換えが必要な場合はTrue
+        """
+        if not chat_history:
+            with self._lock:
+                self.skipped_no_history += 1
+            return False
+
+        text = chat_message.strip()
+        needed = (
+            self._get_pattern(language).search(text) is not None
+            or _is_short(text)
+        )
+        with self._lock:
+            if needed:
+                self.rewrites += 1
+            else:
+                self.skipped_self_contained += 1
+        return needed
+
+    def stats(self):
+        """
+        書き換えの実行回数・省略回数を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        with self._lock:
+            skipped = self.skipped_no_history + self.skipped_self_contained
+            total = self.rewrites + skipped
+            return {
+                "rewrites": self.rewrites,
+                "skipped_no_history": self.skipped_no_history,
+                "skipped_self_contained": self.skipped_self_contained,
+                "skip_rate": skipped / total if total else 0.0,
+            }
+
+    def _get_pattern(self, language):
+        """
+        言語ごとの指示語・接続表現の正規表現を取得（初回のみコンパイル）
+        """
+        pattern = self._patterns.get(language)
+        if pattern is None:
+            pattern = re.compile(ct.get_text('REWRITE_REFERENCE_PATTERN', language), re.IGNORECASE)
+            self._patterns[language] = pattern
+        return pattern
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _is_short(text):
+    """
+    単体では意味が通りにくい短い質問かどうかを判定
+
+    Args:
+        text: 質問文
+
+    Returns:
+        英語は単語数、それ以外は文字数が下限未満の場合にTrue
+    """
+    if text.isascii():
+        return len(text.split()) < ct.REWRITE_MIN_WORDS
+    return len(text) < ct.REWRITE_MIN_CHARS
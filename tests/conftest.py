@@ -0,0 +1,8 @@
+"""
+テストの共通設定です。リポジトリ直下のモジュール（フラットな構成）を読み込めるようにします。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+"""
+回答生成のコンテキストの組み立て（context_packer.ContextPacker）のテストです。
+"""
+
+from langchain_core.documents import Document
+from context_packer import ContextPacker
+
+
+class CharEncoder:
+    """
+    1文字を1トークンとして数えるエンコーダー（tiktokenの代わり）
+    """
+
+    def encode(self, text):
+        return [ord(char) for char in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+def test_top_chunk_over_budget_is_truncated_instead_of_dropped():
+    packer = ContextPacker(CharEncoder(), token_budget=100)
+    docs = [
+        Document(page_content="配水管" * 200, metadata={"vector_score": 0.9}, id="top"),
+        Document(page_content="短いチャンク", metadata={"vector_score": 0.8}, id="short"),
+    ]
+
+    packed, summary = packer.pack(docs)
+
+    assert [doc.id for doc in packed] == ["top"]
+    assert packed[0].page_content == ("配水管" * 200)[:100]
+    assert summary["packed_tokens"] == 100
+    assert summary["truncated"] == 1
+    # 元のドキュメントは書き換えない
+    assert len(docs[0].page_content) == 600
+
+
+def test_lower_ranked_chunk_over_budget_is_skipped():
+    packer = ContextPacker(CharEncoder(), token_budget=100)
+    docs = [
+        Document(page_content="作業時間は8時から17時まで", metadata={"vector_score": 0.9}, id="top"),
+        Document(page_content="騒音" * 100, metadata={"vector_score": 0.8}, id="long"),
+        Document(page_content="断水の予定はありません", metadata={"vector_score": 0.7}, id="short"),
+    ]
+
+    packed, summary = packer.pack(docs)
+
+    assert [doc.id for doc in packed] == ["top", "short"]
+    assert summary["dropped_over_budget"] == 1
+    assert summary["truncated"] == 0
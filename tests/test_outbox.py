@@ -0,0 +1,144 @@
+"""
+送信キュー（outbox.Outbox）の再送・保留の解除・送信失敗の確定を、フェイクのSMTP接続で確認するテストです。
+"""
+
+import smtplib
+import time
+import pytest
+import outbox as outbox_module
+from outbox import Outbox, STATUS_FAILED, STATUS_SENT
+
+
+class ScriptedSMTP:
+    """
+    sendmailの呼び出しごとに、指定した回数だけ失敗してから成功するフェイクのSMTP接続
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = []
+        self.delivered = []
+
+    def factory(self, host, port):
+        return self
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def sendmail(self, sender, recipients, message):
+        self.calls.append(time.monotonic())
+        if len(self.calls) <= self.failures:
+            raise smtplib.SMTPResponseException(451, b"temporary failure")
+        self.delivered.append((sender, recipients, message.decode("utf-8")))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_outbox(tmp_path, smtp, **kwargs):
+    box = Outbox(
+        str(tmp_path / "outbox.sqlite3"),
+        smtp_factory=smtp.factory,
+        retry_base_seconds=0.1,
+        retry_max_seconds=1.0,
+        **kwargs,
+    )
+    box.start()
+    return box
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            pytest.fail("timed out")
+        time.sleep(0.01)
+
+
+def status_of(box, outbox_id):
+    return box._conn.execute(
+        "SELECT status, attempts FROM outbox WHERE id = ?", (outbox_id,)
+    ).fetchone()
+
+
+def test_retries_with_exponential_backoff_until_sent(tmp_path):
+    smtp = ScriptedSMTP(failures=2)
+    box = create_outbox(tmp_path, smtp, max_attempts=5)
+    try:
+        outbox_id = box.enqueue("from@example.com", ["to@example.com"], "本文")
+        assert box.flush(timeout=5)
+
+        assert status_of(box, outbox_id) == (STATUS_SENT, 3)
+        assert smtp.delivered == [("from@example.com", ["to@example.com"], "本文")]
+        stats = box.stats()
+        assert stats["retries"] == 2
+        assert stats["sent"] == 1
+        # 再送までの待ち時間は 0.1秒 → 0.2秒 と倍になる
+        first_gap = smtp.calls[1] - smtp.calls[0]
+        second_gap = smtp.calls[2] - smtp.calls[1]
+        assert first_gap >= 0.1
+        assert second_gap >= 0.2
+    finally:
+        box.stop(timeout=5)
+
+
+def test_held_mail_is_sent_only_after_release(tmp_path):
+    smtp = ScriptedSMTP(failures=0)
+    box = create_outbox(tmp_path, smtp)
+    try:
+        outbox_id = box.enqueue("from@example.com", ["to@example.com"], "翻訳前", hold=True)
+        time.sleep(0.2)
+        assert smtp.calls == []
+        assert box.stats()["held"] == 1
+
+        box.release(outbox_id, "翻訳後")
+        assert box.flush(timeout=5)
+
+        assert status_of(box, outbox_id) == (STATUS_SENT, 1)
+        assert [message for _, _, message in smtp.delivered] == ["翻訳後"]
+        assert box.stats()["held"] == 0
+    finally:
+        box.stop(timeout=5)
+
+
+def test_marked_failed_after_max_attempts(tmp_path):
+    smtp = ScriptedSMTP(failures=100)
+    box = create_outbox(tmp_path, smtp, max_attempts=3)
+    try:
+        outbox_id = box.enqueue("from@example.com", ["to@example.com"], "本文")
+        wait_until(lambda: box.stats()["dead_letters"] == 1)
+
+        assert status_of(box, outbox_id) == (STATUS_FAILED, 3)
+        assert len(smtp.calls) == 3
+        stats = box.stats()
+        assert stats["failed"] == 1
+        assert stats["retries"] == 2
+        assert stats["queue_depth"] == 0
+        # 送信失敗が確定したメールは、以降は再送しない
+        time.sleep(0.3)
+        assert len(smtp.calls) == 3
+    finally:
+        box.stop(timeout=5)
+
+
+def test_start_releases_mail_left_on_hold(tmp_path):
+    smtp = ScriptedSMTP(failures=0)
+    path = str(tmp_path / "outbox.sqlite3")
+    held = Outbox(path, smtp_factory=smtp.factory)
+    outbox_id = held.enqueue("from@example.com", ["to@example.com"], "保存時の本文", hold=True)
+    assert status_of(held, outbox_id)[0] == outbox_module.STATUS_HELD
+
+    # 保留のまま終了した後に起動した場合は、保存時の本文で送信する
+    box = create_outbox(tmp_path, smtp)
+    try:
+        assert box.flush(timeout=5)
+        assert status_of(box, outbox_id) == (STATUS_SENT, 1)
+        assert [message for _, _, message in smtp.delivered] == ["保存時の本文"]
+    finally:
+        box.stop(timeout=5)
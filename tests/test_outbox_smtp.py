@@ -0,0 +1,205 @@
+"""
+送信キュー（outbox.Outbox）の接続の使い回し・STARTTLSと認証・切断後の再接続を、ローカルのSMTPサーバー（aiosmtpd）で確認するテストです。
+"""
+
+import datetime
+import socket
+import ssl
+import threading
+import pytest
+from outbox import Outbox, STATUS_SENT
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+smtp_module = pytest.importorskip("aiosmtpd.smtp")
+x509 = pytest.importorskip("cryptography.x509")
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+USERNAME = "outbox@example.com"
+PASSWORD = "app-password"
+
+
+class RecordingHandler:
+    """
+    受信したメール（送信元の接続のアドレス付き）と、認証に使われたユーザー名を記録するaiosmtpdのハンドラー
+    """
+
+    def __init__(self):
+        self.delivered = []
+        self.peers = []
+        self.logins = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.append((envelope.mail_from, envelope.rcpt_tos, envelope.content.decode("utf-8")))
+        self.peers.append(session.peer)
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins.append((mechanism, auth_data.login.decode()))
+        return smtp_module.AuthResult(
+            success=auth_data.login.decode() == USERNAME and auth_data.password.decode() == PASSWORD
+        )
+
+
+class TrackingController(controller_module.Controller):
+    """
+    受け付けた接続を記録し、テストからサーバー側で切断できるaiosmtpdのコントローラー
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.protocols = []
+
+    def factory(self):
+        protocol = TrackingSMTP(self.handler, **self.SMTP_kwargs)
+        self.protocols.append(protocol)
+        return protocol
+
+    def drop_connections(self, timeout=5):
+        """
+        開いているすべての接続をサーバー側から閉じ、閉じ終わるまで待つ
+
+        Returns:
+            すべての接続を閉じ終えたかどうか
+        """
+        protocols = [protocol for protocol in self.protocols if not protocol.closed.is_set()]
+        for protocol in protocols:
+            # TLSの終了通知は待たずに切断する（接続の操作は、サーバーのイベントループのスレッドで行う）
+            self.loop.call_soon_threadsafe(protocol.transport.abort)
+        return all(protocol.closed.wait(timeout) for protocol in protocols)
+
+
+class TrackingSMTP(smtp_module.SMTP):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.closed = threading.Event()
+
+    def connection_lost(self, error):
+        super().connection_lost(error)
+        self.closed.set()
+
+
+def create_tls_context(tmp_path):
+    """
+    localhost用の自己署名証明書を作成し、STARTTLSに使うサーバー側のSSLコンテキストを取得
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = tmp_path / "cert.pem"
+    key_path = tmp_path / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(tmp_path):
+    handler = RecordingHandler()
+    controller = TrackingController(
+        handler,
+        hostname="127.0.0.1",
+        port=free_port(),
+        tls_context=create_tls_context(tmp_path),
+        require_starttls=True,
+        authenticator=handler.authenticate,
+        auth_required=True,
+    )
+    controller.start()
+    try:
+        yield controller
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def box(tmp_path, smtp_server):
+    # SMTP接続はOutboxの既定（smtplib.SMTP）で、ローカルのSMTPサーバーに接続する
+    box = Outbox(
+        str(tmp_path / "outbox.sqlite3"),
+        host=smtp_server.hostname,
+        port=smtp_server.port,
+        starttls=True,
+        username=USERNAME,
+        password=PASSWORD,
+        retry_base_seconds=0.1,
+        retry_max_seconds=1.0,
+    )
+    box.start()
+    try:
+        yield box
+    finally:
+        box.stop(timeout=5)
+
+
+def body_of(message):
+    # 受信したメールは行末がCRLFになるため、最後の行を本文として比較する
+    return message.splitlines()[-1]
+
+
+def status_of(box, outbox_id):
+    return box._conn.execute(
+        "SELECT status, attempts FROM outbox WHERE id = ?", (outbox_id,)
+    ).fetchone()
+
+
+def test_sends_queued_mails_over_one_authenticated_connection(smtp_server, box):
+    outbox_ids = [
+        box.enqueue("from@example.com", ["to@example.com"], f"Subject: inquiry {i}\n\n問い合わせ {i}")
+        for i in range(3)
+    ]
+    assert box.flush(timeout=10)
+
+    assert [status_of(box, outbox_id) for outbox_id in outbox_ids] == [(STATUS_SENT, 1)] * 3
+    handler = smtp_server.handler
+    assert [body_of(message) for _, _, message in handler.delivered] == [f"問い合わせ {i}" for i in range(3)]
+    assert all(recipients == ["to@example.com"] for _, recipients, _ in handler.delivered)
+    # STARTTLSの後に1度だけ認証し、3通とも同じ接続（送信元のアドレス・ポートが同じ）で送る
+    assert [login for _, login in handler.logins] == [USERNAME]
+    assert len(set(handler.peers)) == 1
+    assert box.stats()["connections"] == 1
+
+
+def test_reconnects_after_server_drops_the_connection(smtp_server, box):
+    first_id = box.enqueue("from@example.com", ["to@example.com"], "Subject: first\n\n1通目")
+    assert box.flush(timeout=10)
+
+    # 使い回している接続を、送信の合間にサーバー側で切断する
+    assert smtp_server.drop_connections()
+
+    second_id = box.enqueue("from@example.com", ["to@example.com"], "Subject: second\n\n2通目")
+    assert box.flush(timeout=10)
+
+    # 切断を検知したら接続し直して同じ送信を続けるため、再送（失敗扱い）にはならない
+    assert status_of(box, first_id) == (STATUS_SENT, 1)
+    assert status_of(box, second_id) == (STATUS_SENT, 1)
+    assert [body_of(message) for _, _, message in smtp_server.handler.delivered] == ["1通目", "2通目"]
+    assert len(smtp_server.handler.logins) == 2
+    assert len(set(smtp_server.handler.peers)) == 2
+    stats = box.stats()
+    assert stats["connections"] == 2
+    assert stats["retries"] == 0
@@ -0,0 +1,69 @@
+"""
+RAGエンジン（rag_engine.RagEngine）の、関連する情報が無い場合の打ち切り判定のテストです。
+"""
+
+import pytest
+from langchain_core.documents import Document
+from rag_engine import RagEngine
+
+
+@pytest.fixture
+def engine():
+    # インデックスやLLMは使わないため、判定に必要な属性のみを設定する
+    engine = RagEngine.__new__(RagEngine)
+    engine.no_match_threshold = 0.5
+    engine.require_content_match_ja = True
+    return engine
+
+
+def judge(engine, docs, question="What are the working hours?"):
+    return engine._is_no_match(question, docs, engine._best_vector_score(docs))
+
+
+def test_low_vector_score_without_lexical_hit_is_no_match(engine):
+    docs = [Document(page_content="無関係", metadata={"vector_score": 0.2})]
+    assert judge(engine, docs)
+
+
+def test_lexical_content_match_is_a_match_even_with_low_vector_score(engine):
+    # 管径などの表記がBM25検索で一致したチャンクは、ベクトル検索の関連度が低くても打ち切らない
+    docs = [
+        Document(page_content="無関係", metadata={"vector_score": 0.2}),
+        Document(page_content="配水管 φ75", metadata={"lexical_score": 3.1, "lexical_content_match": True}),
+    ]
+    assert not judge(engine, docs, "φ75の配水管の延長は？")
+
+
+def test_lexical_hit_without_content_terms_is_not_a_match(engine):
+    # 「教える」「下さる」のような動詞のみの一致は、関連する情報があるとはみなさない
+    docs = [
+        Document(page_content="無関係", metadata={"vector_score": 0.2}),
+        Document(page_content="教えてください", metadata={"lexical_score": 3.6}),
+    ]
+    assert judge(engine, docs)
+
+
+def test_japanese_question_without_content_match_is_no_match(engine):
+    engine.no_match_threshold = None
+    docs = [Document(page_content="作業時間", metadata={"vector_score": 0.8, "lexical_score": 3.6})]
+    assert judge(engine, docs, "明日の天気を教えてください。")
+
+
+def test_english_question_without_content_match_uses_vector_score(engine):
+    docs = [Document(page_content="作業時間", metadata={"vector_score": 0.8})]
+    assert not judge(engine, docs, "What are the working hours?")
+
+
+def test_high_vector_score_is_a_match(engine):
+    docs = [Document(page_content="作業時間", metadata={"vector_score": 0.8})]
+    assert not judge(engine, docs)
+
+
+def test_no_documents_is_no_match(engine):
+    assert judge(engine, [])
+
+
+def test_threshold_none_disables_the_check_for_english_questions(engine):
+    engine.no_match_threshold = None
+    docs = [Document(page_content="無関係", metadata={"vector_score": 0.2})]
+    assert not judge(engine, docs)
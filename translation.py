@@ -0,0 +1,158 @@
+"""
+このファイルは、英語の問い合わせを日本語に翻訳する処理が記述されたファイルです。
+翻訳のChainはプロセスで1度だけ作成し、同じ内容の問い合わせは翻訳結果のキャッシュから返します。
+翻訳に使うLLMはRAGエンジンとは別に作成するため、インデックスの準備を待たずに翻訳できます。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import threading
+from collections import OrderedDict
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from embedding_cache import normalize_text
+import concurrency
+from metrics import get_metrics
+import constants as ct
+
+############################################################
+# 設定関連
+############################################################
+# プロセス共有の翻訳器と、その生成を排他制御するロック
+_translator = None
+_translator_lock = threading.Lock()
+
+
+############################################################
+# クラス定義
+############################################################
+
+class Translator:
+    """
+    英語から日本語への翻訳Chainと、内容をキーにした翻訳結果のキャッシュ（LRU）
+    """
+
+    def __init__(self, llm, max_entries=ct.TRANSLATION_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            llm: 翻訳に使用するLLM
+            max_entries: キャッシュに保持する最大件数
+        """
+        prompt = PromptTemplate.from_template(ct.get_text('TRANSLATION_TEMPLATE', 'en'))
+        self.chain = prompt | llm | StrOutputParser()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cached(self, text):
+        """
+        キャッシュ済みの翻訳結果を取得
+
+        Args:
+            text: 翻訳対象の英語テキスト
+
+        Returns:
+            翻訳結果（キャッシュに無い場合はNone）
+        """
+        key = normalize_text(text)
+        with self._lock:
+            translated = self._entries.get(key)
+            if translated is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return translated
+
+    def translate(self, text, session_id=None):
+        """
+        テキストを翻訳（キャッシュに無い場合のみLLMを呼び出し、完了まで待つ）
+
+        Args:
+            text: 翻訳対象の英語テキスト
+            session_id: LLMの同時実行数の制限で順番待ちする単位
+
+        Returns:
+            日本語に翻訳されたテキスト
+        """
+        translated = self.get_cached(text)
+        if translated is None:
+            translated = concurrency.run(self.atranslate(text, session_id))
+        return translated
+
+    async def atranslate(self, text, session_id=None):
+        """
+        LLMでテキストを翻訳し、結果をキャッシュに保存（get_cachedでキャッシュに無かった場合に呼び出す）
+
+        Args:
+            text: 翻訳対象の英語テキスト
+            session_id: LLMの同時実行数の制限で順番待ちする単位
+
+        Returns:
+            日本語に翻訳されたテキスト
+        """
+        async with concurrency.get_llm_limiter().slot(session_id):
+            translated = (await self.chain.ainvoke({"english_text": text})).strip()
+        key = normalize_text(text)
+        with self._lock:
+            self._entries[key] = translated
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return translated
+
+    def stats(self):
+        """
+        ヒット数・ミス数などの統計情報を取得
+
+        Returns:
+            統計情報の辞書
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+############################################################
+# 関数定義
+############################################################
+
+def get_translator():
+    """
+    プロセス共有の翻訳器を取得（未作成の場合のみ作成）
+
+    翻訳器のLLMは、インデックスの同期などを伴うRAGエンジンの作成を待たないよう、RAGエンジンとは別に作成する
+
+    Returns:
+        Translatorのインスタンス
+    """
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                # langchain_openaiの読み込みには時間がかかるため、初回使用時に読み込む
+                from langchain_openai import ChatOpenAI
+                _translator = Translator(ChatOpenAI(model=ct.MODEL, temperature=ct.TEMPERATURE))
+                get_metrics().register_gauges("translation", _translator.stats)
+    return _translator
+
+def set_translator(translator):
+    """
+    プロセス共有の翻訳器を差し替え（ベンチマーク・負荷試験用）
+
+    Args:
+        translator: 差し替えるTranslatorのインスタンス（Noneの場合は次回取得時に再作成）
+    """
+    global _translator
+    with _translator_lock:
+        _translator = translator
+        if translator is not None:
+            get_metrics().register_gauges("translation", translator.stats)
@@ -6,27 +6,15 @@
 ############################################################
 # ライブラリの読み込み
 ############################################################
-import os
 import streamlit as st
 import logging
 import sys
-import uuid
+import time
+import asyncio
 import unicodedata
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
-from langchain.schema import HumanMessage, AIMessage
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
-from typing import List
-from sudachipy import tokenizer, dictionary
-from langchain.chains import LLMChain
 import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import hmac
+from metrics import get_metrics, stage_timer
 import constants as ct
 
 ############################################################
@@ -49,49 +37,28 @@ def build_error_message(message):
     """
     return "\n".join([message, ct.get_text('COMMON_ERROR_MESSAGE')])
 
-def create_rag_chain(db_name):
+@stage_timer("create_rag_chain")
+def create_rag_chain(llm, language):
     """
-    引数として渡されたDB内を参照するRAGのChainを作成
+    指定言語のRAGのChainを作成
+
+    会話履歴を踏まえて質問を独立化するChainと、検索結果を基に回答するChainを返す。
+    検索はプロセス共有のRetrieverで行うため、ここではプロンプトとLLMのみを組み立てる
 
     Args:
-        db_name: RAG化対象のデータを格納するデータベース名
+        llm: 回答生成に使用するLLM
+        language: プロンプトの言語コード（"ja" / "en"）
+
+    Returns:
+        (質問独立化のChain, 回答生成のChain)
     """
-    logger = logging.getLogger(ct.LOGGER_NAME)
-    # embeddings は 既存DBを読む場合も必要なので先に用意
-    embeddings = OpenAIEmbeddings()
-
-    # すでに対象のデータベースが作成済みの場合は読み込み、未作成の場合のみ新規作成する
-    if os.path.isdir(db_name):
-        db = Chroma(persist_directory=db_name, embedding_function=embeddings)
-    else:
-        docs_all = []
-        if db_name == ct.DB_ALL_PATH:
-            folders = os.listdir(ct.RAG_TOP_FOLDER_PATH)
-            # 「data」フォルダ直下の各フォルダ名に対して処理
-            for folder_path in folders:
-                if folder_path.startswith("."):
-                    continue
-                # フォルダ内の各ファイルのデータをリストに追加
-                add_docs(f"{ct.RAG_TOP_FOLDER_PATH}/{folder_path}", docs_all)
-
-        # OSがWindowsの場合、Unicode正規化と、cp932（Windows用の文字コード）で表現できない文字を除去
-        for doc in docs_all:
-            doc.page_content = adjust_string(doc.page_content)
-            for key in doc.metadata:
-                doc.metadata[key] = adjust_string(doc.metadata[key])
-        
-        text_splitter = CharacterTextSplitter(
-            chunk_size=ct.CHUNK_SIZE,
-            chunk_overlap=ct.CHUNK_OVERLAP,
-            separator="\n",
-        )
-        splitted_docs = text_splitter.split_documents(docs_all)
-        db = Chroma.from_documents(splitted_docs, embedding=embeddings, persist_directory=db_name)
-
-    retriever = db.as_retriever(search_kwargs={"k": ct.TOP_K})
-
-    # 多言語対応：現在の言語に基づいてプロンプトテンプレートを取得
-    question_generator_template = ct.get_text('SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT')
+    # LangChainの読み込みには時間がかかるため、画面の起動時ではなくRAGエンジンの作成時に読み込む
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    # 多言語対応：指定言語のプロンプトテンプレートを取得
+    question_generator_template = ct.get_text('SYSTEM_PROMPT_CREATE_INDEPENDENT_TEXT', language)
     question_generator_prompt = ChatPromptTemplate.from_messages(
         [
             ("system", question_generator_template),
@@ -99,7 +66,7 @@ def create_rag_chain(db_name):
             ("human", "{input}"),
         ]
     )
-    question_answer_template = ct.get_text('SYSTEM_PROMPT_INQUIRY')
+    question_answer_template = ct.get_text('SYSTEM_PROMPT_INQUIRY', language)
     question_answer_prompt = ChatPromptTemplate.from_messages(
         [
             ("system", question_answer_template),
@@ -108,131 +75,123 @@ def create_rag_chain(db_name):
         ]
     )
 
-    history_aware_retriever = create_history_aware_retriever(
-        st.session_state.llm, retriever, question_generator_prompt
-    )
-    question_answer_chain = create_stuff_documents_chain(st.session_state.llm, question_answer_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    question_generator_chain = question_generator_prompt | llm | StrOutputParser()
+    question_answer_chain = create_stuff_documents_chain(llm, question_answer_prompt)
     
-    return rag_chain
+    return question_generator_chain, question_answer_chain
 
-def add_docs(folder_path, docs_all):
-    """
-    フォルダ内のファイル一覧を取得
-
-    Args:
-        folder_path: フォルダのパス
-        docs_all: 各ファイルデータを格納するリスト
-    """
-    if not os.path.isdir(folder_path):
-        return  # フォルダがなければ何もしない
-    files = os.listdir(folder_path)
-    for file in files:
-        # ファイルの拡張子を取得
-        file_extension = os.path.splitext(file)[1]
-        # 想定していたファイル形式の場合のみ読み込む
-        if file_extension in ct.SUPPORTED_EXTENSIONS:
-            # ファイルの拡張子に合ったdata loaderを使ってデータ読み込み
-            loader = ct.SUPPORTED_EXTENSIONS[file_extension](f"{folder_path}/{file}")
-        else:
-            continue
-        docs = loader.load()
-        for doc in docs:
-            doc.id = str(uuid.uuid4())  # Chroma用にid属性を付与
-        docs_all.extend(docs)
-
-def delete_old_conversation_log(result):
+@stage_timer("delete_old_conversation_log")
+def delete_old_conversation_log():
     """
     古い会話履歴の削除
 
-    Args:
-        result: LLMからの回答
+    各メッセージのトークン数は会話履歴への追加時に数え済みのため、ここでは再エンコードしない
     """
-    # LLMからの回答テキストのトークン数を取得
-    response_tokens = len(st.session_state.enc.encode(result))
-    # 過去の会話履歴の合計トークン数に加算
-    st.session_state.total_tokens += response_tokens
-
-    # トークン数が上限値を下回るまで、順に古い会話履歴を削除
-    while st.session_state.total_tokens > ct.MAX_ALLOWED_TOKENS:
-        # 最も古い会話履歴を削除
-        removed_message = st.session_state.chat_history.pop(1)
-        # 最も古い会話履歴のトークン数を取得
-        removed_tokens = len(st.session_state.enc.encode(removed_message.content))
-        # 過去の会話履歴の合計トークン数から、最も古い会話履歴のトークン数を引く
-        st.session_state.total_tokens -= removed_tokens
-
-def execute_chain(chat_message: str) -> str:
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    removed = st.session_state.chat_history.trim(ct.MAX_ALLOWED_TOKENS)
+    if removed:
+        logger.info({"message": "old conversation log deleted", "removed_messages": removed, "total_tokens": st.session_state.chat_history.total_tokens})
+
+@stage_timer("execute_chain")
+def execute_chain_stream(chat_message: str, on_token) -> str:
     """
-    RAGのChainを実行して回答テキストを返す（安全版）
+    RAGのChainを実行し、回答をトークン単位で通知しながら回答テキストを返す
 
     Args:
         chat_message: ユーザーメッセージ
+        on_token: 回答の断片を受け取るたびに、それまでの回答テキスト全体を引数に呼び出す関数
     Returns:
         回答テキスト（str）
     """
-    from typing import Any
+    from rag_engine import get_rag_engine
 
     logger = logging.getLogger(ct.LOGGER_NAME)
     ss = st.session_state
+    current_lang = getattr(ss, 'language', 'ja')
 
-    # 1) 履歴の安全初期化
-    if "chat_history" not in ss or not isinstance(ss.chat_history, list):
-        ss.chat_history = []
+    # 履歴の安全初期化
+    ensure_chat_history()
 
-    # 2) 実行
+    start = time.perf_counter()
+    answer = ""
     try:
-        result: Any = ss.rag_chain.invoke({
-            "input": chat_message,
-            "chat_history": ss.chat_history
-        })
+        engine = get_rag_engine()
+        turn = engine.prepare(chat_message, ss.chat_history.as_messages(), current_lang, ss.get("session_id"))
+        for chunk in engine.stream(turn):
+            if not answer:
+                # 最初のトークンが届くまでの時間（体感の待ち時間）を記録
+                first_token_seconds = time.perf_counter() - start
+                get_metrics().record_duration("first_token", first_token_seconds)
+                logger.info({"message": "time to first token", "seconds": round(first_token_seconds, 3)})
+            answer += chunk
+            on_token(answer)
     except Exception as e:
         logger.exception(ct.get_text('RAG_CHAIN_EXECUTION_ERROR_MESSAGE'), exc_info=e)
         raise
 
-    # 3) 結果の取り出し（返却形式の差異に耐える）
-    answer: str
-    if isinstance(result, dict):
-        for key in ("answer", "output_text", "result", "output"):
-            if key in result and isinstance(result[key], str):
-                answer = result[key]
-                break
-        else:
-            # 文字列が見つからない場合は全体を文字列化
-            answer = str(result)
-    else:
-        answer = str(result)
+    return finalize_answer(chat_message, answer)
 
-    # 4) 「情報が見つからない」場合のチェック（多言語対応）
+def finalize_answer(chat_message: str, answer: str) -> str:
+    """
+    「情報が見つからない」場合の回答の置き換え
+
+    会話履歴への追記は、画面表示用の会話ログと同時に呼び出し元で行う
+
+    Args:
+        chat_message: ユーザーメッセージ
+        answer: LLMからの回答
+    Returns:
+        画面に表示する回答テキスト（str）
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    ss = st.session_state
+    current_lang = getattr(ss, 'language', 'ja')
+
+    # 「情報が見つからない」場合のチェック（多言語対応）
     no_doc_keywords = {
         'ja': ['回答に必要な情報が見つかりませんでした', '情報が見つかりませんでした'],
         'en': ['not found', 'information necessary', 'was not found']
     }
     
-    current_lang = getattr(ss, 'language', 'ja')
     if current_lang in no_doc_keywords:
         for keyword in no_doc_keywords[current_lang]:
             if keyword.lower() in answer.lower():
                 answer = ct.get_text('NO_DOC_MATCH_MESSAGE')
                 break
 
-    # 5) 会話履歴へ追記（LangChainのメッセージ型が無い環境でも落ちないように）
-    try:
-        from langchain.schema import HumanMessage, AIMessage  # v0系
-        ss.chat_history.extend([HumanMessage(content=chat_message), AIMessage(content=answer)])
-    except Exception:
-        try:
-            from langchain_core.messages import HumanMessage, AIMessage  # v1系
-            ss.chat_history.extend([HumanMessage(content=chat_message), AIMessage(content=answer)])
-        except Exception:
-            # フォールバック：プレーンな辞書で保持
-            ss.chat_history.append({"role": "user", "content": chat_message})
-            ss.chat_history.append({"role": "assistant", "content": answer})
-
     logger.info({"message": answer})
 
     return answer
 
+def ensure_chat_history():
+    """
+    会話履歴が未作成の場合に作成し、画面表示用の会話ログと同じものを参照させる
+    """
+    from chat_history import ConversationHistory
+
+    ss = st.session_state
+    if not isinstance(ss.get("chat_history"), ConversationHistory):
+        ss.chat_history = ConversationHistory()
+        ss.messages = ss.chat_history.messages
+
+def is_admin():
+    """
+    管理者としてアクセスしているかどうかを判定
+
+    URLのクエリパラメータの値が、secretsのADMIN_TOKENと一致する場合のみ管理者とみなす
+
+    Returns:
+        管理者の場合はTrue
+    """
+    token = st.query_params.get(ct.ADMIN_QUERY_PARAM)
+    if not token:
+        return False
+    try:
+        admin_token = st.secrets.get("ADMIN_TOKEN")
+    except FileNotFoundError:
+        return False
+    return bool(admin_token) and hmac.compare_digest(str(token), str(admin_token))
+
 def get_datetime():
     """
     現在日時を取得（日本語フォーマット統一）
@@ -267,9 +226,12 @@ def adjust_string(s):
     # OSがWindows以外の場合はそのまま返す
     return s
 
+@stage_timer("send_inquiry_to_gmail")
 def send_inquiry_to_gmail(chat_message: str) -> str:
     """
     問い合わせメッセージをGmailに転送する（多言語対応）
+
+    メールは送信キューに保存した時点で受け付け完了とし、実際の送信はバックグラウンドで行う
     
     Args:
         chat_message: ユーザーからの問い合わせメッセージ
@@ -277,6 +239,9 @@ def send_inquiry_to_gmail(chat_message: str) -> str:
     Returns:
         送信結果メッセージ
     """
+    import concurrency
+    from outbox import get_outbox
+
     try:
         # Streamlit secrets から設定を取得
         gmail_user = st.secrets.get("GMAIL_USER")
@@ -287,89 +252,114 @@ def send_inquiry_to_gmail(chat_message: str) -> str:
         if not all([gmail_user, gmail_password, to_email]):
             return ct.get_text('GMAIL_SETTINGS_ERROR_MESSAGE')
         
-        # 現在の言語を取得
+        # 現在の言語と受信日時を取得（受信日時は件名と本文で共通）
         current_lang = getattr(st.session_state, 'language', 'ja')
+        received_at = get_datetime()
+        outbox = get_outbox()
         
-        # メールの作成
-        msg = MIMEMultipart()
-        msg['From'] = gmail_user
-        msg['To'] = to_email
-        msg['Subject'] = f"{ct.get_text('CONTACT_FORWARDING_SUBJECT')} - {get_datetime()}"
-        
-        # メール本文の作成（言語に応じて処理）
         if current_lang == 'en':
             # 英語選択時：英語と日本語の両方でメール内容を作成
-            body = ct.get_text('EMAIL_FORMAT_TEMPLATE').format(
-                chat_message=chat_message,
-                translated_message=translate_to_japanese(chat_message),
-                datetime=get_datetime(),
+            # 翻訳の完了を待たずに受け付け、翻訳失敗時と同じ本文で保留しておく。
+            # 翻訳器の準備と翻訳はバックグラウンドで行い、終わったら本文を差し替えて送信する
+            outbox_id = outbox.enqueue(
+                gmail_user,
+                [to_email],
+                compose_inquiry_mail(gmail_user, to_email, chat_message, received_at, current_lang, translation_fallback(chat_message)),
+                hold=True
             )
+            concurrency.submit(translate_and_release_inquiry(
+                outbox, outbox_id, gmail_user, to_email, chat_message, received_at, current_lang, st.session_state.get("session_id")
+            ))
         else:
             # 日本語選択時：従来通り日本語のみ
-            body = ct.get_text('EMAIL_FORMAT_TEMPLATE').format(
-                chat_message=chat_message,
-                datetime=get_datetime()
+            # 送信キューに保存（SMTPサーバーへの送信・再送はバックグラウンドのワーカーが行う）
+            outbox_id = outbox.enqueue(
+                gmail_user,
+                [to_email],
+                compose_inquiry_mail(gmail_user, to_email, chat_message, received_at, current_lang)
             )
-        
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Gmail SMTPサーバーに接続して送信
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()  # TLS暗号化を有効化
-        server.login(gmail_user, gmail_password)
-        text = msg.as_string()
-        server.sendmail(gmail_user, to_email, text)
-        server.quit()
+        logging.getLogger(ct.LOGGER_NAME).info({"message": "inquiry mail queued", "outbox_id": outbox_id})
         
         return ct.get_text('CONTACT_THANKS_MESSAGE')
         
     except Exception as e:
         # エラーが発生した場合のログ出力
-        error_msg = f"{ct.get_text('GMAIL_SENDING_ERROR_MESSAGE')}: {str(e)}"
-        print(error_msg)  # 開発用
+        logging.getLogger(ct.LOGGER_NAME).exception(ct.get_text('GMAIL_SENDING_ERROR_MESSAGE'), exc_info=e)
         return ct.get_text('GMAIL_SENDING_ERROR_DETAIL_MESSAGE')
 
-def rebuild_rag_chain_for_current_language():
+def compose_inquiry_mail(sender, to_email, chat_message, received_at, language, translated_message=None):
     """
-    現在の言語に応じてRAGチェーンを再構築
+    問い合わせ転送メールを作成
+
+    バックグラウンドのスレッドからも呼び出すため、言語はセッション状態から取得せず引数で受け取る
+
+    Args:
+        sender: 送信元のメールアドレス
+        to_email: 宛先のメールアドレス
+        chat_message: ユーザーからの問い合わせメッセージ
+        received_at: 受信日時
+        language: 問い合わせ時の言語コード
+        translated_message: 日本語に翻訳した問い合わせメッセージ（英語の場合のみ）
+
+    Returns:
+        文字列化したメール
     """
-    if "rag_chain" in st.session_state:
-        st.session_state.rag_chain = create_rag_chain(ct.DB_ALL_PATH)
+    # メールの作成は問い合わせモードでのみ必要なため、初回使用時に読み込む
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = f"{ct.get_text('CONTACT_FORWARDING_SUBJECT', language)} - {received_at}"
+    body = ct.get_text('EMAIL_FORMAT_TEMPLATE', language).render(
+        chat_message=chat_message,
+        translated_message=translated_message,
+        datetime=received_at,
+    )
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    return msg.as_string()
 
-def translate_to_japanese(text: str) -> str:
+async def translate_and_release_inquiry(outbox, outbox_id, sender, to_email, chat_message, received_at, language, session_id=None):
     """
-    英語のテキストを日本語に翻訳する
-    
+    問い合わせを翻訳し、保留中の転送メールの本文を翻訳結果で差し替えて送信待ちにする
+
+    翻訳器の作成（初回のみ）もここで行い、翻訳済みの内容はキャッシュから返す。
+    翻訳器の作成・翻訳に失敗した場合は、保留時の本文（原文のみ）のまま送信する
+
     Args:
-        text: 翻訳対象の英語テキスト
-        
-    Returns:
-        日本語に翻訳されたテキスト
+        outbox: 送信キュー
+        outbox_id: 保留中の転送メールのID
+        sender: 送信元のメールアドレス
+        to_email: 宛先のメールアドレス
+        chat_message: ユーザーからの問い合わせメッセージ
+        received_at: 受信日時
+        language: 問い合わせ時の言語コード
+        session_id: LLMの同時実行数の制限で順番待ちする単位
     """
+    from translation import get_translator
+
+    message = None
     try:
-        from langchain.prompts import PromptTemplate
-        from langchain.chains import LLMChain
-        
-        # 翻訳用のプロンプトテンプレート
-        translation_template = ct.get_text('TRANSLATION_TEMPLATE')
-        
-        translation_prompt = PromptTemplate(
-            input_variables=["english_text"],
-            template=translation_template
-        )
-        
-        # LLMチェーンを作成して翻訳実行
-        translation_chain = LLMChain(
-            llm=st.session_state.llm,
-            prompt=translation_prompt
-        )
-        
-        result = translation_chain.run(english_text=text)
-        return result.strip()
-        
+        # 翻訳器の初回作成でイベントループを止めないよう、別スレッドで取得する
+        translator = await asyncio.to_thread(get_translator)
+        translated_message = translator.get_cached(chat_message)
+        if translated_message is None:
+            translated_message = await translator.atranslate(chat_message, session_id)
+        message = compose_inquiry_mail(sender, to_email, chat_message, received_at, language, translated_message)
     except Exception as e:
-        # 翻訳に失敗した場合は元のテキストを返す
-        print(f"Translation error: {str(e)}")
-        return f"[翻訳失敗] {text}"
+        logging.getLogger(ct.LOGGER_NAME).exception("Translation error", exc_info=e)
+    finally:
+        await asyncio.to_thread(outbox.release, outbox_id, message)
 
+def translation_fallback(text):
+    """
+    翻訳に失敗した場合に、翻訳結果の代わりに使うテキストを取得
 
+    Args:
+        text: 翻訳対象の英語テキスト
+
+    Returns:
+        原文に翻訳失敗の印を付けたテキスト
+    """
+    return f"[翻訳失敗] {text}"
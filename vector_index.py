@@ -0,0 +1,180 @@
+"""
+このファイルは、小規模なコーパス向けに、Chromaを介さずNumPyでベクトル検索を行うインデックスが記述されたファイルです。
+Chromaに保存済みの埋め込みベクトルをfloat32の行列としてDBフォルダに書き出し、メモリマップで読み込んで全件を一括で比較します。
+関連度はChroma（距離はl2）と同じ式で求めるため、関連度の閾値は検索方式によらず共通で使えます。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import math
+import numpy as np
+from langchain_core.documents import Document
+import constants as ct
+
+
+############################################################
+# クラス定義
+############################################################
+
+class NumpyVectorIndex:
+    """
+    メモリマップしたfloat32の埋め込み行列を、NumPyで全件比較して検索するベクトルインデックス
+
+    HybridRetrieverからはChromaのベクターストアと同じメソッドで呼び出す
+    """
+
+    def __init__(self, version, ids, texts, metadatas, vectors, embeddings=None):
+        """
+        Args:
+            version: 作成元インデックスのバージョン
+            ids: チャンクIDのリスト
+            texts: チャンク本文のリスト
+            metadatas: チャンクのメタデータのリスト
+            vectors: チャンクの埋め込みベクトルの行列（float32、行がチャンク）
+            embeddings: 検索文の埋め込みに使う埋め込みモデル
+        """
+        self.version = version
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.embeddings = embeddings
+        # 距離の計算に使う各行の二乗ノルムは、読み込み時に1度だけ求めておく
+        self.squared_norms = np.einsum("ij,ij->i", vectors, vectors) if len(ids) else np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path, embeddings=None):
+        """
+        保存済みのインデックスを読み込み（埋め込み行列はメモリマップで読み込む）
+
+        Args:
+            path: 保存先のファイルパス（拡張子なし。.json と .npy を読み込む）
+            embeddings: 検索文の埋め込みに使う埋め込みモデル
+
+        Returns:
+            NumpyVectorIndexのインスタンス
+        """
+        with open(f"{path}.json", encoding="utf8") as f:
+            data = json.load(f)
+        # 空の配列はメモリマップできないため、チャンクが無い場合のみ通常の読み込みとする
+        vectors = np.load(f"{path}.npy", mmap_mode="r" if data["ids"] else None)
+        return cls(data["version"], data["ids"], data["texts"], data["metadatas"], vectors, embeddings)
+
+    def save(self, path):
+        """
+        インデックスを保存（一時ファイルに書き込んでから置き換える）
+
+        埋め込み行列を先に置き換え、バージョンを含む .json を最後に置き換える
+
+        Args:
+            path: 保存先のファイルパス（拡張子なし。.json と .npy に保存する）
+        """
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(tmp_path, f"{path}.npy")
+
+        tmp_path = f"{path}.json.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, f"{path}.json")
+
+    def similarity_search_with_relevance_scores(self, query, k=ct.TOP_K):
+        """
+        検索文の埋め込みベクトルで検索
+
+        Args:
+            query: 検索文
+            k: 取得件数
+
+        Returns:
+            （Document, 関連度）のリスト（関連度の降順）
+        """
+        return self.similarity_search_by_vector_with_relevance_scores(self.embeddings.embed_query(query), k)
+
+    def similarity_search_by_vector_with_relevance_scores(self, vector, k=ct.TOP_K):
+        """
+        埋め込みベクトルで検索
+
+        Args:
+            vector: 検索に使う埋め込みベクトル
+            k: 取得件数
+
+        Returns:
+            （Document, 関連度）のリスト（関連度の降順）
+        """
+        if not self.ids:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        # Chromaのl2距離（二乗ユークリッド距離）を、行列とベクトルの積1回で全件分求める
+        distances = self.squared_norms - 2 * (self.vectors @ query) + float(query @ query)
+        k = min(k, len(self.ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(self.get_document(int(i)), _relevance_score(float(distances[i]))) for i in top]
+
+    def get_document(self, doc_index):
+        """
+        チャンク番号に対応するドキュメントを取得
+
+        Args:
+            doc_index: チャンク番号
+
+        Returns:
+            Document
+        """
+        return Document(
+            id=self.ids[doc_index],
+            page_content=self.texts[doc_index],
+            metadata=dict(self.metadatas[doc_index] or {}),
+        )
+
+
+############################################################
+# 関数定義
+############################################################
+
+def _relevance_score(distance):
+    """
+    l2距離を関連度に変換（langchain_chromaの既定と同じ式）
+    """
+    return 1.0 - distance / math.sqrt(2)
+
+def load_or_build_vector_index(db, db_name, version, embeddings):
+    """
+    保存済みのベクトルインデックスを読み込み、インデックスのバージョンが異なる場合のみ作り直す
+
+    Args:
+        db: Chromaのベクターストア（埋め込みベクトルの取得元）
+        db_name: データベース名（ベクトルインデックスの保存先）
+        version: 現在のインデックスのバージョン
+        embeddings: 検索文の埋め込みに使う埋め込みモデル
+
+    Returns:
+        NumpyVectorIndexのインスタンス
+    """
+    path = os.path.join(db_name, ct.VECTOR_INDEX_FILE)
+    if os.path.isfile(f"{path}.json") and os.path.isfile(f"{path}.npy"):
+        index = NumpyVectorIndex.load(path, embeddings)
+        if index.version == version and len(index.ids) == len(index.vectors):
+            return index
+
+    data = db.get(include=["documents", "metadatas", "embeddings"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if not len(data["ids"]):
+        vectors = vectors.reshape(0, 0)
+    os.makedirs(db_name, exist_ok=True)
+    NumpyVectorIndex(version, data["ids"], data["documents"], data["metadatas"], vectors).save(path)
+    # 作成直後も、保存したファイルをメモリマップで読み込んで使う
+    return NumpyVectorIndex.load(path, embeddings)